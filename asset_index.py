@@ -0,0 +1,183 @@
+"""Persistent SQLite index of tagged assets for recipe asset selection.
+
+Tagged asset rows are loaded once per source (the tagged-assets sheet ID or
+local table path) and indexed on audience, product, angle and descriptors.
+:meth:`AssetIndex.query` then returns the best-matching assets for a recipe's
+audience/angle without reloading the sheet.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    loaded_at REAL NOT NULL,
+    asset_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    source TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    audience TEXT NOT NULL,
+    product TEXT NOT NULL,
+    angle TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, row_id)
+);
+CREATE INDEX IF NOT EXISTS assets_audience ON assets (source, audience, angle);
+CREATE INDEX IF NOT EXISTS assets_angle ON assets (source, angle);
+CREATE INDEX IF NOT EXISTS assets_product ON assets (source, product);
+CREATE TABLE IF NOT EXISTS descriptors (
+    source TEXT NOT NULL,
+    descriptor TEXT NOT NULL,
+    row_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS descriptors_lookup ON descriptors (source, descriptor, row_id);
+"""
+
+# Legacy tagged-asset sheets use the "Matched ..." headers; run_tagger output
+# uses the short ones.
+_FIELD_COLUMNS = {
+    'audience': ('Matched Audience', 'Audience'),
+    'product': ('Matched Product', 'Product'),
+    'angle': ('Matched Angle', 'Angle'),
+}
+
+
+def asset_field(record, field):
+    """Return a tagged asset's ``audience``, ``product`` or ``angle``.
+
+    Reads the legacy ``Matched ...`` header first, then the ``run_tagger``
+    one; returns ``''`` when neither is set.
+    """
+
+    for column in _FIELD_COLUMNS[field]:
+        value = record.get(column)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def _field(record, field):
+    return asset_field(record, field).lower()
+
+
+def _normalize(values):
+    return [str(v).strip().lower() for v in values or [] if str(v).strip()]
+
+
+class AssetIndex:
+    """SQLite-backed tagged asset index.
+
+    Parameters
+    ----------
+    path : str
+        Database file; ``":memory:"`` for a throwaway index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        # The connection is shared by threads in generate_recipes_batch.
+        self._lock = threading.RLock()
+
+    def close(self):
+        self._conn.close()
+
+    def has_source(self, source):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM sources WHERE source = ?", (source,)).fetchone()
+        return row is not None
+
+    def load(self, source, records):
+        """Replace the indexed assets for ``source`` with ``records``.
+
+        Parameters
+        ----------
+        source : str
+            Key identifying where the records came from.
+        records : list[dict]
+            Tagged asset rows, e.g. ``asset_df.to_dict(orient='records')``.
+        """
+
+        assets = []
+        descriptors = []
+        for row_id, record in enumerate(records):
+            assets.append((
+                source,
+                row_id,
+                _field(record, 'audience'),
+                _field(record, 'product'),
+                _field(record, 'angle'),
+                json.dumps(record),
+            ))
+            for descriptor in _normalize(str(record.get('Descriptors', '')).split(',')):
+                descriptors.append((source, descriptor, row_id))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for table in ('sources', 'assets', 'descriptors'):
+                    self._conn.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+                self._conn.executemany("INSERT INTO assets VALUES (?, ?, ?, ?, ?, ?)", assets)
+                self._conn.executemany("INSERT INTO descriptors VALUES (?, ?, ?)", descriptors)
+                self._conn.execute(
+                    "INSERT INTO sources VALUES (?, ?, ?)", (source, time.time(), len(assets))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def query(self, source, count, *, audiences=None, angles=None, products=None, descriptors=None):
+        """Return up to ``count`` assets, best matches first.
+
+        Assets whose audience is ``unknown`` are never returned. Candidates
+        matching every given criterion are preferred; criteria are then
+        relaxed from the end (descriptors, products, angles, audiences) until
+        enough assets are found. Ties are broken randomly.
+
+        Returns
+        -------
+        list[dict]
+            The original asset records.
+        """
+
+        criteria = [
+            ('audience IN ({})', _normalize(audiences)),
+            ('angle IN ({})', _normalize(angles)),
+            ('product IN ({})', _normalize(products)),
+            (
+                'row_id IN (SELECT row_id FROM descriptors WHERE source = ? AND descriptor IN ({}))',
+                _normalize(descriptors),
+            ),
+        ]
+        criteria = [(clause, values) for clause, values in criteria if values]
+
+        chosen = []
+        seen = set()
+        for keep in range(len(criteria), -1, -1):
+            where = ["source = ?", "audience != 'unknown'"]
+            params = [source]
+            for clause, values in criteria[:keep]:
+                where.append(clause.format(', '.join('?' * len(values))))
+                if clause.startswith('row_id'):
+                    params.append(source)
+                params.extend(values)
+            if seen:
+                where.append(f"row_id NOT IN ({', '.join('?' * len(seen))})")
+                params.extend(seen)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT row_id, data FROM assets WHERE {' AND '.join(where)} ORDER BY RANDOM() LIMIT ?",
+                    params + [count - len(chosen)],
+                ).fetchall()
+            for row_id, data in rows:
+                seen.add(row_id)
+                chosen.append(json.loads(data))
+            if len(chosen) >= count:
+                break
+        return chosen
@@ -0,0 +1,142 @@
+"""Offline OpenAI Batch API runs for large classification and copy jobs.
+
+Chat completion requests are serialized to a JSONL file, uploaded and
+submitted as a batch, polled until the batch finishes, and the results are
+returned keyed by each request's ``custom_id`` so callers can merge them back
+into their rows. Batches trade latency (up to 24 hours) for throughput and a
+separate, larger quota.
+
+The client's ``base_url`` (or the ``OPENAI_BASE_URL`` environment variable)
+can point at a local stand-in server to exercise submit/poll without
+touching the real API.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+import openai
+
+ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchError(RuntimeError):
+    """Raised when a batch ends in a status other than ``completed``."""
+
+
+def make_client(base_url=None):
+    """Create an OpenAI client, optionally against a stand-in server."""
+
+    return openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), base_url=base_url)
+
+
+def write_batch_file(path, requests):
+    """Write ``(custom_id, body)`` pairs as Batch API input lines.
+
+    Returns
+    -------
+    int
+        Number of requests written.
+    """
+
+    count = 0
+    with open(path, "w", encoding="utf-8") as fh:
+        for custom_id, body in requests:
+            fh.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": ENDPOINT,
+                "body": body,
+            }, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def submit_batch(client, path, metadata=None):
+    """Upload a batch input file and create the batch. Returns the batch ID."""
+
+    with open(path, "rb") as fh:
+        uploaded = client.files.create(file=fh, purpose="batch")
+    kwargs = {"metadata": metadata} if metadata else {}
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=ENDPOINT,
+        completion_window="24h",
+        **kwargs,
+    )
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=30.0, timeout=None):
+    """Poll until the batch reaches a terminal status and return it."""
+
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if deadline and time.monotonic() > deadline:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout}s")
+        time.sleep(poll_interval)
+
+
+def read_batch_results(client, batch):
+    """Return ``{custom_id: message content or Exception}`` for a finished batch."""
+
+    if batch.status != "completed":
+        raise BatchError(f"Batch {batch.id} ended with status {batch.status}")
+
+    results = {}
+    for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code", 200) != 200:
+                results[item["custom_id"]] = BatchError(str(item.get("error") or response.get("body")))
+                continue
+            results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return results
+
+
+def run_batch(requests, client=None, path=None, poll_interval=30.0, timeout=None, metadata=None):
+    """Serialize, submit and wait for a batch of chat completion requests.
+
+    Parameters
+    ----------
+    requests : list[tuple[str, dict]]
+        ``(custom_id, body)`` pairs; ``body`` holds the arguments normally
+        passed to ``client.chat.completions.create``.
+    client : openai.OpenAI | None, optional
+        Defaults to :func:`make_client`.
+    path : str | None, optional
+        Where to keep the JSONL input file. A temporary file is used when
+        omitted.
+    poll_interval : float, optional
+        Seconds between status checks.
+    timeout : float | None, optional
+        Give up waiting after this many seconds.
+
+    Returns
+    -------
+    dict
+        ``custom_id`` mapped to the reply text, or to an exception for
+        requests that failed. Requests missing from the output are absent.
+    """
+
+    if not requests:
+        return {}
+    client = client or make_client()
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="tak_batch_", suffix=".jsonl")
+        os.close(fd)
+    write_batch_file(path, requests)
+    batch_id = submit_batch(client, path, metadata)
+    print(f"Submitted batch {batch_id} with {len(requests)} request(s) from {path}")
+    batch = wait_for_batch(client, batch_id, poll_interval, timeout)
+    return read_batch_results(client, batch)
@@ -0,0 +1,247 @@
+"""Record and replay external API calls.
+
+While a cassette is recording, every Drive, Vision, Sheets and OpenAI call
+made through :func:`recorded` is executed and its result (or error) and
+duration are appended to a JSONL file. A replaying cassette serves those
+results back without touching the network, optionally sleeping for the
+recorded latency, so a production run can be reproduced offline and
+pipeline changes compared against the same inputs.
+
+Calls are matched by operation name and a hash of their request. When a
+request is not in the cassette (for example after a prompt change), replay
+falls back to the next unused recording of the same operation unless the
+cassette is ``strict``. The global ``random`` and ``numpy`` generators are
+seeded from the cassette so sampled recipe components repeat as well.
+"""
+
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+MODES = ('record', 'replay')
+
+
+class CassetteMiss(KeyError):
+    """Raised on replay when no recording matches a call."""
+
+
+class ReplayedError(RuntimeError):
+    """A recorded call failed; replay raises the same message."""
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'__bytes__': base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {'__bytes__'}:
+            return base64.b64decode(value['__bytes__'])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def request_key(request):
+    """Return a stable hash of a JSON-serializable request description."""
+
+    data = json.dumps(_encode(request), sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """One recording file.
+
+    Parameters
+    ----------
+    path : str
+        JSONL cassette file. Recording truncates it.
+    mode : str
+        ``"record"`` or ``"replay"``.
+    replay_latency : bool, optional
+        On replay, sleep for each call's recorded duration.
+    strict : bool, optional
+        On replay, raise :class:`CassetteMiss` instead of falling back to
+        the next recording of the same operation.
+    """
+
+    def __init__(self, path, mode='replay', replay_latency=False, strict=False):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.strict = strict
+        self.calls = 0
+        self._lock = threading.Lock()
+        if mode == 'record':
+            self.seed = random.randrange(2 ** 32)
+            self._fh = open(path, 'w', encoding='utf-8')
+            self._append({'cassette': 1, 'seed': self.seed})
+        else:
+            self._fh = None
+            self._by_key = {}
+            self._by_op = {}
+            self._used = set()
+            self.seed = None
+            with open(path, encoding='utf-8') as fh:
+                for index, line in enumerate(fh):
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if 'cassette' in entry:
+                        self.seed = entry.get('seed')
+                        continue
+                    entry['index'] = index
+                    self._by_key.setdefault((entry['op'], entry['key']), deque()).append(entry)
+                    self._by_op.setdefault(entry['op'], deque()).append(entry)
+
+    def _append(self, entry):
+        with self._lock:
+            self._fh.write(json.dumps(entry) + '\n')
+            self._fh.flush()
+
+    def _take(self, op, key):
+        with self._lock:
+            self.calls += 1
+            matches = self._by_key.get((op, key))
+            if matches:
+                # Consume matches in order, repeating the last one if the
+                # same request is made more often than it was recorded.
+                while len(matches) > 1 and matches[0]['index'] in self._used:
+                    matches.popleft()
+                entry = matches[0]
+                self._used.add(entry['index'])
+                return entry
+            if not self.strict:
+                pending = self._by_op.get(op, deque())
+                while pending and pending[0]['index'] in self._used:
+                    pending.popleft()
+                if pending:
+                    entry = pending.popleft()
+                    self._used.add(entry['index'])
+                    return entry
+        raise CassetteMiss(f"no recording for {op} {key}")
+
+    def call(self, op, key, fn):
+        """Run (record) or replay ``fn()`` for the request identified by ``key``."""
+
+        if self.mode == 'replay':
+            entry = self._take(op, key)
+            if self.replay_latency:
+                time.sleep(entry['seconds'])
+            if 'error' in entry:
+                raise ReplayedError(entry['error'])
+            return _decode(entry['result'])
+
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            self._append({'op': op, 'key': key, 'seconds': time.monotonic() - start, 'error': str(e)})
+            raise
+        self._append({
+            'op': op,
+            'key': key,
+            'seconds': time.monotonic() - start,
+            'result': _encode(result),
+        })
+        return result
+
+    def stream(self, op, key, fn):
+        """Like :meth:`call` for a generator; the fragments are recorded."""
+
+        if self.mode == 'replay':
+            entry = self._take(op, key)
+            chunks = _decode(entry.get('result', []))
+            for chunk in chunks:
+                if self.replay_latency:
+                    time.sleep(entry['seconds'] / max(len(chunks), 1))
+                yield chunk
+            if 'error' in entry:
+                raise ReplayedError(entry['error'])
+            return
+
+        start = time.monotonic()
+        chunks = []
+        try:
+            for chunk in fn():
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            self._append({
+                'op': op,
+                'key': key,
+                'seconds': time.monotonic() - start,
+                'result': _encode(chunks),
+                'error': str(e),
+            })
+            raise
+        self._append({'op': op, 'key': key, 'seconds': time.monotonic() - start, 'result': _encode(chunks)})
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+# The cassette used by recorded(); see use_cassette.
+active = None
+
+
+def use_cassette(path, mode='replay', replay_latency=False, strict=False):
+    """Route all :func:`recorded` calls through a cassette at ``path``.
+
+    Seeds ``random`` and ``numpy.random`` with the cassette's seed so
+    randomly sampled recipe components match between record and replay.
+    """
+
+    global active
+    stop_cassette()
+    active = Cassette(path, mode, replay_latency, strict)
+    if active.seed is not None:
+        random.seed(active.seed)
+        np.random.seed(active.seed)
+    return active
+
+
+def stop_cassette():
+    global active
+    if active is not None:
+        active.close()
+    active = None
+
+
+def recorded(op, request, fn):
+    """Return ``fn()``, recording or replaying it when a cassette is active.
+
+    ``request`` describes the call (anything JSON-serializable) and is
+    hashed to match recordings on replay.
+    """
+
+    cassette = active
+    if cassette is None:
+        return fn()
+    return cassette.call(op, request_key(request), fn)
+
+
+def recorded_stream(op, request, fn):
+    """Generator version of :func:`recorded` for streamed responses."""
+
+    cassette = active
+    if cassette is None:
+        return fn()
+    return cassette.stream(op, request_key(request), fn)
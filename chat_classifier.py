@@ -3,26 +3,55 @@ import openai
 import os
 import json
 
+from cassette import recorded
+from content_matcher import match_content
+from hedging import guarded, timeout_kwargs
+from prompt_budget import compact_labels, count_tokens, fit_to_budget
+from tracing import span
+
 client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
-def chat_classify(
-    labels: list[str],
-    web_labels: list[str],
-    expected_content=None,
-) -> dict:
-    """Classify image tags using ChatGPT.
+DEFAULT_MODEL = "gpt-3.5-turbo"
 
-    Parameters
-    ----------
-    labels : list[str]
-        Generic labels returned from Vision API.
-    web_labels : list[str]
-        Web entity labels returned from Vision API.
-    expected_content : list[str] | None, optional
-        Additional content tags to consider for matching. Defaults to ``[]``.
-    """
+# How ``match_content`` is filled:
+#   "local"      - content_matcher only; expected tags never reach the prompt
+#   "llm"        - the model picks the tag (original behaviour)
+#   "local+llm"  - content_matcher, asking the model only when it finds nothing
+MATCH_MODES = ("local", "llm", "local+llm")
+DEFAULT_MATCH_MODE = "local"
 
-    expected_content = expected_content or []
+UNKNOWN_CLASSIFICATION = {
+    "audience": "unknown",
+    "product": "unknown",
+    "angle": "unknown",
+    "descriptors": [],
+    "match_content": "unknown",
+}
+
+# Prompt compaction: labels kept per list (in Vision score order) and the
+# token budget for the whole classification prompt.
+MAX_LABELS = 15
+MAX_WEB_LABELS = 10
+PROMPT_TOKEN_BUDGET = 400
+
+def _classify_prompt(labels, web_labels, expected_content, include_match, include_confidence=False):
+    match_instructions = ""
+    match_field = ""
+    confidence_instructions = ""
+    confidence_field = ""
+    if include_confidence:
+        confidence_instructions = (
+            '- "confidence": a number from 0 to 1 for how clearly the image data supports '
+            "the audience, product and angle\n"
+        )
+        confidence_field = ',\n  "confidence": 0.0'
+    if include_match:
+        match_instructions = (
+            "\nUse the following expected content tags to set ``match_content`` to the "
+            "closest tag or ``unknown`` if nothing is relevant:\n"
+            f"{', '.join(expected_content)}\n"
+        )
+        match_field = ',\n  "match_content": "..."'
     prompt = f"""
 You are an ad tagging assistant. Based on the following image data:
 
@@ -37,44 +66,201 @@ Return a JSON object with:
 - "product": name the product shown, and keep it specific if a brand is mentioned
 - "angle": the emotional or marketing angle (e.g., natural beauty, wellness, performance)
 - "descriptors": a short list of helpful visual or thematic descriptors (e.g., outdoors, close-up, vibrant colors)
-
-Use the following expected content tags to set ``match_content`` to the closest tag or ``unknown`` if nothing is relevant:
-{', '.join(expected_content)}
-
+{confidence_instructions}{match_instructions}
 Return:
 {{
   "audience": "...",
   "product": "...",
   "angle": "...",
-  "descriptors": ["...", "..."],
-  "match_content": "..."
+  "descriptors": ["...", "..."]{match_field}{confidence_field}
 }}
 """
+    return prompt.strip()
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful and structured tag classification assistant.",
-                },
-                {"role": "user", "content": prompt.strip()},
-            ],
-            temperature=0.4,
-            response_format={"type": "json_object"},
+def build_classify_request(
+    labels: list[str],
+    web_labels: list[str],
+    expected_content=None,
+    include_match=True,
+    compact=True,
+    metrics=None,
+    model=DEFAULT_MODEL,
+    include_confidence=False,
+) -> dict:
+    """Return the chat completion arguments used by :func:`chat_classify`.
+
+    The result can be passed to ``client.chat.completions.create`` or used as
+    the ``body`` of a Batch API request. With ``include_match=False`` the
+    expected content tags and ``match_content`` field are left out of the
+    prompt.
+
+    With ``compact`` (the default) labels are de-duplicated, normalized and
+    capped at :data:`MAX_LABELS` / :data:`MAX_WEB_LABELS`, then trimmed until
+    the prompt fits :data:`PROMPT_TOKEN_BUDGET` (see :mod:`prompt_budget`).
+    ``metrics`` receives ``prompt_tokens`` and ``prompt_tokens_saved``
+    counters.
+
+    ``include_confidence`` asks the model for a 0-1 ``confidence`` score,
+    used by :mod:`model_router` to decide whether to escalate.
+    """
+
+    expected_content = expected_content or []
+    if compact:
+        expected = compact_labels(expected_content)
+
+        def render(kept_labels, kept_web_labels):
+            return _classify_prompt(
+                kept_labels, kept_web_labels, expected, include_match, include_confidence
+            )
+
+        seen = set()
+        kept_labels = compact_labels(labels, MAX_LABELS, seen)
+        kept_web_labels = compact_labels(web_labels, MAX_WEB_LABELS, seen)
+        kept_labels, kept_web_labels, tokens = fit_to_budget(
+            kept_labels, kept_web_labels, render, PROMPT_TOKEN_BUDGET, model
+        )
+        prompt = render(kept_labels, kept_web_labels)
+        if metrics is not None:
+            raw = _classify_prompt(
+                labels, web_labels, expected_content, include_match, include_confidence
+            )
+            metrics.incr('prompt_tokens', tokens)
+            metrics.incr('prompt_tokens_saved', count_tokens(raw, model) - tokens)
+    else:
+        prompt = _classify_prompt(
+            labels, web_labels, expected_content, include_match, include_confidence
         )
-        content = response.choices[0].message.content
-        data = json.loads(content)
-        # Older prompts may omit the optional match_content field
-        data.setdefault("match_content", "unknown")
-        return data
+        if metrics is not None:
+            metrics.incr('prompt_tokens', count_tokens(prompt, model))
+
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful and structured tag classification assistant.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.4,
+        "response_format": {"type": "json_object"},
+    }
+
+def parse_classification(content: str) -> dict:
+    """Parse the model's JSON reply into a classification dict."""
+
+    data = json.loads(content)
+    # Older prompts may omit the optional match_content field
+    data.setdefault("match_content", "unknown")
+    return data
+
+def resolve_match(labels, web_labels, expected_content=None, match_mode=DEFAULT_MATCH_MODE):
+    """Decide ``match_content`` locally where ``match_mode`` allows.
+
+    Returns
+    -------
+    tuple[str | None, bool]
+        The local match (``None`` when the model should decide) and whether
+        the prompt needs the expected content tags.
+    """
+
+    if match_mode not in MATCH_MODES:
+        raise ValueError(f"match_mode must be one of {', '.join(MATCH_MODES)}")
+    if match_mode == "llm":
+        return None, True
+    local = match_content(labels, web_labels, expected_content or [])
+    if match_mode == "local+llm" and local == "unknown" and expected_content:
+        return None, True
+    return local, False
+
+def classification_from_reply(reply) -> dict:
+    """Build a classification from a Batch API reply.
+
+    ``reply`` is the message content, or an exception / ``None`` when the
+    request failed or is missing from the batch output.
+    """
+
+    if isinstance(reply, str):
+        try:
+            return parse_classification(reply)
+        except Exception as e:
+            reply = e
+    print("ChatGPT classification error:", reply or "missing from batch output")
+    return {**UNKNOWN_CLASSIFICATION, "descriptors": []}
+
+def _record_call(metrics, request, content):
+    """Count a classify call and its prompt and completion tokens per model."""
+
+    model = request["model"]
+    metrics.incr(f'chat_calls[{model}]')
+    metrics.incr(
+        f'chat_prompt_tokens[{model}]',
+        sum(count_tokens(m["content"], model) for m in request["messages"]),
+    )
+    metrics.incr(f'chat_completion_tokens[{model}]', count_tokens(content, model))
+
+def chat_classify(
+    labels: list[str],
+    web_labels: list[str],
+    expected_content=None,
+    match_mode=DEFAULT_MATCH_MODE,
+    metrics=None,
+    model=DEFAULT_MODEL,
+    include_confidence=False,
+) -> dict:
+    """Classify image tags using ChatGPT.
+
+    Parameters
+    ----------
+    labels : list[str]
+        Generic labels returned from Vision API.
+    web_labels : list[str]
+        Web entity labels returned from Vision API.
+    expected_content : list[str] | None, optional
+        Additional content tags to consider for matching. Defaults to ``[]``.
+    match_mode : str, optional
+        One of :data:`MATCH_MODES`. The default fills ``match_content`` with
+        :func:`content_matcher.match_content` and keeps the expected tags out
+        of the prompt.
+    metrics : metrics.RunMetrics | None, optional
+        Receives prompt token counters, plus ``chat_calls[<model>]``,
+        ``chat_prompt_tokens[<model>]`` and ``chat_completion_tokens[<model>]``
+        for each answered call.
+    model : str, optional
+        Chat model to use.
+    include_confidence : bool, optional
+        Ask the model for a ``confidence`` score in the result.
+    """
+
+    local_match, include_match = resolve_match(labels, web_labels, expected_content, match_mode)
+    request = build_classify_request(
+        labels,
+        web_labels,
+        expected_content,
+        include_match,
+        metrics=metrics,
+        model=model,
+        include_confidence=include_confidence,
+    )
+    try:
+        with span('chat_classify', match_mode=match_mode, model=model):
+            content = guarded(
+                'classify',
+                lambda: recorded(
+                    'openai.chat.completions',
+                    request,
+                    lambda: client.chat.completions.create(
+                        **request, **timeout_kwargs('classify')
+                    ).choices[0].message.content,
+                ),
+                metrics,
+            )
+        if metrics is not None:
+            _record_call(metrics, request, content)
+        data = parse_classification(content)
     except Exception as e:
         print("ChatGPT classification error:", e)
-        return {
-            "audience": "unknown",
-            "product": "unknown",
-            "angle": "unknown",
-            "descriptors": [],
-            "match_content": "unknown",
-        }
+        data = {**UNKNOWN_CLASSIFICATION, "descriptors": []}
+    if local_match is not None:
+        data["match_content"] = local_match
+    return data
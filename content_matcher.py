@@ -0,0 +1,91 @@
+"""Local matching of Vision tags against expected content tags.
+
+Each expected tag and each Vision label / web entity is turned into a TF-IDF
+vector over word tokens and character trigrams (so ``shoe`` matches
+``Running shoes``). Whole words are weighted :data:`WORD_WEIGHT` times a
+trigram, so a shared substring alone (``Hand`` / ``handbag``) stays well
+below ``threshold``. Cosine similarity is computed with one matrix product
+and the best-scoring expected tag wins if it clears ``threshold``;
+otherwise the match is ``unknown``. No API calls or tokens are used, and
+synonyms with no words in common (``Sneakers`` / ``shoes``) are not
+matched; ``local+llm`` mode leaves those to the model.
+"""
+
+import re
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.4
+# Weight of a whole-word token relative to one character trigram.
+WORD_WEIGHT = 3
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _features(text):
+    words = [w[:-1] if len(w) > 3 and w.endswith('s') else w for w in _WORD.findall(text.lower())]
+    grams = []
+    for word in words:
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return [f"w:{w}" for w in words] + [f"c:{g}" for g in grams]
+
+
+def _tfidf(docs):
+    """Return an L2-normalized TF-IDF matrix for ``docs`` (one row each)."""
+
+    tokenized = [_features(doc) for doc in docs]
+    vocab = {}
+    for tokens in tokenized:
+        for token in tokens:
+            vocab.setdefault(token, len(vocab))
+    matrix = np.zeros((len(docs), max(len(vocab), 1)))
+    for row, tokens in enumerate(tokenized):
+        for token in tokens:
+            matrix[row, vocab[token]] += WORD_WEIGHT if token.startswith('w:') else 1
+    df = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(docs)) / (1 + df)) + 1
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def score_content(labels, web_labels, expected_content):
+    """Return the best similarity of each expected tag to any image tag.
+
+    Returns
+    -------
+    numpy.ndarray
+        One score in ``[0, 1]`` per entry of ``expected_content``.
+    """
+
+    tags = [t for t in list(labels) + list(web_labels) if t and t.strip()]
+    if not expected_content or not tags:
+        return np.zeros(len(expected_content or []))
+    matrix = _tfidf(list(expected_content) + tags)
+    expected = matrix[:len(expected_content)]
+    observed = matrix[len(expected_content):]
+    return (expected @ observed.T).max(axis=1)
+
+
+def match_content(labels, web_labels, expected_content, threshold=DEFAULT_THRESHOLD):
+    """Return the expected tag closest to the image tags, or ``"unknown"``.
+
+    Parameters
+    ----------
+    labels : list[str]
+        Vision labels.
+    web_labels : list[str]
+        Vision web entities.
+    expected_content : list[str]
+        Candidate content tags.
+    threshold : float, optional
+        Minimum cosine similarity for a match.
+    """
+
+    scores = score_content(labels, web_labels, expected_content)
+    if not len(scores):
+        return "unknown"
+    best = int(np.argmax(scores))
+    return expected_content[best] if scores[best] >= threshold else "unknown"
@@ -0,0 +1,141 @@
+"""Memory-bounded image download stage.
+
+:class:`ByteBudget` caps the number of image bytes held in memory across all
+concurrent downloads; a download that would exceed the budget waits until
+earlier images are released (backpressure). :class:`BufferWriter` lets
+``MediaIoBaseDownload`` write straight into a ``bytearray`` preallocated
+from the Drive metadata size and hands that buffer to the caller, instead of
+growing a ``BytesIO`` and copying its contents out.
+:class:`SharedReservation` keeps an image's bytes reserved until calls the
+caller gave up on (at a deadline) have actually finished.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class ByteBudget:
+    """Counting semaphore over bytes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total bytes that may be reserved at once. A single request larger
+        than the budget is allowed through on its own so it cannot deadlock.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        nbytes = min(nbytes, self.max_bytes)
+        with self._cond:
+            if self.in_flight and self.in_flight + nbytes > self.max_bytes:
+                self.waits += 1
+                self._cond.wait_for(
+                    lambda: not self.in_flight or self.in_flight + nbytes <= self.max_bytes
+                )
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+        return nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.in_flight -= nbytes
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        """Hold ``nbytes`` of the budget for the duration of the block."""
+
+        held = self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(held)
+
+
+class SharedReservation:
+    """Budget bytes held by a caller and the calls it runs through :meth:`run`.
+
+    A call abandoned at its deadline keeps running on its worker thread. The
+    bytes stay reserved until :meth:`release` has been called *and* every
+    such call has finished; a call that had not started by then is skipped.
+    Usable as a context manager that releases on exit.
+    """
+
+    def __init__(self, budget, nbytes):
+        self._budget = budget
+        self._held = budget.acquire(nbytes)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._released = False
+
+    def run(self, fn):
+        """Return ``fn()``, holding the reservation while it runs."""
+
+        with self._lock:
+            if self._released:
+                return None
+            self._running += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+                last = self._released and not self._running
+            if last:
+                self._budget.release(self._held)
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+            idle = not self._running
+        if idle:
+            self._budget.release(self._held)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BufferWriter:
+    """Minimal file-like writer that fills a preallocated buffer.
+
+    The buffer grows only if the file is larger than expected.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def write(self, data):
+        end = self.pos + len(data)
+        if end > len(self.buf):
+            self.buf.extend(bytes(end - len(self.buf)))
+        self.buf[self.pos:end] = data
+        self.pos = end
+        return len(data)
+
+    def view(self):
+        """Return a zero-copy view of the bytes written so far."""
+
+        return memoryview(self.buf)[:self.pos]
+
+    def detach(self):
+        """Return the buffer trimmed to the bytes written, without copying.
+
+        The caller owns the buffer afterwards; the writer must not be used.
+        """
+
+        buf, self.buf = self.buf, None
+        del buf[self.pos:]
+        return buf
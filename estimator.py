@@ -0,0 +1,202 @@
+"""Dry-run estimates of run duration, API calls and cost.
+
+A few images (or recipes) are sent through the real pipeline with a
+:class:`metrics.RunMetrics`, and the timings and counters are scaled up to
+the full run: :func:`main_tagger.estimate_run` for tagging and
+:func:`recipe_generator.estimate_recipes` for recipes build the sample and
+call :func:`tagging_estimate` / :func:`recipe_estimate` here.
+
+Durations assume throughput scales with the number of workers, and costs
+use the list prices in :data:`PRICES` and :data:`VISION_PRICES`; update
+them if your rates differ. The sample itself makes real, billed calls.
+"""
+
+DEFAULT_SAMPLE_SIZE = 5
+
+# USD per 1M (prompt, completion) tokens.
+PRICES = {
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'gpt-4-turbo': (10.00, 30.00),
+}
+# USD per 1,000 images per Vision feature.
+VISION_PRICES = {
+    'label': 1.50,
+    'web': 3.50,
+}
+
+
+def sample_evenly(items, count):
+    """Return up to ``count`` items spread evenly across ``items``."""
+
+    items = list(items)
+    if count >= len(items):
+        return items
+    return [items[i * len(items) // count] for i in range(count)]
+
+
+def per_model(counters, name):
+    """Return ``{model: value}`` for counters named ``<name>[<model>]``."""
+
+    prefix = f"{name}["
+    return {
+        key[len(prefix):-1]: value
+        for key, value in counters.items()
+        if key.startswith(prefix) and key.endswith(']')
+    }
+
+
+def token_cost(tokens):
+    """Return the USD cost of ``{model: (prompt, completion)}`` token counts.
+
+    Models missing from :data:`PRICES` are not counted.
+    """
+
+    total = 0.0
+    for model, (prompt, completion) in tokens.items():
+        prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+        total += (prompt * prompt_price + completion * completion_price) / 1e6
+    return total
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+class Estimate:
+    """Extrapolated totals for a full run.
+
+    Parameters
+    ----------
+    kind : str
+        ``"images"`` or ``"recipes"``.
+    total, sampled : int
+        Items in the full run and in the sample.
+    seconds : float
+        Estimated wall time of the full run.
+    calls : dict[str, int]
+        Estimated API calls per operation.
+    tokens : dict[str, tuple[int, int]]
+        Estimated prompt and completion tokens per model.
+    cost : float
+        Estimated USD cost.
+    workers : int, optional
+        Concurrency the wall time assumes.
+    total_bytes : int | None, optional
+        Bytes to download, from Drive metadata.
+    """
+
+    def __init__(self, kind, total, sampled, seconds, calls, tokens, cost, workers=1, total_bytes=None):
+        self.kind = kind
+        self.total = total
+        self.sampled = sampled
+        self.seconds = seconds
+        self.calls = calls
+        self.tokens = tokens
+        self.cost = cost
+        self.workers = workers
+        self.total_bytes = total_bytes
+
+    def summary(self):
+        """Return the estimate as a plain dict."""
+
+        return {
+            'kind': self.kind,
+            'total': self.total,
+            'sampled': self.sampled,
+            'seconds': self.seconds,
+            'workers': self.workers,
+            'total_bytes': self.total_bytes,
+            'calls': dict(self.calls),
+            'tokens': {model: list(counts) for model, counts in self.tokens.items()},
+            'cost': self.cost,
+        }
+
+    def format_summary(self):
+        """Return a human-readable multi-line report."""
+
+        lines = [
+            f"Estimate for {self.total} {self.kind} (from {self.sampled} sampled): "
+            f"~{format_duration(self.seconds)} at {self.workers} worker(s)"
+        ]
+        if self.total_bytes is not None:
+            lines.append(f"Image data: {self.total_bytes / 1e6:.1f} MB")
+        for op, count in sorted(self.calls.items()):
+            lines.append(f"{op} calls: {count}")
+        for model, (prompt, completion) in sorted(self.tokens.items()):
+            lines.append(f"{model} tokens: {prompt} prompt + {completion} completion")
+        lines.append(f"Estimated cost: ${self.cost:.2f}")
+        return '\n'.join(lines)
+
+
+def tagging_estimate(files, sample, metrics, features, max_workers=1, list_pages=1):
+    """Scale a tagged ``sample`` of ``files`` up to the whole folder.
+
+    ``files`` is the folder's full listing, which took ``list_pages`` Drive
+    listing calls. ``features`` are the Vision features requested per image.
+    ``metrics`` must hold the sample's ``image`` and ``download`` timings and
+    the classifier's ``chat_*[<model>]`` counters. Download time is scaled by
+    the folder's total Drive size when sizes are known, the rest per image.
+    """
+
+    total, sampled = len(files), len(sample)
+    scale = total / sampled if sampled else 0.0
+    counters = metrics.summary()['counters']
+    image = metrics.stage_stats('image')
+    download = metrics.stage_stats('download')
+    total_bytes = sum(int(f.get('size') or 0) for f in files)
+    sample_bytes = sum(int(f.get('size') or 0) for f in sample)
+
+    if sample_bytes and total_bytes:
+        serial = (image['total'] - download['total']) * scale
+        serial += download['total'] / sample_bytes * total_bytes
+    else:
+        serial = image['total'] * scale
+    seconds = metrics.stage_stats('list_images')['total'] + serial / max(1, max_workers)
+
+    # Images whose Vision result was cached skip both download and Vision.
+    uncached = round(total * (1 - counters.get('vision_cache_hits', 0) / sampled)) if sampled else 0
+    calls = {
+        'drive.files.list': list_pages,
+        'drive.files.get_media': uncached,
+        'vision.annotate_image': uncached,
+    }
+    for model, count in per_model(counters, 'chat_calls').items():
+        calls[f'openai.chat.completions[{model}]'] = round(count * scale)
+    completion = per_model(counters, 'chat_completion_tokens')
+    tokens = {
+        model: (round(prompt * scale), round(completion.get(model, 0) * scale))
+        for model, prompt in per_model(counters, 'chat_prompt_tokens').items()
+    }
+    cost = token_cost(tokens)
+    cost += sum(VISION_PRICES.get(feature, 0.0) for feature in features) * uncached / 1000
+    return Estimate('images', total, sampled, seconds, calls, tokens, cost, max_workers, total_bytes)
+
+
+def recipe_estimate(num_recipes, rows, metrics, wall_seconds, model='gpt-4-turbo'):
+    """Scale a sample of recipe ``rows`` (header first) up to ``num_recipes``.
+
+    ``wall_seconds`` is the sample run's total time; the part outside the
+    ``recipes`` stage (loading tables) is counted once.
+    """
+
+    sampled = len(rows) - 1
+    scale = num_recipes / sampled if sampled else 0.0
+    counters = metrics.summary()['counters']
+    recipes = metrics.stage_stats('recipes')['total']
+    seconds = max(0.0, wall_seconds - recipes) + recipes * scale
+
+    # Asset links found in a prefetched folder listing need no Drive lookup.
+    calls = {
+        'drive.files.list': round(counters.get('asset_link_queries', 0) * scale),
+        'openai.recipe_copy': round(counters.get('copy_requests', 0) * scale),
+    }
+    prompt = counters.get('api_prompt_tokens') or counters.get('prompt_tokens', 0)
+    tokens = {model: (round(prompt * scale), round(counters.get('api_completion_tokens', 0) * scale))}
+    return Estimate('recipes', num_recipes, sampled, seconds, calls, tokens, token_cost(tokens))
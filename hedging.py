@@ -0,0 +1,180 @@
+"""Per-stage deadlines and hedged requests for external calls.
+
+Every guarded call runs with a deadline for its stage (``download``,
+``vision``, ``classify``, ``recipe_copy``); a call that has not finished in
+time raises :class:`DeadlineExceeded` instead of stalling the run. The
+deadline is also passed to the underlying client as its request timeout
+(see :func:`timeout_kwargs`) so the abandoned request is torn down too.
+
+With hedging on, a duplicate request is issued for hedged stages once the
+original has been running longer than the stage's observed p95 latency;
+whichever finishes first is used and the other is cancelled if it has not
+started, or otherwise left to finish with its result discarded. Hedges
+are counted as ``hedges[<stage>]``, hedges that finished first as
+``hedge_wins[<stage>]`` and timeouts as ``deadline_exceeded[<stage>]`` in
+the run metrics.
+
+Guarded calls run on a shared thread pool. The deadline starts when a call
+begins running, so time spent queued behind other calls does not count
+against it. A call abandoned at its deadline keeps its pool thread until
+it finishes, since a running request cannot be interrupted from Python.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import percentile
+
+DEFAULT_DEADLINES = {
+    'download': 120.0,
+    'vision': 60.0,
+    'classify': 60.0,
+    'recipe_copy': 120.0,
+}
+# Downloads are not hedged: a duplicate would double the bytes in flight.
+HEDGE_STAGES = ('vision', 'classify', 'recipe_copy')
+
+
+class DeadlineExceeded(TimeoutError):
+    """An external call did not finish within its stage deadline."""
+
+
+def _incr(metrics, name):
+    if metrics is not None:
+        metrics.incr(name)
+
+
+class CallPolicy:
+    """Deadlines and hedging settings plus observed latencies per stage.
+
+    Parameters
+    ----------
+    deadlines : dict[str, float] | None, optional
+        Seconds per stage; ``None`` uses :data:`DEFAULT_DEADLINES`. Stages
+        missing from the dict (or set to ``0``) have no deadline.
+    hedge : bool, optional
+        Issue hedged requests for :data:`HEDGE_STAGES`.
+    min_samples : int, optional
+        Latencies observed for a stage before it is hedged.
+    window : int, optional
+        Recent latencies kept per stage for the p95 estimate.
+    max_workers : int, optional
+        Threads shared by all guarded calls, including abandoned calls
+        that are still running.
+    """
+
+    def __init__(self, deadlines=None, hedge=False, min_samples=20, window=200, max_workers=64):
+        self.deadlines = dict(DEFAULT_DEADLINES if deadlines is None else deadlines)
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self.window = window
+        self.max_workers = max_workers
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def deadline(self, stage):
+        return self.deadlines.get(stage) or None
+
+    def hedge_delay(self, stage):
+        """Return the p95 latency after which ``stage`` is hedged, or ``None``."""
+
+        if not self.hedge or stage not in HEDGE_STAGES:
+            return None
+        with self._lock:
+            samples = list(self._latencies.get(stage, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, 95)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='hedged-call')
+            return self._pool
+
+    def call(self, stage, fn, metrics=None):
+        """Return ``fn()`` subject to the stage's deadline and hedging."""
+
+        deadline = self.deadline(stage)
+        delay = self.hedge_delay(stage)
+        if deadline is None and delay is None:
+            start = time.monotonic()
+            result = fn()
+            self.observe(stage, time.monotonic() - start)
+            return result
+
+        # The clock starts when the call leaves the pool's queue.
+        started = []
+        running = threading.Event()
+
+        def run():
+            started.append(time.monotonic())
+            running.set()
+            return fn()
+
+        pool = self._executor()
+        primary = pool.submit(run)
+        futures = [primary]
+        running.wait()
+        start = started[0]
+        end = start + deadline if deadline else None
+        if delay is not None and (end is None or start + delay < end):
+            done, _ = wait(futures, timeout=max(0.0, start + delay - time.monotonic()))
+            if not done:
+                futures.append(pool.submit(run))
+                _incr(metrics, f'hedges[{stage}]')
+
+        pending = set(futures)
+        while True:
+            remaining = None if end is None else max(0.0, end - time.monotonic())
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                for future in futures:
+                    future.cancel()
+                _incr(metrics, f'deadline_exceeded[{stage}]')
+                raise DeadlineExceeded(f"{stage} call exceeded its {deadline:g}s deadline")
+            succeeded = [f for f in futures if f in done and f.exception() is None]
+            if succeeded or not pending:
+                break
+
+        winner = succeeded[0] if succeeded else next(iter(done))
+        for future in futures:
+            if future is not winner:
+                future.cancel()
+        if winner is not primary:
+            _incr(metrics, f'hedge_wins[{stage}]')
+        if succeeded:
+            self.observe(stage, time.monotonic() - start)
+        return winner.result()
+
+
+# Policy used by guarded(); see configure_calls.
+policy = CallPolicy()
+
+
+def configure_calls(deadlines=None, hedge=False, **kwargs):
+    """Replace the global :class:`CallPolicy` used by :func:`guarded`."""
+
+    global policy
+    policy = CallPolicy(deadlines, hedge, **kwargs)
+    return policy
+
+
+def guarded(stage, fn, metrics=None):
+    """Run ``fn()`` under the global policy for ``stage``."""
+
+    return policy.call(stage, fn, metrics)
+
+
+def timeout_kwargs(stage):
+    """Return ``{'timeout': seconds}`` for client calls, or ``{}`` without a deadline."""
+
+    deadline = policy.deadline(stage)
+    return {'timeout': deadline} if deadline else {}
@@ -0,0 +1,145 @@
+"""Content-addressed on-disk cache of downloaded Drive images.
+
+Entries are keyed by Drive file ID plus ``md5Checksum``, so an edited file
+gets a new key and stale bytes are never served. The cache is capped at
+``max_bytes``; when it grows past the cap the least recently used entries
+are removed until it is back under ``low_water`` of the cap, so the
+directory scan behind eviction runs once per batch of writes rather than
+on every write. Reads are memory-mapped, so cached images are served from
+the page cache without an extra read into a Python buffer.
+
+Vision results can be cached alongside the image under a *variant* key
+describing the requested feature set, so re-running with the same features
+skips both the download and the Vision call.
+"""
+
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class ImageCache:
+    """LRU-bounded image store under ``root``.
+
+    Parameters
+    ----------
+    root : str
+        Cache directory; created if missing. Several processes may share it.
+    max_bytes : int, optional
+        Size cap. Defaults to 2 GiB.
+    low_water : float, optional
+        Fraction of ``max_bytes`` that eviction shrinks the cache to.
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, low_water=0.9):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._total = sum(size for _, _, size in self._entries())
+
+    def path(self, file_id, md5_checksum):
+        """Return the cache file path for a Drive file revision."""
+
+        name = f"{_UNSAFE.sub('_', file_id)}-{_UNSAFE.sub('_', md5_checksum)}"
+        return os.path.join(self.root, md5_checksum[:2] or '__', name)
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def get(self, file_id, md5_checksum):
+        """Return a read-only memory map of the cached bytes, or ``None``.
+
+        The entry's modification time is bumped so it counts as recently
+        used. Close the returned map when done (it supports ``with``).
+        """
+
+        if not md5_checksum:
+            return None
+        path = self.path(file_id, md5_checksum)
+        try:
+            with open(path, 'rb') as fh:
+                os.utime(path)
+                if os.fstat(fh.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    def get_annotation(self, file_id, md5_checksum, variant):
+        """Return cached Vision results for ``variant``, or ``None``."""
+
+        if not md5_checksum:
+            return None
+        path = f"{self.path(file_id, md5_checksum)}.{_UNSAFE.sub('_', variant)}.json"
+        try:
+            with open(path, encoding='utf-8') as fh:
+                os.utime(path)
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_annotation(self, file_id, md5_checksum, variant, result):
+        """Cache JSON-serializable Vision results for ``variant``."""
+
+        if not md5_checksum:
+            return
+        data = json.dumps(result).encode('utf-8')
+        self._write(f"{self.path(file_id, md5_checksum)}.{_UNSAFE.sub('_', variant)}.json", data)
+
+    def put(self, file_id, md5_checksum, data):
+        """Store ``data`` (any bytes-like object) and evict if over the cap."""
+
+        if not md5_checksum:
+            return
+        self._write(self.path(file_id, md5_checksum), data)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see partial data.
+        fd, tmp = tempfile.mkstemp(prefix='.tmp', dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        with self._lock:
+            try:
+                previous = os.path.getsize(path)
+            except FileNotFoundError:
+                previous = 0
+            os.replace(tmp, path)
+            self._total += len(data) - previous
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * self.low_water
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total = total
+
+    def size(self):
+        """Return the number of bytes currently cached."""
+
+        return self._total
@@ -0,0 +1,161 @@
+"""Local file sinks and readers for tagging and recipe tables.
+
+Tables are written as CSV, JSON Lines or Parquet, chosen by file extension.
+Rows are appended as they are produced so a long run leaves usable output on
+disk even if it stops part way. Parquet support needs ``pyarrow``.
+"""
+
+import csv
+import json
+import os
+
+import pandas as pd
+
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+}
+
+
+def table_format(path):
+    """Return ``"csv"``, ``"jsonl"`` or ``"parquet"`` for ``path``."""
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported table format for {path}; use one of {', '.join(FORMATS)}")
+    return FORMATS[ext]
+
+
+class _CsvSink:
+    def __init__(self, path, header, append=False):
+        self._fh = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._fh)
+        if not append:
+            self._writer.writerow(header)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+class _JsonlSink:
+    def __init__(self, path, header, append=False):
+        self._fh = open(path, 'a' if append else 'w', encoding='utf-8')
+        self._header = list(header)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._fh.write(json.dumps(dict(zip(self._header, row)), ensure_ascii=False) + '\n')
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+class _ParquetSink:
+    def __init__(self, path, header):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires the pyarrow package") from e
+        self._pa = pa
+        self._header = list(header)
+        self._schema = pa.schema([(name, pa.string()) for name in self._header])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        # Each call becomes one row group, readable once the file is closed.
+        columns = list(zip(*[[str(v) for v in row] for row in rows]))
+        self._writer.write_table(
+            self._pa.Table.from_arrays(
+                [self._pa.array(col, type=self._pa.string()) for col in columns],
+                schema=self._schema,
+            )
+        )
+
+    def close(self):
+        self._writer.close()
+
+
+_SINKS = {'csv': _CsvSink, 'jsonl': _JsonlSink, 'parquet': _ParquetSink}
+
+
+def open_sink(path, header):
+    """Create a table at ``path`` and return a sink for appending rows.
+
+    Parameters
+    ----------
+    path : str
+        Output file. The extension selects the format. An existing file is
+        replaced.
+    header : list[str]
+        Column names.
+
+    Returns
+    -------
+    object
+        Sink with ``write_rows(rows)`` and ``close()`` methods.
+    """
+
+    return _SINKS[table_format(path)](path, header)
+
+
+def write_table(path, rows):
+    """Write ``rows`` (header first) to ``path`` in one go."""
+
+    sink = open_sink(path, rows[0])
+    try:
+        sink.write_rows(rows[1:])
+    finally:
+        sink.close()
+
+
+def append_table(path, rows):
+    """Append ``rows`` (header first) to the table at ``path``.
+
+    The table is created if it does not exist. CSV and JSON Lines files are
+    appended in place, so rows already on disk survive a crash; Parquet
+    files cannot be appended to and are rewritten through a temporary file.
+    """
+
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        write_table(path, rows)
+        return
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        existing = read_table(path)
+        root, ext = os.path.splitext(path)
+        tmp_path = f"{root}.tmp{ext}"
+        write_table(tmp_path, [list(existing.columns)] + existing.values.tolist() + [list(r) for r in rows[1:]])
+        os.replace(tmp_path, path)
+        return
+    sink = _SINKS[fmt](path, rows[0], append=True)
+    try:
+        sink.write_rows(rows[1:])
+    finally:
+        sink.close()
+
+
+def read_table(path):
+    """Read a local table into a DataFrame of strings.
+
+    Empty cells are returned as ``""`` to match :func:`recipe_generator.read_sheet`.
+    """
+
+    fmt = table_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    if fmt == 'jsonl':
+        with open(path, encoding='utf-8') as fh:
+            records = [json.loads(line) for line in fh if line.strip()]
+        return pd.DataFrame(records).fillna('').astype(str)
+    return pd.read_parquet(path).fillna('').astype(str)
@@ -1,13 +1,36 @@
 
-import io
+import hashlib
 import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import toml
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 from google.cloud import vision
-from chat_classifier import chat_classify
+from batch_api import run_batch
+from cassette import recorded, stop_cassette, use_cassette
+from chat_classifier import (
+    DEFAULT_MATCH_MODE,
+    DEFAULT_MODEL,
+    MATCH_MODES,
+    UNKNOWN_CLASSIFICATION,
+    build_classify_request,
+    chat_classify,
+    classification_from_reply,
+    resolve_match,
+)
+from download_pipeline import BufferWriter, ByteBudget, SharedReservation
+from estimator import DEFAULT_SAMPLE_SIZE, sample_evenly, tagging_estimate
+from hedging import DEFAULT_DEADLINES, configure_calls, guarded, timeout_kwargs
+from image_cache import ImageCache
+from local_store import open_sink, write_table
+from metrics import RunMetrics
+from model_router import DEFAULT_MIN_CONFIDENCE, RULES_TIER, ModelRouter
+from tracing import SamplingProfiler, span, start_tracing, stop_tracing
 
 SCOPES = [
     'https://www.googleapis.com/auth/drive.readonly',
@@ -28,6 +51,85 @@ drive_service = build('drive', 'v3', credentials=credentials)
 sheets_service = build('sheets', 'v4', credentials=credentials)
 vision_client = vision.ImageAnnotatorClient(credentials=credentials)
 
+# Optional on-disk cache of downloaded images; see configure_image_cache.
+image_cache = None
+
+def configure_image_cache(cache_dir, max_bytes=2 * 1024 ** 3):
+    """Enable the content-addressed image cache for :func:`analyze_image`.
+
+    Parameters
+    ----------
+    cache_dir : str | None
+        Cache directory, or ``None`` to disable caching.
+    max_bytes : int, optional
+        Size cap before least recently used images are evicted.
+    """
+
+    global image_cache
+    image_cache = ImageCache(cache_dir, max_bytes) if cache_dir else None
+    return image_cache
+
+# Vision features selectable per run, keyed by their CLI names.
+VISION_FEATURES = {
+    'label': 'LABEL_DETECTION',
+    'web': 'WEB_DETECTION',
+}
+DEFAULT_FEATURES = ('label', 'web')
+
+def normalize_features(features):
+    """Validate feature names and return them in canonical order."""
+
+    features = set(features or DEFAULT_FEATURES)
+    unknown = features - set(VISION_FEATURES)
+    if unknown:
+        raise ValueError(f"Unknown Vision features: {', '.join(sorted(unknown))}")
+    return tuple(name for name in VISION_FEATURES if name in features)
+
+def feature_variant(features, max_results=None):
+    """Return the cache/metrics key for a Vision feature configuration."""
+
+    return '+'.join(normalize_features(features)) + (f'@{max_results}' if max_results else '')
+
+# Images held in memory (downloading or awaiting Vision) across all threads.
+# Files without a known size are assumed to be DEFAULT_IMAGE_RESERVE bytes.
+DEFAULT_IMAGE_RESERVE = 8 * 1024 * 1024
+download_budget = ByteBudget(256 * 1024 * 1024)
+
+def image_reserve(size):
+    """Return the budget bytes held for an image of ``size`` bytes.
+
+    Twice the file size: the download buffer plus the immutable ``bytes``
+    copy the Vision request is built from.
+    """
+
+    return 2 * (int(size) if size else DEFAULT_IMAGE_RESERVE)
+_thread_local = threading.local()
+
+def configure_downloads(max_inflight_bytes):
+    """Set the global budget of image bytes held in memory at once."""
+
+    global download_budget
+    download_budget = ByteBudget(max_inflight_bytes)
+    return download_budget
+
+def get_drive_service():
+    """Return a Drive client usable from the current thread.
+
+    ``googleapiclient`` services are not thread-safe, so worker threads get
+    their own client built from the shared credentials.
+    """
+
+    if threading.current_thread() is threading.main_thread():
+        return drive_service
+    service = getattr(_thread_local, 'drive_service', None)
+    if service is None:
+        service = build('drive', 'v3', credentials=credentials)
+        _thread_local.drive_service = service
+    return service
+
+# Files per Drive listing page (the API maximum; the default is 100).
+LIST_PAGE_SIZE = 1000
+
 def list_images(folder_id):
     """List image files in a Google Drive folder.
 
@@ -39,54 +141,183 @@ def list_images(folder_id):
     Returns
     -------
     list[dict]
-        File metadata dictionaries with ``id``, ``name`` and ``webViewLink``.
+        File metadata dictionaries with ``id``, ``name``, ``webViewLink``,
+        ``md5Checksum`` and ``size``, from every page of the listing.
     """
 
     if not folder_id:
         raise ValueError("folder_id is required")
 
     query = f"'{folder_id}' in parents and mimeType contains 'image/'"
-    response = drive_service.files().list(q=query, fields="files(id, name, webViewLink)").execute()
-    return response.get('files', [])
+    fields = "nextPageToken, files(id, name, webViewLink, md5Checksum, size)"
+    files = []
+    page_token = None
+    with span('list_images', folder_id=folder_id):
+        while True:
+            response = recorded(
+                'drive.files.list',
+                [query, fields, page_token],
+                lambda: get_drive_service().files().list(
+                    q=query, fields=fields, pageSize=LIST_PAGE_SIZE, pageToken=page_token
+                ).execute(),
+            )
+            files.extend(response.get('files', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return files
+
+def download_image(file_id, size=None):
+    """Download a Drive file's bytes.
 
-def analyze_image(file_id):
+    The file is written into a buffer preallocated from ``size`` (the Drive
+    metadata size, when known) and that buffer is returned as a
+    ``bytearray``, so no intermediate ``BytesIO`` grows and nothing is
+    copied out.
+    """
+
+    with span('download', file_id=file_id, size=size):
+        return recorded('drive.files.get_media', [file_id], lambda: _download_image(file_id, size))
+
+def _download_image(file_id, size=None):
+    writer = BufferWriter(bytearray(int(size)) if size else bytearray())
+    request = get_drive_service().files().get_media(fileId=file_id)
+    downloader = MediaIoBaseDownload(writer, request)
+    done = False
+    try:
+        while not done:
+            _, done = downloader.next_chunk()
+    except HttpError as e:
+        raise RuntimeError(f"Failed to download file {file_id}: {e}")
+    return writer.detach()
+
+def load_image_bytes(file_id, md5_checksum=None, size=None):
+    """Return a file's bytes from the image cache, downloading on a miss.
+
+    A cache hit never touches Drive. Without ``md5_checksum`` (or with the
+    cache disabled) the file is always downloaded.
+    """
+
+    cache = image_cache
+    if cache is not None and md5_checksum:
+        cached = cache.get(file_id, md5_checksum)
+        if cached is not None:
+            with cached:
+                return cached[:]
+    content = download_image(file_id, size)
+    if cache is not None and md5_checksum:
+        cache.put(file_id, md5_checksum, content)
+    return content
+
+def analyze_image(
+    file_id,
+    md5_checksum=None,
+    size=None,
+    features=DEFAULT_FEATURES,
+    max_results=None,
+    metrics=None,
+):
     """Analyze an image with the Vision API.
 
     Parameters
     ----------
     file_id : str
         ID of the file to analyze.
+    md5_checksum : str | None, optional
+        Drive ``md5Checksum`` of the file; enables the image cache.
+    size : int | str | None, optional
+        Drive file size in bytes, used to reserve the download budget.
+    features : tuple[str], optional
+        Vision features to request: ``"label"`` and/or ``"web"``. Web
+        detection is the slower, more expensive of the two.
+    max_results : int | None, optional
+        Cap on results per feature. Vision's default applies when omitted.
+    metrics : metrics.RunMetrics | None, optional
+        Receives ``download`` and ``vision[<features>]`` timings.
 
     Returns
     -------
     tuple[list[str], list[str]]
-        Detected labels and web entity labels.
+        Detected labels and web entity labels. A list is empty when its
+        feature was not requested.
+
+    Notes
+    -----
+    :func:`image_reserve` bytes of :data:`download_budget` (twice ``size``)
+    are held from the start of the download until Vision responds, so
+    concurrent calls wait rather than pushing memory past the budget. A call
+    abandoned at its deadline keeps the bytes reserved until it actually
+    finishes. With the image cache enabled, results
+    are also cached per feature configuration. Both calls are subject to the
+    ``download`` / ``vision`` deadlines and hedging in :mod:`hedging`.
     """
 
-    request = drive_service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    try:
-        while not done:
-            _, done = downloader.next_chunk()
-    except HttpError as e:
-        raise RuntimeError(f"Failed to download file {file_id}: {e}")
+    features = normalize_features(features)
+    variant = feature_variant(features, max_results)
+    metrics = metrics or RunMetrics()
+    cache = image_cache
+    if cache is not None:
+        cached = cache.get_annotation(file_id, md5_checksum, variant)
+        if cached is not None:
+            metrics.incr('vision_cache_hits')
+            return cached['labels'], cached['web_labels']
+
+    with SharedReservation(download_budget, image_reserve(size)) as reservation:
+        with metrics.timer('download'):
+            content = guarded(
+                'download',
+                lambda: reservation.run(lambda: load_image_bytes(file_id, md5_checksum, size)),
+                metrics,
+            )
+        with metrics.timer(f'vision[{variant}]'):
+            labels, web_labels = guarded(
+                'vision',
+                lambda: reservation.run(lambda: annotate_content(content, features, max_results)),
+                metrics,
+            )
+
+    if cache is not None:
+        cache.put_annotation(
+            file_id, md5_checksum, variant, {'labels': labels, 'web_labels': web_labels}
+        )
+    return labels, web_labels
 
-    image = vision.Image(content=fh.getvalue())
+def annotate_content(content, features=DEFAULT_FEATURES, max_results=None):
+    """Run the requested Vision features on image bytes."""
+
+    features = normalize_features(features)
+    with span('vision', features=feature_variant(features, max_results)):
+        return recorded(
+            'vision.annotate_image',
+            [hashlib.sha1(content).hexdigest(), features, max_results],
+            lambda: _annotate_content(content, features, max_results),
+        )
+
+def _score(annotation):
+    return getattr(annotation, 'score', 0) or 0
+
+def _annotate_content(content, features, max_results):
+    # The request needs immutable bytes; a downloaded bytearray is copied
+    # here, which image_reserve() accounts for.
+    image = vision.Image(content=bytes(content))
+
+    requested = []
+    for name in features:
+        feature = {'type': getattr(vision.Feature.Type, VISION_FEATURES[name])}
+        if max_results:
+            feature['max_results'] = max_results
+        requested.append(feature)
 
     response = vision_client.annotate_image({
         'image': image,
-        'features': [
-            {'type': vision.Feature.Type.LABEL_DETECTION},
-            {'type': vision.Feature.Type.WEB_DETECTION}
-        ]
-    })
+        'features': requested,
+    }, **timeout_kwargs('vision'))
 
-    labels = [label.description for label in getattr(response, 'label_annotations', [])]
+    # Keep Vision's score order explicit; prompt compaction keeps the top entries.
+    annotations = getattr(response, 'label_annotations', [])
+    labels = [label.description for label in sorted(annotations, key=_score, reverse=True)]
     web_detection = getattr(response, 'web_detection', None)
     entities = getattr(web_detection, 'web_entities', []) if web_detection else []
-    web_labels = [entity.description for entity in entities]
+    web_labels = [entity.description for entity in sorted(entities, key=_score, reverse=True)]
 
     return labels, web_labels
 
@@ -105,71 +336,540 @@ def write_to_sheet(sheet_id, rows):
     None
     """
 
-    sheets_service.spreadsheets().values().append(
-        spreadsheetId=sheet_id,
-        range='A1',
-        valueInputOption='RAW',
-        insertDataOption='INSERT_ROWS',
-        body={'values': rows}
-    ).execute()
+    with span('write_sheet', rows=len(rows)):
+        recorded(
+            'sheets.values.append',
+            [sheet_id, rows],
+            lambda: sheets_service.spreadsheets().values().append(
+                spreadsheetId=sheet_id,
+                range='A1',
+                valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
+                body={'values': rows}
+            ).execute(),
+        )
+
+HEADER_ROW = [
+    'Image Name',
+    'Image Link',
+    'Google Labels',
+    'Google Web Entities',
+    'Descriptors',
+    'Matched Content',
+    'Audience',
+    'Product',
+    'Angle',
+]
+
+# Output columns that only exist when their Vision feature was requested.
+FEATURE_COLUMNS = {
+    'Google Labels': 'label',
+    'Google Web Entities': 'web',
+}
+
+def header_for(features=DEFAULT_FEATURES, routing=False):
+    """Return :data:`HEADER_ROW` without columns for features not requested.
+
+    With ``routing`` a ``Model`` column records which tier classified each
+    row (see :mod:`model_router`).
+    """
+
+    features = normalize_features(features)
+    header = [
+        column for column in HEADER_ROW
+        if column not in FEATURE_COLUMNS or FEATURE_COLUMNS[column] in features
+    ]
+    return header + ['Model'] if routing else header
+
+def build_row(file, labels, web_labels, chat_result, features=DEFAULT_FEATURES, routing=False):
+    """Return the output row for a classified file, matching :func:`header_for`."""
+
+    descriptors = ', '.join(chat_result.get("descriptors", []))
+    matched_content = chat_result.get("match_content", "unknown")
+    audience = chat_result.get("audience", "unknown")
+    product = chat_result.get("product", "unknown")
+    angle = chat_result.get("angle", "unknown")
+
+    features = normalize_features(features)
+    row = [file['name'], file['webViewLink']]
+    if 'label' in features:
+        row.append(', '.join(labels))
+    if 'web' in features:
+        row.append(', '.join(web_labels))
+    row += [
+        descriptors,
+        matched_content,
+        audience,
+        product,
+        angle,
+    ]
+    if routing:
+        row.append(chat_result.get("model", ""))
+    return row
+
+def error_row(file, error, features=DEFAULT_FEATURES, routing=False, metrics=None):
+    """Return an ``unknown`` row for a file that could not be analyzed.
+
+    The error is printed and counted as ``image_errors`` so one failed or
+    timed-out image does not abort the run.
+    """
+
+    print(f"Failed to tag {file.get('name')}: {error}")
+    if metrics is not None:
+        metrics.incr('image_errors')
+    chat_result = {**UNKNOWN_CLASSIFICATION, "descriptors": []}
+    return build_row(file, [], [], chat_result, features, routing)
+
+def tag_file(
+    file,
+    expected_content,
+    features=DEFAULT_FEATURES,
+    max_results=None,
+    metrics=None,
+    match_mode=DEFAULT_MATCH_MODE,
+    router=None,
+):
+    """Analyze and classify a single Drive file.
+
+    Parameters
+    ----------
+    file : dict
+        File metadata as returned by :func:`list_images`.
+    expected_content : list[str]
+        Content tags passed through to :func:`chat_classify`.
+    features, max_results : optional
+        Vision configuration passed to :func:`analyze_image`.
+    metrics : metrics.RunMetrics | None, optional
+        Receives per-stage timings.
+    match_mode : str, optional
+        How ``match_content`` is decided; see :data:`chat_classifier.MATCH_MODES`.
+    router : model_router.ModelRouter | None, optional
+        Classify through rules / small model / large model tiers and add a
+        ``Model`` column. Without it every image goes to one model.
+
+    Returns
+    -------
+    list[str]
+        Output row matching :func:`header_for`.
+    """
+
+    metrics = metrics or RunMetrics()
+    labels, web_labels = analyze_image(
+        file['id'],
+        file.get('md5Checksum'),
+        file.get('size'),
+        features,
+        max_results,
+        metrics,
+    )
+
+    with metrics.timer('classify'):
+        if router is not None:
+            chat_result = router.classify(labels, web_labels, expected_content, match_mode, metrics)
+        else:
+            chat_result = chat_classify(
+                labels,
+                web_labels,
+                expected_content,
+                match_mode,
+                metrics,
+            )
+
+    return build_row(file, labels, web_labels, chat_result, features, router is not None)
+
+def tag_files_batch(
+    files,
+    expected_content,
+    batch_path=None,
+    features=DEFAULT_FEATURES,
+    max_results=None,
+    metrics=None,
+    match_mode=DEFAULT_MATCH_MODE,
+    router=None,
+):
+    """Analyze files, then classify them all in one OpenAI batch.
 
-def run_tagger(sheet_id, folder_id, expected_content=None):
+    Vision runs as usual; only the ``chat_classify`` step is deferred to the
+    Batch API. Replies are matched back to files by custom ID.
+
+    With a ``router``, rule-matched images skip the batch entirely and
+    low-confidence small-model replies are re-sent to the large model in a
+    second batch.
+
+    Files whose download or Vision call fails get an :func:`error_row`
+    and are left out of the batch.
+
+    Returns
+    -------
+    list[list[str]]
+        Output rows in ``files`` order.
+    """
+
+    analyzed = []
+    errors = {}
+    for i, file in enumerate(files):
+        try:
+            labels, web_labels = analyze_image(
+                file['id'], file.get('md5Checksum'), file.get('size'), features, max_results, metrics
+            )
+        except Exception as e:
+            errors[i] = error_row(file, e, features, router is not None, metrics)
+            labels, web_labels = [], []
+        analyzed.append((file, labels, web_labels))
+    matches = [
+        resolve_match(labels, web_labels, expected_content, match_mode)
+        for _, labels, web_labels in analyzed
+    ]
+    results = [None] * len(analyzed)
+    if router is not None:
+        tiers = [router.small_model, router.large_model]
+        for i, (_, labels, web_labels) in enumerate(analyzed):
+            results[i] = router.match_rules(labels, web_labels, expected_content)
+            if results[i] is not None:
+                results[i]['model'] = RULES_TIER
+    else:
+        tiers = [DEFAULT_MODEL]
+    pending = [i for i, result in enumerate(results) if result is None and i not in errors]
+    for tier, model in enumerate(tiers):
+        if not pending:
+            break
+        requests = []
+        for i in pending:
+            _, labels, web_labels = analyzed[i]
+            request = build_classify_request(
+                labels,
+                web_labels,
+                expected_content,
+                matches[i][1],
+                metrics=metrics,
+                model=model,
+                include_confidence=router is not None,
+            )
+            requests.append((f"img-{i}", request))
+        replies = run_batch(requests, path=batch_path)
+        escalate = []
+        for i in pending:
+            chat_result = classification_from_reply(replies.get(f"img-{i}"))
+            if matches[i][0] is not None:
+                chat_result["match_content"] = matches[i][0]
+            chat_result['model'] = model
+            results[i] = chat_result
+            if router is not None and tier == 0 and router.needs_escalation(chat_result):
+                escalate.append(i)
+        pending = escalate
+        if metrics is not None and escalate:
+            metrics.incr('route_escalations', len(escalate))
+    rows = []
+    for i, ((file, labels, web_labels), chat_result) in enumerate(zip(analyzed, results)):
+        if i in errors:
+            rows.append(errors[i])
+            continue
+        if router is not None and metrics is not None:
+            metrics.incr(f"route[{chat_result['model']}]")
+        rows.append(build_row(file, labels, web_labels, chat_result, features, router is not None))
+    return rows
+
+def run_tagger(
+    sheet_id,
+    folder_id,
+    expected_content=None,
+    output_path=None,
+    use_batch=False,
+    max_workers=1,
+    features=DEFAULT_FEATURES,
+    max_results=None,
+    match_mode=DEFAULT_MATCH_MODE,
+    router=None,
+    files=None,
+):
     """Tag images in a Drive folder and write results to a Google Sheet.
 
+    An image whose download or Vision call fails, for example with
+    :class:`hedging.DeadlineExceeded`, gets an ``unknown`` row (see
+    :func:`error_row`) and the run carries on.
+
     Parameters
     ----------
-    sheet_id : str
-        Destination Google Sheet ID.
+    sheet_id : str | None
+        Destination Google Sheet ID. May be omitted when ``output_path`` is
+        given.
     folder_id : str
         Source Drive folder containing images.
     expected_content : list[str] | None, optional
         Additional content tags to classify. Defaults to ``[]`` if not provided.
+    output_path : str | None, optional
+        Local ``.csv``, ``.jsonl`` or ``.parquet`` file. Rows are appended as
+        each image is tagged.
+    use_batch : bool, optional
+        Classify through the OpenAI Batch API (see :func:`tag_files_batch`).
+        Cheaper on quota for large folders but may take hours to complete.
+    max_workers : int, optional
+        Images tagged concurrently. Memory held by in-flight images is
+        bounded by :data:`download_budget` regardless of this value.
+    features : tuple[str], optional
+        Vision features to request (``"label"``, ``"web"``). Output columns
+        for features not requested are omitted.
+    max_results : int | None, optional
+        Cap on Vision results per feature.
+    match_mode : str, optional
+        ``"local"`` (default) matches expected content with
+        :mod:`content_matcher` without spending tokens, ``"llm"`` asks the
+        model, ``"local+llm"`` asks the model only when nothing matches.
+    router : model_router.ModelRouter | None, optional
+        Route each image to the cheapest confident tier and record the tier
+        in a ``Model`` column; routing counts appear in the metrics.
+    files : list[dict] | None, optional
+        The folder's :func:`list_images` result if it was already fetched
+        (e.g. prefetched by the app); ``None`` lists ``folder_id``.
+
+    Returns
+    -------
+    metrics.RunMetrics
+        Timings and counters for the run; a summary is also printed.
     """
 
-    if not sheet_id or not folder_id:
-        raise ValueError("sheet_id and folder_id are required")
+    if not folder_id:
+        raise ValueError("folder_id is required")
+    if not sheet_id and not output_path:
+        raise ValueError("sheet_id or output_path is required")
 
     expected_content = expected_content or []
+    features = normalize_features(features)
+    metrics = RunMetrics()
+
+    def tag(file):
+        with metrics.timer('image'), span('image', file=file.get('name')):
+            try:
+                return tag_file(
+                    file, expected_content, features, max_results, metrics, match_mode, router
+                )
+            except Exception as e:
+                return error_row(file, e, features, router is not None, metrics)
 
-    rows = [[
-        'Image Name',
-        'Image Link',
-        'Google Labels',
-        'Google Web Entities',
-        'Descriptors',
-        'Matched Content',
-        'Audience',
-        'Product',
-        'Angle',
-    ]]
+    header = header_for(features, router is not None)
+    rows = [header]
+    sink = open_sink(output_path, header) if output_path else None
+    pool = None
+    try:
+        if files is None:
+            with metrics.timer('list_images'):
+                files = list_images(folder_id)
+        if use_batch:
+            new_rows = tag_files_batch(
+                files,
+                expected_content,
+                features=features,
+                max_results=max_results,
+                metrics=metrics,
+                match_mode=match_mode,
+                router=router,
+            )
+        elif max_workers > 1:
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+            new_rows = pool.map(tag, files)
+        else:
+            new_rows = (tag(file) for file in files)
+        for row in new_rows:
+            rows.append(row)
+            if sink:
+                sink.write_rows([row])
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if sink:
+            sink.close()
+    if sheet_id:
+        with metrics.timer('write_sheet'):
+            write_to_sheet(sheet_id, rows)
+    metrics.incr('images', len(rows) - 1)
+    print(metrics.format_summary())
+    return metrics
+
+def estimate_run(
+    folder_id,
+    expected_content=None,
+    sample_size=DEFAULT_SAMPLE_SIZE,
+    max_workers=1,
+    features=DEFAULT_FEATURES,
+    max_results=None,
+    match_mode=DEFAULT_MATCH_MODE,
+    router=None,
+    files=None,
+):
+    """Estimate a :func:`run_tagger` run without running it.
+
+    The folder is listed and ``sample_size`` images spread across it are
+    tagged through the real pipeline (nothing is written); their timings,
+    call counts and tokens are scaled to the whole folder.
+
+    Parameters
+    ----------
+    folder_id : str
+        Source Drive folder containing images.
+    sample_size : int, optional
+        Images to tag for the sample.
+    max_workers : int, optional
+        Concurrency the full run would use.
+    expected_content, features, max_results, match_mode, router, files : optional
+        As for :func:`run_tagger`.
+
+    Returns
+    -------
+    estimator.Estimate
+        Estimated wall time, API calls, tokens and cost.
+    """
+
+    if not folder_id:
+        raise ValueError("folder_id is required")
+
+    expected_content = expected_content or []
+    features = normalize_features(features)
+    metrics = RunMetrics()
+    if files is None:
+        with metrics.timer('list_images'):
+            files = list_images(folder_id)
+    sample = sample_evenly(files, sample_size)
+    for file in sample:
+        with metrics.timer('image'):
+            tag_file(file, expected_content, features, max_results, metrics, match_mode, router)
+    list_pages = max(1, math.ceil(len(files) / LIST_PAGE_SIZE))
+    return tagging_estimate(files, sample, metrics, features, max_workers, list_pages)
+
+def default_run_id(sheet_id, folder_id):
+    """Return the queue run ID shared by every process tagging this folder."""
+
+    return f"{sheet_id}:{folder_id}"
+
+def enqueue_run(
+    queue,
+    sheet_id,
+    folder_id,
+    expected_content=None,
+    run_id=None,
+    features=DEFAULT_FEATURES,
+    max_results=None,
+    match_mode=DEFAULT_MATCH_MODE,
+    router=None,
+):
+    """List a Drive folder and enqueue one tagging task per image.
+
+    Parameters
+    ----------
+    queue : work_queue.WorkQueue
+        Queue shared by the coordinator and workers.
+    sheet_id : str | None
+        Destination Google Sheet ID, if results go to a sheet.
+    folder_id : str
+        Source Drive folder containing images.
+    expected_content : list[str] | None, optional
+        Stored with the run so workers classify with the same tags.
+    run_id : str | None, optional
+        Defaults to :func:`default_run_id`.
+    features, max_results, match_mode, router : optional
+        Tagging configuration stored with the run for every worker.
+
+    Returns
+    -------
+    str
+        The run ID.
+    """
+
+    if not folder_id:
+        raise ValueError("folder_id is required")
+
+    run_id = run_id or default_run_id(sheet_id, folder_id)
     files = list_images(folder_id)
-    for file in files:
-        labels, web_labels = analyze_image(file['id'])
+    queue.create_run(
+        run_id,
+        files,
+        params={
+            'sheet_id': sheet_id,
+            'folder_id': folder_id,
+            'expected_content': expected_content or [],
+            'features': list(normalize_features(features)),
+            'max_results': max_results,
+            'match_mode': match_mode,
+            'routing': router.settings() if router is not None else None,
+        },
+    )
+    return run_id
 
-        chat_result = chat_classify(
-            labels,
-            web_labels,
-            expected_content,
-        )
+def run_worker(queue, run_id, worker_id=None, wait=False, poll_interval=2.0):
+    """Lease and tag queued files until no work is left.
 
-        descriptors = ', '.join(chat_result.get("descriptors", []))
-        matched_content = chat_result.get("match_content", "unknown")
-        audience = chat_result.get("audience", "unknown")
-        product = chat_result.get("product", "unknown")
-        angle = chat_result.get("angle", "unknown")
-
-        rows.append([
-            file['name'],
-            file['webViewLink'],
-            ', '.join(labels),
-            ', '.join(web_labels),
-            descriptors,
-            matched_content,
-            audience,
-            product,
-            angle,
-        ])
-    write_to_sheet(sheet_id, rows)
+    Parameters
+    ----------
+    queue : work_queue.WorkQueue
+        Queue holding the run.
+    run_id : str
+        Run to work on.
+    worker_id : str | None, optional
+        Lease owner name. A random ID is used when omitted.
+    wait : bool, optional
+        Keep polling while other workers still hold leases, so tasks from a
+        crashed worker are picked up once their lease expires.
+    poll_interval : float, optional
+        Seconds between polls when ``wait`` is set.
+
+    Returns
+    -------
+    int
+        Number of tasks this worker completed.
+    """
+
+    params = queue.run_params(run_id)
+    expected_content = params.get('expected_content', [])
+    features = params.get('features') or DEFAULT_FEATURES
+    max_results = params.get('max_results')
+    match_mode = params.get('match_mode') or DEFAULT_MATCH_MODE
+    router = ModelRouter(**params['routing']) if params.get('routing') else None
+    completed = 0
+    while True:
+        task = queue.lease(run_id, worker_id)
+        if task is None:
+            if wait and not queue.is_finished(run_id):
+                time.sleep(poll_interval)
+                continue
+            return completed
+        try:
+            row = tag_file(
+                task['payload'], expected_content, features, max_results, None, match_mode, router
+            )
+        except Exception as e:
+            print(f"Failed to tag {task['payload'].get('name')}: {e}")
+            queue.fail(run_id, task, e)
+            continue
+        queue.complete(run_id, task, row)
+        completed += 1
+
+def merge_run(queue, run_id, sheet_id=None, output_path=None):
+    """Write a finished run's results to the sheet in folder order.
+
+    When ``output_path`` is given the rows are also written to that local
+    table.
+
+    Returns
+    -------
+    bool
+        ``True`` if rows were written, ``False`` if the run is unfinished or
+        was already merged.
+    """
+
+    if not queue.is_finished(run_id):
+        return False
+    params = queue.run_params(run_id)
+    sheet_id = sheet_id or params.get('sheet_id')
+    for payload, error in queue.failures(run_id):
+        print(f"Skipping {payload.get('name')}: {error}")
+    if not queue.mark_merged(run_id):
+        return False
+    header = header_for(params.get('features') or DEFAULT_FEATURES, bool(params.get('routing')))
+    rows = [header] + queue.results(run_id)
+    if output_path:
+        write_table(output_path, rows)
+    if sheet_id:
+        write_to_sheet(sheet_id, rows)
+    return True
 
 
 if __name__ == "__main__":
@@ -178,7 +878,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Tag images in a Drive folder and write results to a Google Sheet"
     )
-    parser.add_argument("sheet_id", help="Destination Google Sheet ID")
+    parser.add_argument(
+        "sheet_id",
+        help="Destination Google Sheet ID (pass '' to write only to --output)",
+    )
     parser.add_argument("folder_id", help="Source Google Drive folder ID")
     parser.add_argument(
         "-e",
@@ -188,5 +891,217 @@ if __name__ == "__main__":
         help="Additional expected content tags",
     )
 
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Also write rows to a local .csv, .jsonl or .parquet file as they are tagged",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Classify through the OpenAI Batch API (slow, but cheaper on quota)",
+    )
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        choices=sorted(VISION_FEATURES),
+        default=list(DEFAULT_FEATURES),
+        help="Vision features to request (web detection is the slow, expensive one)",
+    )
+    parser.add_argument(
+        "--max-results",
+        type=int,
+        help="Maximum Vision results per feature",
+    )
+    parser.add_argument(
+        "--match-mode",
+        choices=MATCH_MODES,
+        default=DEFAULT_MATCH_MODE,
+        help="Match expected content locally (no tokens), with the LLM, or locally with LLM fallback",
+    )
+    parser.add_argument(
+        "--route",
+        action="store_true",
+        help="Classify with rules, then a small model, escalating to a larger model when unsure",
+    )
+    parser.add_argument(
+        "--rules",
+        help="Rules table (.csv/.jsonl/.parquet with Keywords, Audience, Product, Angle) for --route",
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=DEFAULT_MIN_CONFIDENCE,
+        help="With --route, escalate small-model answers below this confidence",
+    )
+    parser.add_argument(
+        "--deadline",
+        action="append",
+        default=[],
+        metavar="STAGE=SECONDS",
+        help=(
+            "Per-call deadline for download, vision or classify "
+            f"(defaults: {', '.join(f'{k}={v:g}' for k, v in DEFAULT_DEADLINES.items())}; 0 disables)"
+        ),
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate Vision/OpenAI request once a call runs past the observed p95 latency",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Images to tag concurrently",
+    )
+    parser.add_argument(
+        "--max-inflight-mb",
+        type=float,
+        default=256,
+        help="Cap on image bytes held in memory across concurrent downloads",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Cache downloaded images here (keyed by file ID and md5Checksum)",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=2048,
+        help="Evict least recently used cached images above this size",
+    )
+    parser.add_argument(
+        "--queue",
+        help="Work queue database shared by coordinator and workers (path or sqlite:/// URL)",
+    )
+    parser.add_argument(
+        "--role",
+        choices=["coordinator", "enqueue", "worker", "merge"],
+        default="coordinator",
+        help="With --queue: enqueue only, work only, merge only, or all three (default)",
+    )
+    parser.add_argument("--run-id", help="Queue run ID (defaults to SHEET_ID:FOLDER_ID)")
+    parser.add_argument("--worker-id", help="Lease owner name for this process")
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=300,
+        help="Seconds before a crashed worker's task is handed to another worker",
+    )
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record Drive, Vision, Sheets and OpenAI responses with timings to this file",
+    )
+    cassette_group.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Serve API responses from a recorded cassette instead of the network",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        action="store_true",
+        help="With --replay, wait for each call's recorded duration",
+    )
+    parser.add_argument(
+        "--estimate",
+        nargs="?",
+        type=int,
+        const=DEFAULT_SAMPLE_SIZE,
+        metavar="SAMPLES",
+        help=(
+            "Tag a sample of images (default %(const)s) and print the estimated "
+            "duration, API calls and cost of the full run instead of running it"
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace (open in Perfetto or chrome://tracing) of the run's spans",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Sample all threads' stacks during the run and write folded stacks for a flamegraph",
+    )
+
     args = parser.parse_args()
-    run_tagger(args.sheet_id, args.folder_id, args.expected_content)
+    if args.estimate is not None and args.estimate < 1:
+        parser.error("--estimate needs a sample of at least 1 image")
+    if args.record:
+        use_cassette(args.record, 'record')
+    elif args.replay:
+        use_cassette(args.replay, 'replay', replay_latency=args.replay_latency)
+    if args.trace:
+        start_tracing()
+    profiler = SamplingProfiler().start() if args.profile else None
+    router = None
+    if args.route or args.rules:
+        router = ModelRouter(args.rules, min_confidence=args.min_confidence)
+    configure_image_cache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    configure_downloads(int(args.max_inflight_mb * 1024 * 1024))
+    deadlines = dict(DEFAULT_DEADLINES)
+    for item in args.deadline:
+        stage, _, seconds = item.partition("=")
+        if stage not in deadlines or not seconds:
+            parser.error(f"--deadline expects STAGE=SECONDS with STAGE in {', '.join(deadlines)}")
+        deadlines[stage] = float(seconds)
+    configure_calls(deadlines, args.hedge)
+    if args.estimate is not None:
+        estimate = estimate_run(
+            args.folder_id,
+            args.expected_content,
+            args.estimate,
+            args.workers,
+            args.features,
+            args.max_results,
+            args.match_mode,
+            router,
+        )
+        print(estimate.format_summary())
+    elif not args.queue:
+        run_tagger(
+            args.sheet_id,
+            args.folder_id,
+            args.expected_content,
+            args.output,
+            args.batch,
+            args.workers,
+            args.features,
+            args.max_results,
+            args.match_mode,
+            router,
+        )
+    else:
+        from work_queue import open_queue
+
+        queue = open_queue(args.queue, lease_seconds=args.lease_seconds)
+        run_id = args.run_id or default_run_id(args.sheet_id, args.folder_id)
+        if args.role in ("coordinator", "enqueue"):
+            enqueue_run(
+                queue,
+                args.sheet_id,
+                args.folder_id,
+                args.expected_content,
+                run_id,
+                args.features,
+                args.max_results,
+                args.match_mode,
+                router,
+            )
+        if args.role in ("coordinator", "worker"):
+            done = run_worker(queue, run_id, args.worker_id, wait=args.role == "coordinator")
+            print(f"Worker completed {done} task(s)")
+        if args.role in ("coordinator", "merge"):
+            if merge_run(queue, run_id, args.sheet_id, args.output):
+                print("Merged results into the sheet")
+            else:
+                print(f"Run not merged: {queue.counts(run_id)}")
+    stop_cassette()
+    if profiler:
+        profiler.stop()
+        profiler.write_folded(args.profile)
+    stop_tracing(args.trace)
@@ -0,0 +1,84 @@
+"""Per-run counters and latency stats for tagging and recipe runs."""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+def percentile(values, pct):
+    """Return the ``pct`` percentile (0-100) of ``values`` by nearest rank."""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class RunMetrics:
+    """Thread-safe collection of stage timings and counters for one run."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.timings.setdefault(stage, []).append(seconds)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, stage):
+        """Record the duration of the block under ``stage``."""
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - start)
+
+    def stage_stats(self, stage):
+        """Return ``count``, ``total``, ``mean``, ``p50`` and ``p95`` in seconds."""
+
+        with self._lock:
+            values = list(self.timings.get(stage, []))
+        return {
+            'count': len(values),
+            'total': sum(values),
+            'mean': sum(values) / len(values) if values else 0.0,
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+        }
+
+    def summary(self):
+        """Return all stats as a plain dict."""
+
+        with self._lock:
+            stages = list(self.timings)
+            counters = dict(self.counters)
+        return {
+            'wall_seconds': time.monotonic() - self.started,
+            'stages': {stage: self.stage_stats(stage) for stage in stages},
+            'counters': counters,
+        }
+
+    def format_summary(self):
+        """Return a human-readable multi-line report."""
+
+        summary = self.summary()
+        lines = [f"Wall time: {summary['wall_seconds']:.2f}s"]
+        for stage, stats in sorted(summary['stages'].items()):
+            lines.append(
+                f"{stage}: n={stats['count']} mean={stats['mean'] * 1000:.0f}ms "
+                f"p50={stats['p50'] * 1000:.0f}ms p95={stats['p95'] * 1000:.0f}ms "
+                f"total={stats['total']:.2f}s"
+            )
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f"{name}: {value}")
+        return '\n'.join(lines)
@@ -0,0 +1,181 @@
+"""Confidence-based routing of image classification across model tiers.
+
+Each image is classified by the cheapest tier that is confident about it:
+
+1. ``rules`` - an optional local rules table mapping Vision keywords to an
+   audience, product and angle. A rule applies when all of its keywords
+   are among the image's labels and no other equally specific rule
+   disagrees. No API call is made.
+2. The small model (``gpt-3.5-turbo`` by default), asked to report a
+   ``confidence`` score with its answer.
+3. The large model (``gpt-4-turbo`` by default), used only when the small
+   model's confidence is below ``min_confidence`` or it left the audience,
+   product or angle unknown.
+
+The tier that produced each result is stored under ``"model"`` and counted
+in the run metrics as ``route[<tier>]``.
+"""
+
+from chat_classifier import DEFAULT_MATCH_MODE, DEFAULT_MODEL, chat_classify
+from content_matcher import match_content
+from local_store import read_table
+from prompt_budget import compact_labels
+
+RULES_TIER = "rules"
+SMALL_MODEL = DEFAULT_MODEL
+LARGE_MODEL = "gpt-4-turbo"
+DEFAULT_MIN_CONFIDENCE = 0.7
+
+# Number of top labels used as descriptors for rule-classified images.
+RULE_DESCRIPTORS = 5
+
+
+def load_rules(path):
+    """Read rules from a ``.csv``, ``.jsonl`` or ``.parquet`` table.
+
+    The table needs ``Keywords`` (comma separated), ``Audience``,
+    ``Product`` and ``Angle`` columns.
+
+    Returns
+    -------
+    list[dict]
+        Rules with a ``keywords`` set and the three classification fields.
+    """
+
+    rules = []
+    for record in read_table(path).to_dict('records'):
+        keywords = {k.strip().casefold() for k in str(record.get('Keywords', '')).split(',') if k.strip()}
+        if keywords:
+            rules.append({
+                'keywords': keywords,
+                'audience': record.get('Audience', '') or 'unknown',
+                'product': record.get('Product', '') or 'unknown',
+                'angle': record.get('Angle', '') or 'unknown',
+            })
+    return rules
+
+
+def _label_terms(labels):
+    terms = set()
+    for label in labels:
+        label = label.casefold()
+        terms.add(label)
+        terms.update(label.split())
+    return terms
+
+
+def needs_escalation(result, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """Return whether a model result is too unsure to keep."""
+
+    for field in ('audience', 'product', 'angle'):
+        if str(result.get(field, '')).strip().lower() in ('', 'unknown'):
+            return True
+    try:
+        return float(result.get('confidence', 0)) < min_confidence
+    except (TypeError, ValueError):
+        return True
+
+
+class ModelRouter:
+    """Route classifications through rules, a small model and a large model.
+
+    Parameters
+    ----------
+    rules_path : str | None, optional
+        Rules table for the local tier; see :func:`load_rules`.
+    small_model, large_model : str, optional
+        Chat models for the second and third tiers.
+    min_confidence : float, optional
+        Small-model results below this confidence are escalated.
+    """
+
+    def __init__(
+        self,
+        rules_path=None,
+        small_model=SMALL_MODEL,
+        large_model=LARGE_MODEL,
+        min_confidence=DEFAULT_MIN_CONFIDENCE,
+    ):
+        self.rules_path = rules_path
+        self.small_model = small_model
+        self.large_model = large_model
+        self.min_confidence = min_confidence
+        self.rules = load_rules(rules_path) if rules_path else []
+
+    def settings(self):
+        """Return constructor arguments, e.g. to store with a queued run."""
+
+        return {
+            'rules_path': self.rules_path,
+            'small_model': self.small_model,
+            'large_model': self.large_model,
+            'min_confidence': self.min_confidence,
+        }
+
+    def match_rules(self, labels, web_labels, expected_content=None):
+        """Classify from the rules table, or return ``None`` if no rule is sure."""
+
+        if not self.rules:
+            return None
+        terms = _label_terms(list(labels) + list(web_labels))
+        matched = [rule for rule in self.rules if rule['keywords'] <= terms]
+        if not matched:
+            return None
+        best = max(len(rule['keywords']) for rule in matched)
+        outcomes = {
+            (rule['audience'], rule['product'], rule['angle'])
+            for rule in matched
+            if len(rule['keywords']) == best
+        }
+        if len(outcomes) > 1:
+            return None
+        audience, product, angle = outcomes.pop()
+        return {
+            'audience': audience,
+            'product': product,
+            'angle': angle,
+            'descriptors': compact_labels(labels, RULE_DESCRIPTORS),
+            'match_content': match_content(labels, web_labels, expected_content or []),
+            'confidence': 1.0,
+        }
+
+    def needs_escalation(self, result):
+        return needs_escalation(result, self.min_confidence)
+
+    def classify(
+        self,
+        labels,
+        web_labels,
+        expected_content=None,
+        match_mode=DEFAULT_MATCH_MODE,
+        metrics=None,
+    ):
+        """Classify with the cheapest confident tier.
+
+        Returns
+        -------
+        dict
+            A :func:`chat_classifier.chat_classify` result plus ``"model"``,
+            the tier that produced it.
+        """
+
+        result = self.match_rules(labels, web_labels, expected_content)
+        tier = RULES_TIER
+        if result is None:
+            tier = self.small_model
+            result = chat_classify(
+                labels, web_labels, expected_content, match_mode, metrics,
+                model=self.small_model, include_confidence=True,
+            )
+            if self.needs_escalation(result):
+                if metrics is not None:
+                    metrics.incr('route_escalations')
+                tier = self.large_model
+                result = chat_classify(
+                    labels, web_labels, expected_content, match_mode, metrics,
+                    model=self.large_model, include_confidence=True,
+                )
+        if metrics is not None:
+            metrics.incr(f'route[{tier}]')
+        result['model'] = tier
+        return result
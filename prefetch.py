@@ -0,0 +1,84 @@
+"""Background prefetching of run inputs.
+
+The Streamlit app knows the sheet and folder IDs long before the run
+button is pressed. :class:`Prefetcher` starts fetching the folder listing,
+tagged-asset sheet or brand row as soon as an ID is entered, so the run can
+pick up the result (or wait for the rest of an in-flight fetch) instead of
+starting every run with serial Sheets and Drive calls.
+
+Fetches are keyed by kind and ID; entering a new ID starts a new fetch and
+earlier results are kept until :meth:`Prefetcher.clear` is called.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Run fetches in background threads and hand out their results.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Fetches running at the same time.
+    """
+
+    def __init__(self, max_workers=4):
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='prefetch')
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def start(self, kind, key, fn):
+        """Start ``fn()`` for ``(kind, key)`` unless it is already running or done.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The fetch for ``(kind, key)``.
+        """
+
+        with self._lock:
+            future = self._futures.get((kind, key))
+            if future is None:
+                future = self._pool.submit(fn)
+                self._futures[(kind, key)] = future
+            return future
+
+    def status(self, kind, key):
+        """Return ``(state, value)`` for a fetch.
+
+        ``state`` is ``"missing"``, ``"running"``, ``"done"`` (``value`` is
+        the result) or ``"failed"`` (``value`` is the exception).
+        """
+
+        with self._lock:
+            future = self._futures.get((kind, key))
+        if future is None:
+            return 'missing', None
+        if not future.done():
+            return 'running', None
+        if future.exception() is not None:
+            return 'failed', future.exception()
+        return 'done', future.result()
+
+    def take(self, kind, key, timeout=None):
+        """Return the fetched value, waiting up to ``timeout`` seconds.
+
+        Returns ``None`` when no fetch was started, it failed, or it did not
+        finish in time, so the caller falls back to fetching itself.
+        """
+
+        with self._lock:
+            future = self._futures.get((kind, key))
+        if future is None:
+            return None
+        try:
+            return future.result(timeout)
+        except Exception:
+            return None
+
+    def clear(self):
+        """Forget all fetches, e.g. after the underlying data has changed."""
+
+        with self._lock:
+            self._futures.clear()
@@ -0,0 +1,131 @@
+"""Prompt compaction and token budgeting.
+
+Vision returns labels and web entities in score order, often with
+duplicates across the two lists, blank entity names and long titles.
+:func:`compact_labels` normalizes whitespace, truncates long names, drops
+blanks and case-insensitive duplicates and keeps the top-scoring entries;
+:func:`fit_to_budget` then drops the lowest-ranked labels until a prompt
+fits a token budget. :func:`strip_decorations` removes emoji and empty
+fields from templated prompts.
+
+Tokens are counted with ``tiktoken`` when it is installed (and its
+encoding is available offline); otherwise :func:`count_tokens` falls back
+to a conservative local estimate.
+"""
+
+import math
+import re
+from functools import lru_cache
+
+MAX_LABEL_CHARS = 40
+
+_WS = re.compile(r"\s+")
+_PIECES = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+_DECORATION = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\uFE0F\u200D]")
+_EMPTY_FIELD = re.compile(r"[\w ]+:")
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The encoding file could not be loaded (e.g. offline).
+        return None
+
+
+def estimate_tokens(text):
+    """Estimate BPE tokens: ~4 characters per word piece, 1 per symbol,
+    2 per non-ASCII character."""
+
+    total = 0
+    for piece in _PIECES.findall(text):
+        if piece.isascii():
+            total += math.ceil(len(piece) / 4) if piece.isalnum() else 1
+        else:
+            total += 2
+    return total
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Return the number of tokens ``text`` takes for ``model``."""
+
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def normalize_label(label, max_chars=MAX_LABEL_CHARS):
+    """Collapse whitespace and cut ``label`` to ``max_chars`` at a word boundary."""
+
+    text = _WS.sub(" ", str(label or "")).strip()
+    if len(text) > max_chars:
+        text = text[:max_chars].rsplit(" ", 1)[0] or text[:max_chars]
+    return text
+
+
+def compact_labels(labels, limit=None, seen=None):
+    """Return normalized, de-duplicated ``labels``, at most ``limit`` of them.
+
+    ``labels`` must be in Vision score order; the first entries are kept.
+    Pass the same ``seen`` set for several lists to de-duplicate across them.
+    """
+
+    seen = set() if seen is None else seen
+    compacted = []
+    for label in labels:
+        if limit is not None and len(compacted) >= limit:
+            break
+        text = normalize_label(label)
+        key = text.casefold()
+        if not text or key in seen:
+            continue
+        seen.add(key)
+        compacted.append(text)
+    return compacted
+
+
+def fit_to_budget(labels, web_labels, render, budget, model="gpt-3.5-turbo"):
+    """Drop the lowest-ranked labels until ``render(labels, web_labels)`` fits.
+
+    Labels are removed from the end of whichever list is longer. The prompt
+    is returned as-is if it cannot fit even with no labels.
+
+    Returns
+    -------
+    tuple[list[str], list[str], int]
+        The kept labels and web labels, and the prompt's token count.
+    """
+
+    labels, web_labels = list(labels), list(web_labels)
+    tokens = count_tokens(render(labels, web_labels), model)
+    while budget and tokens > budget and (labels or web_labels):
+        if len(web_labels) >= len(labels):
+            web_labels.pop()
+        else:
+            labels.pop()
+        tokens = count_tokens(render(labels, web_labels), model)
+    return labels, web_labels, tokens
+
+
+def strip_decorations(text, drop_empty=True):
+    """Remove emoji, collapse spaces and drop ``Field:`` lines with no value.
+
+    Pass ``drop_empty=False`` to keep bare ``Field:`` lines, e.g. when they
+    are a template the model must follow.
+    """
+
+    lines = []
+    for line in text.splitlines():
+        line = _WS.sub(" ", _DECORATION.sub("", line)).strip()
+        if line and not (drop_empty and _EMPTY_FIELD.fullmatch(line)):
+            lines.append(line)
+    return "\n".join(lines)
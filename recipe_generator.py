@@ -1,11 +1,28 @@
+import hashlib
+import json
 import openai
 import os
 import random
+import re
+import tempfile
+import time
 import pandas as pd
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from asset_index import AssetIndex, asset_field
+from batch_api import run_batch
+from hedging import guarded, timeout_kwargs
+from cassette import recorded, recorded_stream
+from estimator import DEFAULT_SAMPLE_SIZE, recipe_estimate
+from local_store import append_table, read_table, write_table
+from metrics import RunMetrics
+from prompt_budget import compact_labels, count_tokens, strip_decorations
+from tracing import span
 # Configure basic logging
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
@@ -19,11 +36,10 @@ SCOPES = [
 LAYOUT_COPY_SHEET_ID = "1M_-6UqmSE8yAlaSQl3EoGRZfdkzklb0Qpy2wwJmYq8E"
 """Utilities for generating ad recipes from tagged assets.
 
-This module assumes the tagged assets sheet includes the legacy
-``Matched Audience``, ``Matched Product`` and ``Matched Angle`` columns.
-If these columns are missing (e.g., when using the simplified tagging
-output from :func:`run_tagger`), the generated recipes may be incomplete
-or inaccurate.
+Tagged assets may use the legacy ``Matched Audience``, ``Matched Product``
+and ``Matched Angle`` columns or the ``Audience``, ``Product`` and
+``Angle`` columns written by :func:`run_tagger`; see
+:func:`asset_index.asset_field`.
 """
 def get_google_service(service_account_info):
     credentials = service_account.Credentials.from_service_account_info(
@@ -32,10 +48,15 @@ def get_google_service(service_account_info):
     drive = build('drive', 'v3', credentials=credentials)
     return sheets, drive
 def read_sheet(service, spreadsheet_id, sheet_name):
-    result = service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id,
-        range=sheet_name,
-    ).execute()
+    with span("read_sheet", sheet=sheet_name):
+        result = recorded(
+            'sheets.values.get',
+            [spreadsheet_id, sheet_name],
+            lambda: service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=sheet_name,
+            ).execute(),
+        )
     rows = result.get("values", [])
     if not rows:
         return pd.DataFrame()
@@ -50,21 +71,53 @@ def read_sheet(service, spreadsheet_id, sheet_name):
         padded_rows.append(row)
 
     return pd.DataFrame(padded_rows[1:], columns=padded_rows[0])
+def load_table(service, path, spreadsheet_id, sheet_name):
+    """Read a table from a local file when ``path`` is set, else from the sheet."""
+    if path:
+        return read_table(path)
+    return read_sheet(service, spreadsheet_id, sheet_name)
 def get_asset_link(drive_service, file_name, folder_id):
     query = f"name = '{file_name}' and '{folder_id}' in parents and mimeType contains 'image/'"
-    try:
-        results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get('files', [])
-        if not files:
-            return "NOT FOUND"
-        return f"https://drive.google.com/uc?id={files[0]['id']}"
-    except HttpError:
+    def list_files():
+        # Handled inside the recording so a replay returns the same sentinel.
+        try:
+            return drive_service.files().list(q=query, fields="files(id, name)").execute()
+        except HttpError:
+            return None
+    with span("get_asset_link", file_name=file_name):
+        results = recorded('drive.files.list', [query, "files(id, name)"], list_files)
+    if results is None:
         return "ERROR LINKING FILE"
+    files = results.get('files', [])
+    if not files:
+        return "NOT FOUND"
+    return f"https://drive.google.com/uc?id={files[0]['id']}"
+def asset_links_by_name(files):
+    """Map image names in a folder listing to their Drive links.
+
+    The first file with a name wins, as with :func:`get_asset_link`.
+    """
+    links = {}
+    for file in files:
+        links.setdefault(file.get("name"), f"https://drive.google.com/uc?id={file['id']}")
+    return links
 def choose_assets(tagged_assets, count=1):
-    candidates = [a for a in tagged_assets if a.get('Matched Audience', '').lower() != 'unknown']
+    candidates = [a for a in tagged_assets if asset_field(a, 'audience').lower() != 'unknown']
     if len(candidates) < count:
         return [], True
     return random.sample(candidates, count), False
+def choose_indexed_assets(asset_index, source, count=1, *, audience=None, angle=None):
+    """Pick assets from an :class:`asset_index.AssetIndex`, preferring matches
+    for the recipe's audience and angle."""
+    selected = asset_index.query(
+        source,
+        count,
+        audiences=[audience] if audience else None,
+        angles=[angle] if angle else None,
+    )
+    if len(selected) < count:
+        return [], True
+    return selected, False
 def choose_recipe_components(layouts_df, copy_df):
     layout = layouts_df.sample(1).iloc[0].to_dict()
     copy_format = copy_df.sample(1).iloc[0].to_dict()
@@ -72,93 +125,373 @@ def choose_recipe_components(layouts_df, copy_df):
 def get_brand_profile(brand_df, brand_code):
     profile = brand_df[brand_df['Brand Code'] == brand_code]
     return profile.iloc[0].to_dict() if not profile.empty else {}
-def generate_recipe_copy(asset, layout, copy_format, brand, *, audience=None, angle=None, offer=None):
+# Descriptors kept in the copy prompt, in tagging order.
+MAX_COPY_DESCRIPTORS = 10
+# Recipes per request in multi-recipe copy mode.
+MULTI_COPY_SIZE = 10
+def _copy_prefix(copy_format, brand):
+    """Return the raw and compacted prompt part fixed for a brand and copy format.
+
+    The Prompt Style is passed through untouched: bare ``Label:`` lines are
+    the structure the copy must follow, not empty fields.
+    """
     style = copy_format.get("Prompt Style", "").strip()
-    if not style:
-        style = "⚠️"
-    product = asset.get("Matched Product")
-    audience = audience if audience is not None else asset.get("Matched Audience")
-    angle = angle if angle is not None else asset.get("Matched Angle")
-    descriptors = asset.get("Descriptors", "")
     tone = brand.get("Copy Tone", "neutral")
     brand_name = brand.get("Brand Name", "")
-    prompt = f"""
+    head = f"""
 You're an expert Meta ad copywriter. Generate in ad copy that matches the following structure and purpose:
 🏢 Brand: {brand_name}
-📌 Layout: {layout.get('Name')} — {layout.get('Use Case')}
+🗣 Tone: {tone}
 🖋 Copy Format: {copy_format.get('Name')} — {copy_format.get('Use Case')}
 ✍️ You MUST format the ad using this structure — do not deviate:
-{style}
+"""
+    tail = "Return only the finished ad copy. Do not include hashtags or Emojis."
+    raw = f"{head.strip()}\n{style or '⚠️'}\n{tail}"
+    compact = [strip_decorations(head, drop_empty=False), style, tail]
+    return raw, "\n".join(["You are a brilliant ad copywriter."] + [part for part in compact if part])
+def _recipe_brief(asset, layout, *, audience=None, angle=None, offer=None):
+    """Return the raw and compacted per-recipe prompt part."""
+    product = asset_field(asset, "product")
+    audience = audience if audience is not None else asset_field(asset, "audience")
+    angle = angle if angle is not None else asset_field(asset, "angle")
+    raw_descriptors = asset.get("Descriptors", "")
+    descriptors = ", ".join(
+        compact_labels(str(raw_descriptors).split(","), MAX_COPY_DESCRIPTORS)
+    )
+    def render(descriptors):
+        return f"""
+📌 Layout: {layout.get('Name')} — {layout.get('Use Case')}
 🏷 Audience: {audience}
 📦 Product: {product}
 💡 Angle: {angle}
 🎁 Offer: {offer or ''}
 🎯 Descriptors: {descriptors}
-🗣 Tone: {tone}
-Return only the finished ad copy. Do not include hashtags or Emojis.
 """
-    logger.debug("=== PROMPT SENT TO GPT ===\n%s", prompt)
+    return render(raw_descriptors).strip(), strip_decorations(render(descriptors))
+def _count_prompt(metrics, raw_parts, messages, model):
+    if metrics is None:
+        return
+    tokens = sum(count_tokens(m["content"], model) for m in messages)
+    metrics.incr("prompt_tokens", tokens)
+    metrics.incr("prompt_tokens_saved", count_tokens("\n".join(raw_parts), model) - tokens)
+def _prompt_cache_key(system):
+    return "recipe-copy-" + hashlib.sha1(system.encode("utf-8")).hexdigest()[:16]
+def build_recipe_copy_request(
+    asset, layout, copy_format, brand, *, audience=None, angle=None, offer=None, metrics=None
+):
+    """Return the chat completion arguments for one recipe's ad copy.
+
+    The prompt is laid out for provider-side prompt caching: the system
+    message holds everything fixed for a brand and copy format (instructions,
+    brand, tone and the copy structure) and the user message holds the
+    per-recipe layout, audience, product, angle, offer and descriptors, so
+    recipes sharing a brand and copy format send an identical prefix. The
+    prefix hash is passed as ``prompt_cache_key`` to keep those requests on
+    the same cache.
+
+    Both parts are compacted with :func:`prompt_budget.strip_decorations`
+    (no emoji; empty fields are dropped from the per-recipe part only, the
+    Prompt Style is kept as written) and descriptors are de-duplicated.
+    ``metrics`` receives ``prompt_tokens`` and ``prompt_tokens_saved``
+    counters.
+    """
+    raw_prefix, system = _copy_prefix(copy_format, brand)
+    raw_brief, prompt = _recipe_brief(asset, layout, audience=audience, angle=angle, offer=offer)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt}
+    ]
+    _count_prompt(metrics, [raw_prefix, raw_brief], messages, "gpt-4-turbo")
+    logger.debug("=== PROMPT SENT TO GPT ===\n%s\n%s", system, prompt)
+    return {
+        "model": "gpt-4-turbo",
+        "messages": messages,
+        "temperature": 0.7,
+        "prompt_cache_key": _prompt_cache_key(system),
+    }
+def build_multi_copy_request(items, copy_format, brand, *, metrics=None):
+    """Return chat completion arguments asking for several recipes' copy at once.
+
+    ``items`` is a list of ``(ad_id, asset, layout, copy_kwargs)`` sharing
+    ``copy_format`` and ``brand``. The system message is the same cacheable
+    prefix as :func:`build_recipe_copy_request`; the reply is a JSON object
+    ``{"copies": [{"id": ..., "copy": ...}, ...]}``.
+    """
+    raw_prefix, system = _copy_prefix(copy_format, brand)
+    raw_parts = [raw_prefix]
+    briefs = []
+    for ad_id, asset, layout, copy_kwargs in items:
+        raw_brief, brief = _recipe_brief(
+            asset,
+            layout,
+            audience=copy_kwargs.get("audience"),
+            angle=copy_kwargs.get("angle"),
+            offer=copy_kwargs.get("offer"),
+        )
+        raw_parts.append(raw_brief)
+        briefs.append(f"Ad {ad_id}:\n{brief}")
+    prompt = (
+        f"Write one ad for each of the {len(items)} ads below, each following the structure above.\n\n"
+        + "\n\n".join(briefs)
+        + '\n\nReturn a JSON object: {"copies": [{"id": "<ad id>", "copy": "<finished ad copy>"}, ...]} '
+        "with one entry per ad, in the same order."
+    )
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt}
+    ]
+    _count_prompt(metrics, raw_parts, messages, "gpt-4-turbo")
+    return {
+        "model": "gpt-4-turbo",
+        "messages": messages,
+        "temperature": 0.7,
+        "response_format": {"type": "json_object"},
+        "prompt_cache_key": _prompt_cache_key(system),
+    }
+_STYLE_LABEL = re.compile(r"^\s*([A-Za-z][A-Za-z /&-]{0,30}):", re.MULTILINE)
+def copy_follows_format(text, copy_format):
+    """Check generated copy against the copy format.
+
+    The copy must be non-empty, and every ``Label:`` that starts a line of
+    the format's ``Prompt Style`` (e.g. ``Headline:``) must appear in it.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return False
+    labels = _STYLE_LABEL.findall(copy_format.get("Prompt Style", "") or "")
+    lowered = text.lower()
+    return all(f"{label.strip().lower()}:" in lowered for label in labels)
+def parse_multi_copy(content, ad_ids, copy_format):
+    """Return ``{ad_id: copy}`` for the valid entries of a multi-copy reply."""
+    try:
+        entries = json.loads(content).get("copies", [])
+    except (ValueError, AttributeError):
+        return {}
+    copies = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        ad_id = str(entry.get("id", ""))
+        text = entry.get("copy")
+        if ad_id in ad_ids and ad_id not in copies and copy_follows_format(text, copy_format):
+            copies[ad_id] = clean_copy(text)
+    return copies
+def generate_multi_copy(items, copy_format, brand, *, metrics=None):
+    """Generate copy for ``items`` (see :func:`build_multi_copy_request`) in one call.
+
+    Returns
+    -------
+    dict[str, str]
+        Valid copy by ad ID. Ads that are missing, malformed or do not
+        follow the copy format are left out, for the caller to retry singly.
+    """
+    request = build_multi_copy_request(items, copy_format, brand, metrics=metrics)
     client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+    def complete():
+        response = client.chat.completions.create(**request, **timeout_kwargs("recipe_copy"))
+        return {
+            "content": response.choices[0].message.content,
+            "usage": usage_counts(getattr(response, "usage", None)),
+        }
     try:
-        response = client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[
-                {"role": "system", "content": "You are a brilliant ad copywriter."},
-                {"role": "user", "content": prompt.strip()}
-            ],
-            temperature=0.7,
-        )
-        return response.choices[0].message.content.strip().strip('"').strip("\'")
+        with span("generate_multi_copy", model=request["model"], count=len(items)):
+            reply = guarded(
+                "recipe_copy",
+                lambda: recorded('openai.recipe_copy_multi', request, complete),
+                metrics,
+            )
+    except Exception as e:
+        logger.warning("Multi-recipe copy failed for %d ads: %s", len(items), e)
+        return {}
+    record_usage(metrics, reply["usage"])
+    return parse_multi_copy(reply["content"], {item[0] for item in items}, copy_format)
+def usage_counts(usage):
+    """Return prompt, cached prompt and completion token counts from a response's ``usage``."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+def record_usage(metrics, usage):
+    """Count a ``copy_requests`` reply and add its API-reported ``api_prompt_tokens``,
+    ``cached_prompt_tokens`` and ``api_completion_tokens`` to ``metrics``."""
+    if metrics is None:
+        return
+    metrics.incr("copy_requests")
+    if usage:
+        metrics.incr("api_prompt_tokens", usage["prompt_tokens"])
+        metrics.incr("cached_prompt_tokens", usage["cached_tokens"])
+        # Cassettes recorded before completion counts were kept lack the key.
+        metrics.incr("api_completion_tokens", usage.get("completion_tokens", 0))
+def clean_copy(text):
+    return text.strip().strip('"').strip("\'")
+def generate_recipe_copy(
+    asset, layout, copy_format, brand, *, audience=None, angle=None, offer=None, metrics=None
+):
+    request = build_recipe_copy_request(
+        asset, layout, copy_format, brand,
+        audience=audience, angle=angle, offer=offer, metrics=metrics,
+    )
+    client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+    def complete():
+        response = client.chat.completions.create(**request, **timeout_kwargs("recipe_copy"))
+        return {
+            "content": response.choices[0].message.content,
+            "usage": usage_counts(getattr(response, "usage", None)),
+        }
+    try:
+        with span("generate_recipe_copy", model=request["model"]):
+            reply = guarded(
+                "recipe_copy", lambda: recorded('openai.recipe_copy', request, complete), metrics
+            )
+        record_usage(metrics, reply["usage"])
+        return clean_copy(reply["content"])
     except Exception as e:
         return f"ERROR: {e}"
-def generate_recipes(
-    sheet_id,
-    service_account_info,
+def stream_recipe_copy(
+    asset, layout, copy_format, brand, *, audience=None, angle=None, offer=None, metrics=None
+):
+    """Yield ad copy text fragments as the model produces them.
+
+    Takes the same arguments as :func:`generate_recipe_copy`. Errors are
+    raised rather than returned; pass the joined text to :func:`clean_copy`
+    once the stream ends.
+    """
+    request = build_recipe_copy_request(
+        asset, layout, copy_format, brand,
+        audience=audience, angle=angle, offer=offer, metrics=metrics,
+    )
+    def deltas():
+        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        with span("generate_recipe_copy", model=request["model"], stream=True):
+            stream = client.chat.completions.create(
+                **request,
+                stream=True,
+                stream_options={"include_usage": True},
+                **timeout_kwargs("recipe_copy"),
+            )
+            for chunk in stream:
+                # The final chunk carries usage and no choices.
+                if getattr(chunk, "usage", None):
+                    record_usage(metrics, usage_counts(chunk.usage))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+    yield from recorded_stream('openai.recipe_copy.stream', request, deltas)
+RECIPE_HEADER = [
+    "Ad id",
+    "Layout",
+    "Copy Format",
+    "Audience",
+    "Product",
+    "Angle",
+    "Offer",
+    "Asset 1 Link",
+    "Asset 2 Link",
+    "Copy",
+    "Notes",
+]
+def load_reference_tables(
+    sheets_service,
+    brand_sheet_id,
+    *,
+    layouts_path=None,
+    copy_formats_path=None,
+    brands_path=None,
+    include_brands=True,
+):
+    """Load the layout, copy format and brand tables shared by every brand."""
+    tables = {
+        "layouts": load_table(sheets_service, layouts_path, LAYOUT_COPY_SHEET_ID, 'layouts'),
+        "copy_formats": load_table(sheets_service, copy_formats_path, LAYOUT_COPY_SHEET_ID, 'copy_formats'),
+    }
+    if include_brands:
+        tables["brands"] = load_table(sheets_service, brands_path, brand_sheet_id, 'brands')
+    return tables
+def load_tagged_assets(sheets_service, sheet_id, assets_path=None, asset_index=None, refresh_index=False):
+    """Return ``(source, tagged_assets)`` for a tagged-asset table.
+
+    When ``asset_index`` already holds ``source`` the table is not read and
+    ``tagged_assets`` is ``None``; callers then select from the index.
+    """
+    source = assets_path or sheet_id
+    if asset_index is not None and not refresh_index and asset_index.has_source(source):
+        return source, None
+    asset_df = load_table(sheets_service, assets_path, sheet_id, 'Sheet1')
+    tagged_assets = asset_df.to_dict(orient='records')
+    if asset_index is not None:
+        asset_index.load(source, tagged_assets)
+    return source, tagged_assets
+def build_recipe_rows(
+    drive_service,
     folder_id,
     brand_code,
-    brand_sheet_id,
+    brand,
+    layouts_df,
+    copy_df,
+    tagged_assets,
     num_recipes=10,
     *,
     angles=None,
     audiences=None,
     offers=None,
-    selected_layouts=None,
-    selected_copy_formats=None,
+    asset_index=None,
+    asset_source=None,
+    copy_requests=None,
+    on_progress=None,
+    metrics=None,
+    copy_batch_size=None,
+    start=1,
+    files=None,
 ):
-    if not sheet_id or not folder_id or not brand_sheet_id:
-        raise ValueError("sheet_id, folder_id, and brand_sheet_id are required")
+    """Plan ``num_recipes`` recipes and generate their copy.
 
-    sheets_service, drive_service = get_google_service(service_account_info)
-    # Load all relevant sheets
-    layouts_df = read_sheet(sheets_service, LAYOUT_COPY_SHEET_ID, 'layouts')
-    copy_df = read_sheet(sheets_service, LAYOUT_COPY_SHEET_ID, 'copy_formats')
+    Ad ids are numbered from ``start`` (``<brand code>-P001`` by default).
 
-    if selected_layouts:
-        layouts_df = layouts_df[layouts_df['Name'].isin(selected_layouts)]
-    if selected_copy_formats:
-        copy_df = copy_df[copy_df['Name'].isin(selected_copy_formats)]
-    asset_df = read_sheet(sheets_service, sheet_id, 'Sheet1')
-    brand_df = read_sheet(sheets_service, brand_sheet_id, 'brands')
-    brand = get_brand_profile(brand_df, brand_code)
-    tagged_assets = asset_df.to_dict(orient='records')
-    output = [[
-        "Ad id",
-        "Layout",
-        "Copy Format",
-        "Audience",
-        "Product",
-        "Angle",
-        "Offer",
-        "Asset 1 Link",
-        "Asset 2 Link",
-        "Copy",
-        "Notes",
-    ]]
+    Asset links are looked up by image name in ``files`` (the folder's
+    ``main_tagger.list_images`` result) when given, instead of one Drive
+    query per asset with :func:`get_asset_link`; names missing from the
+    listing are still queried.
+
+    When ``on_progress`` is given, copy is streamed with
+    :func:`stream_recipe_copy` and ``on_progress(output)`` is called with the
+    rows so far each time a recipe is added or its copy grows.
+
+    When ``copy_requests`` is a list, copy is not generated; instead
+    ``(row_index, ad_id, request)`` tuples are appended to it and the Copy
+    cell is left blank for :func:`fill_batch_copy`.
+
+    With ``copy_batch_size`` above 1, copy is generated after planning,
+    ``copy_batch_size`` recipes per request, by :func:`fill_multi_copy`.
+
+    ``metrics`` (a :class:`metrics.RunMetrics`) receives prompt token counts
+    and ``asset_link_queries``, the Drive lookups made for asset links.
+
+    Returns
+    -------
+    list[list[str]]
+        Output rows, starting with :data:`RECIPE_HEADER`.
+    """
+    output = [list(RECIPE_HEADER)]
+    links_by_name = asset_links_by_name(files) if files is not None else None
+    multi_copy = copy_requests is None and copy_batch_size and copy_batch_size > 1
+    deferred = []
     for i in range(num_recipes):
         layout, copy_format = choose_recipe_components(layouts_df, copy_df)
-        ad_id = f"{brand_code}-P{i+1:03d}"
+        ad_id = f"{brand_code}-P{start + i:03d}"
         asset_count = int(layout.get("Asset Count", "1"))
-        selected_assets, needs_generation = choose_assets(tagged_assets, asset_count)
+        chosen_audience = random.choice(audiences) if audiences else None
+        chosen_angle = random.choice(angles) if angles else None
+        if asset_index is not None:
+            selected_assets, needs_generation = choose_indexed_assets(
+                asset_index, asset_source, asset_count, audience=chosen_audience, angle=chosen_angle
+            )
+        else:
+            selected_assets, needs_generation = choose_assets(tagged_assets, asset_count)
         if needs_generation:
             output.append([
                 ad_id,
@@ -169,32 +502,46 @@ def generate_recipes(
                 "ASSET NOT FOUND — RECOMMEND GENERATION",
                 f"No available tagged assets for layout requiring {asset_count} image(s)."
             ])
+            if on_progress:
+                on_progress(output)
             continue
         # Extract key info
-        links = [get_asset_link(drive_service, a.get("Image Name"), folder_id) for a in selected_assets]
+        links = []
+        for a in selected_assets:
+            link = links_by_name.get(a.get("Image Name")) if links_by_name is not None else None
+            if link is None:
+                if metrics is not None:
+                    metrics.incr("asset_link_queries")
+                link = get_asset_link(drive_service, a.get("Image Name"), folder_id)
+            links.append(link)
         first_asset = selected_assets[0]
-        chosen_audience = (
-            random.choice(audiences) if audiences else first_asset.get("Matched Audience", "")
-        )
-        chosen_angle = (
-            random.choice(angles) if angles else first_asset.get("Matched Angle", "")
-        )
+        if chosen_audience is None:
+            chosen_audience = asset_field(first_asset, "audience")
+        if chosen_angle is None:
+            chosen_angle = asset_field(first_asset, "angle")
         chosen_offer = random.choice(offers) if offers else ""
-        ad_copy = generate_recipe_copy(
-            first_asset,
-            layout,
-            copy_format,
-            brand,
-            audience=chosen_audience,
-            angle=chosen_angle,
-            offer=chosen_offer,
-        )
+        copy_args = (first_asset, layout, copy_format, brand)
+        copy_kwargs = {"audience": chosen_audience, "angle": chosen_angle, "offer": chosen_offer}
+        if metrics is not None:
+            copy_kwargs["metrics"] = metrics
+        if copy_requests is not None:
+            copy_requests.append(
+                (len(output), ad_id, build_recipe_copy_request(*copy_args, **copy_kwargs))
+            )
+            ad_copy = ""
+        elif multi_copy:
+            deferred.append((len(output), ad_id, copy_args, copy_kwargs))
+            ad_copy = ""
+        elif on_progress:
+            ad_copy = ""  # streamed in below
+        else:
+            ad_copy = generate_recipe_copy(*copy_args, **copy_kwargs)
         output.append([
             ad_id,
             layout.get("Name"),
             copy_format.get("Name"),
             chosen_audience,
-            first_asset.get("Matched Product", ""),
+            asset_field(first_asset, "product"),
             chosen_angle,
             chosen_offer,
             links[0] if len(links) > 0 else "",
@@ -202,23 +549,561 @@ def generate_recipes(
             ad_copy,
             ""
         ])
+        if on_progress:
+            on_progress(output)
+            if copy_requests is None and not multi_copy:
+                _stream_copy_into(output, on_progress, copy_args, copy_kwargs)
+    if deferred:
+        fill_multi_copy(output, deferred, copy_batch_size, metrics=metrics)
+        if on_progress:
+            on_progress(output)
+    return output
+def fill_multi_copy(output, deferred, batch_size=MULTI_COPY_SIZE, max_workers=4, *, metrics=None):
+    """Fill the Copy column for ``deferred`` recipes, several per request.
+
+    ``deferred`` holds ``(row_index, ad_id, copy_args, copy_kwargs)`` as
+    built by :func:`build_recipe_rows`. Recipes are grouped by brand and
+    copy format, split into chunks of ``batch_size`` and sent through
+    :func:`generate_multi_copy` concurrently. Any recipe whose copy is
+    missing or does not follow its format falls back to a single
+    :func:`generate_recipe_copy` call.
+    """
+    copy_col = RECIPE_HEADER.index("Copy")
+    groups = {}
+    for entry in deferred:
+        _, _, copy_format, brand = entry[2]
+        key = (brand.get("Brand Code"), brand.get("Brand Name"), copy_format.get("Name"))
+        groups.setdefault(key, []).append(entry)
+    chunks = [
+        group[start:start + batch_size]
+        for group in groups.values()
+        for start in range(0, len(group), batch_size)
+    ]
 
-    # Ensure the destination sheet exists before writing
-    metadata = sheets_service.spreadsheets().get(
-        spreadsheetId=sheet_id
-    ).execute()
+    def run(chunk):
+        _, _, copy_format, brand = chunk[0][2]
+        items = [(ad_id, args[0], args[1], kwargs) for _, ad_id, args, kwargs in chunk]
+        copies = {}
+        if len(chunk) > 1:
+            copies = generate_multi_copy(items, copy_format, brand, metrics=metrics)
+            if metrics is not None:
+                metrics.incr("multi_copy_requests")
+                metrics.incr("copy_fallbacks", len(chunk) - len(copies))
+        for row_index, ad_id, args, kwargs in chunk:
+            if ad_id in copies:
+                output[row_index][copy_col] = copies[ad_id]
+            else:
+                output[row_index][copy_col] = generate_recipe_copy(*args, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(run, chunks))
+    return output
+def _stream_copy_into(output, on_progress, copy_args, copy_kwargs):
+    """Stream copy into the last row's Copy cell, reporting each fragment."""
+    row = output[-1]
+    copy_col = RECIPE_HEADER.index("Copy")
+    try:
+        for delta in stream_recipe_copy(*copy_args, **copy_kwargs):
+            row[copy_col] += delta
+            on_progress(output)
+        row[copy_col] = clean_copy(row[copy_col])
+    except Exception as e:
+        row[copy_col] = f"ERROR: {e}"
+    on_progress(output)
+def fill_batch_copy(output, copy_requests, batch_path=None):
+    """Generate deferred copy through the Batch API and fill the Copy column."""
+    replies = run_batch(
+        [(ad_id, request) for _, ad_id, request in copy_requests],
+        path=batch_path,
+    )
+    copy_col = RECIPE_HEADER.index("Copy")
+    for row_index, ad_id, _ in copy_requests:
+        reply = replies.get(ad_id)
+        if isinstance(reply, str):
+            output[row_index][copy_col] = clean_copy(reply)
+        else:
+            output[row_index][copy_col] = f"ERROR: {reply or 'missing from batch output'}"
+    return output
+def _ensure_tab(sheets_service, sheet_id, tab):
+    """Create ``tab`` if the spreadsheet lacks it; return whether it was created."""
+    metadata = recorded(
+        'sheets.spreadsheets.get',
+        [sheet_id],
+        lambda: sheets_service.spreadsheets().get(spreadsheetId=sheet_id).execute(),
+    )
     sheet_titles = [s.get("properties", {}).get("title") for s in metadata.get("sheets", [])]
-    if "recipes" not in sheet_titles:
-        sheets_service.spreadsheets().batchUpdate(
+    if tab in sheet_titles:
+        return False
+    recorded(
+        'sheets.spreadsheets.batchUpdate',
+        [sheet_id, tab],
+        lambda: sheets_service.spreadsheets().batchUpdate(
+            spreadsheetId=sheet_id,
+            body={"requests": [{"addSheet": {"properties": {"title": tab}}}]},
+        ).execute(),
+    )
+    return True
+def write_recipes(sheets_service, sheet_id, output, tab="recipes"):
+    """Write recipe rows to ``tab`` in a single update, creating the tab if needed."""
+    with span("write_recipes", tab=tab, rows=len(output)):
+        # Ensure the destination sheet exists before writing
+        _ensure_tab(sheets_service, sheet_id, tab)
+
+        # Write output to Google Sheet
+        recorded(
+            'sheets.values.update',
+            [sheet_id, tab, output],
+            lambda: sheets_service.spreadsheets().values().update(
+                spreadsheetId=sheet_id,
+                range=f"{tab}!A1",
+                valueInputOption="RAW",
+                body={"values": output}
+            ).execute(),
+        )
+def append_recipes(sheets_service, sheet_id, rows, tab="recipes"):
+    """Append recipe rows below the existing contents of ``tab``."""
+    with span("append_recipes", tab=tab, rows=len(rows)):
+        recorded(
+            'sheets.values.append',
+            [sheet_id, tab, rows],
+            lambda: sheets_service.spreadsheets().values().append(
+                spreadsheetId=sheet_id,
+                range=f"{tab}!A1",
+                valueInputOption="RAW",
+                insertDataOption="INSERT_ROWS",
+                body={"values": rows}
+            ).execute(),
+        )
+def read_recipe_ids(sheets_service, sheet_id, tab="recipes", output_path=None):
+    """Return ``(has_header, ad_ids)`` for existing recipes.
+
+    Reads the local table at ``output_path`` when given, otherwise ``tab``
+    of the sheet, creating the tab if it does not exist yet.
+    """
+    if output_path:
+        if not os.path.exists(output_path):
+            return False, []
+        return True, list(read_table(output_path).get("Ad id", []))
+    if _ensure_tab(sheets_service, sheet_id, tab):
+        return False, []
+    result = recorded(
+        'sheets.values.get',
+        [sheet_id, tab],
+        lambda: sheets_service.spreadsheets().values().get(
             spreadsheetId=sheet_id,
-            body={"requests": [{"addSheet": {"properties": {"title": "recipes"}}}]},
-        ).execute()
-
-    # Write output to Google Sheet
-    sheets_service.spreadsheets().values().update(
-        spreadsheetId=sheet_id,
-        range="recipes!A1",
-        valueInputOption="RAW",
-        body={"values": output}
-    ).execute()
+            range=tab,
+        ).execute(),
+    )
+    rows = result.get("values", [])
+    return bool(rows), [row[0] for row in rows[1:] if row]
+def highest_ad_number(ad_ids, brand_code):
+    """Return the largest ``P`` number among ``brand_code``'s ad ids, or 0."""
+    prefix = f"{brand_code}-P"
+    numbers = [int(a[len(prefix):]) for a in map(str, ad_ids) if a.startswith(prefix) and a[len(prefix):].isdigit()]
+    return max(numbers, default=0)
+def load_progress(path):
+    """Return the saved resume progress at ``path``, or ``None``."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("Ignoring unreadable progress file %s", path)
+        return None
+def save_progress(path, progress):
+    """Write resume progress atomically so an interrupted save keeps the last one."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(progress, fh)
+    os.replace(tmp_path, path)
+RESUME_CHUNK_SIZE = 10
+def _generate_resumable(
+    sheets_service,
+    sheet_id,
+    brand_code,
+    num_recipes,
+    row_args,
+    row_kwargs,
+    *,
+    output_path,
+    chunk_size,
+    progress_path,
+    on_progress=None,
+    tab="recipes",
+):
+    """Append recipes chunk by chunk, saving progress after each chunk."""
+    has_header, ad_ids = read_recipe_ids(sheets_service, sheet_id, tab, output_path)
+    highest = highest_ad_number(ad_ids, brand_code)
+    destination = output_path or f"{sheet_id}/{tab}"
+    progress = load_progress(progress_path)
+    if (
+        progress
+        and progress.get("brand_code") == brand_code
+        and progress.get("destination") == destination
+        and progress.get("target", 0) > highest
+    ):
+        target = progress["target"]
+        logger.info("Resuming %s after %s-P%03d, up to P%03d", destination, brand_code, highest, target)
+    else:
+        target = highest + num_recipes
+    progress = {"brand_code": brand_code, "destination": destination, "target": target, "done": highest}
+    save_progress(progress_path, progress)
+
+    output = [list(RECIPE_HEADER)]
+    chunk_progress = None
+    if on_progress:
+        def chunk_progress(rows):
+            on_progress(output + rows[1:])
+    while progress["done"] < target:
+        count = min(chunk_size, target - progress["done"])
+        rows = build_recipe_rows(
+            *row_args, count, start=progress["done"] + 1, on_progress=chunk_progress, **row_kwargs
+        )
+        if output_path:
+            append_table(output_path, rows)
+        else:
+            append_recipes(sheets_service, sheet_id, rows[1:] if has_header else rows, tab)
+        has_header = True
+        output.extend(rows[1:])
+        progress["done"] += count
+        save_progress(progress_path, progress)
+    os.remove(progress_path)
     return output
+def _log_recipe_metrics(metrics, copy_batch_size):
+    logger.info(
+        "Recipe prompts: %d tokens, %d saved by compaction; %d of %d API prompt tokens cached",
+        metrics.counters.get("prompt_tokens", 0),
+        metrics.counters.get("prompt_tokens_saved", 0),
+        metrics.counters.get("cached_prompt_tokens", 0),
+        metrics.counters.get("api_prompt_tokens", 0),
+    )
+    if copy_batch_size:
+        logger.info(
+            "Multi-recipe copy: %d requests, %d single-call fallbacks",
+            metrics.counters.get("multi_copy_requests", 0),
+            metrics.counters.get("copy_fallbacks", 0),
+        )
+def generate_recipes(
+    sheet_id,
+    service_account_info,
+    folder_id,
+    brand_code,
+    brand_sheet_id,
+    num_recipes=10,
+    *,
+    angles=None,
+    audiences=None,
+    offers=None,
+    selected_layouts=None,
+    selected_copy_formats=None,
+    assets_path=None,
+    layouts_path=None,
+    copy_formats_path=None,
+    brands_path=None,
+    output_path=None,
+    asset_index=None,
+    refresh_index=False,
+    use_batch=False,
+    on_progress=None,
+    copy_batch_size=None,
+    resume=False,
+    chunk_size=None,
+    progress_path=None,
+    tagged_assets=None,
+    brand=None,
+    files=None,
+    metrics=None,
+):
+    """Generate ad recipes and write them to the ``recipes`` tab.
+
+    Any of ``assets_path``, ``layouts_path``, ``copy_formats_path`` and
+    ``brands_path`` may point at a local ``.csv``, ``.jsonl`` or ``.parquet``
+    table (such as the output of ``run_tagger(..., output_path=...)``) to
+    skip reading that table from Sheets. With ``output_path`` the recipes
+    are written to a local table instead of the sheet.
+
+    ``asset_index`` (an :class:`asset_index.AssetIndex` or a path to one)
+    selects assets matching each recipe's audience/angle from a persistent
+    index. The tagged assets are only read when the index has no copy of
+    this source yet or ``refresh_index`` is set.
+
+    With ``use_batch`` all copy is generated in one OpenAI Batch API job
+    (see :mod:`batch_api`), which can take hours but spares the live quota.
+
+    ``on_progress(output)`` is called with the rows so far as each recipe is
+    planned and as its copy streams in, for progressive display.
+
+    With ``copy_batch_size`` (e.g. :data:`MULTI_COPY_SIZE`), copy for
+    recipes sharing a copy format is requested that many at a time as one
+    JSON response, with single-recipe fallback for invalid items (see
+    :func:`fill_multi_copy`). Copy is then not streamed.
+
+    With ``resume`` the recipes are appended to the existing ``recipes`` tab
+    (or ``output_path``) ``chunk_size`` at a time instead of replacing it,
+    numbered on from the brand's highest existing ad id. Progress is saved
+    to ``progress_path`` (``recipes_progress_<brand code>.json`` by
+    default) after each chunk, so re-running after a failure generates
+    only the recipes still missing from the interrupted run. The returned
+    rows hold this run's recipes only.
+
+    ``tagged_assets`` (records of the tagged-asset table) and ``brand`` (the
+    brand's profile row) may be passed when they were already fetched, e.g.
+    prefetched by the app; that table and the brands table are then not read.
+    Likewise ``files``, the listing of ``folder_id``, resolves asset links by
+    image name without a Drive query per asset.
+
+    ``metrics`` (a :class:`metrics.RunMetrics`, new by default) receives
+    token and request counters and the ``recipes`` stage timing.
+    """
+    if resume and use_batch:
+        raise ValueError("resume cannot be combined with use_batch")
+    if not folder_id:
+        raise ValueError("folder_id is required")
+    if not sheet_id and not (assets_path and output_path):
+        raise ValueError("sheet_id is required unless assets_path and output_path are given")
+    if not brand_sheet_id and not brands_path and brand is None:
+        raise ValueError("brand_sheet_id or brands_path is required")
+
+    sheets_service, drive_service = get_google_service(service_account_info)
+    # Load all relevant sheets
+    tables = load_reference_tables(
+        sheets_service,
+        brand_sheet_id,
+        layouts_path=layouts_path,
+        copy_formats_path=copy_formats_path,
+        brands_path=brands_path,
+        include_brands=brand is None,
+    )
+    layouts_df = tables["layouts"]
+    copy_df = tables["copy_formats"]
+
+    if selected_layouts:
+        layouts_df = layouts_df[layouts_df['Name'].isin(selected_layouts)]
+    if selected_copy_formats:
+        copy_df = copy_df[copy_df['Name'].isin(selected_copy_formats)]
+    if brand is None:
+        brand = get_brand_profile(tables["brands"], brand_code)
+    if isinstance(asset_index, str):
+        asset_index = AssetIndex(asset_index)
+    if tagged_assets is None:
+        asset_source, tagged_assets = load_tagged_assets(
+            sheets_service, sheet_id, assets_path, asset_index, refresh_index
+        )
+    else:
+        asset_source = assets_path or sheet_id
+        if asset_index is not None and (refresh_index or not asset_index.has_source(asset_source)):
+            asset_index.load(asset_source, tagged_assets)
+    copy_requests = [] if use_batch else None
+    metrics = metrics or RunMetrics()
+    row_args = (drive_service, folder_id, brand_code, brand, layouts_df, copy_df, tagged_assets)
+    row_kwargs = dict(
+        angles=angles,
+        audiences=audiences,
+        offers=offers,
+        asset_index=asset_index,
+        asset_source=asset_source,
+        metrics=metrics,
+        copy_batch_size=copy_batch_size,
+        files=files,
+    )
+    if resume:
+        with metrics.timer("recipes"):
+            output = _generate_resumable(
+                sheets_service, sheet_id, brand_code, num_recipes, row_args, row_kwargs,
+                output_path=output_path,
+                chunk_size=chunk_size or RESUME_CHUNK_SIZE,
+                progress_path=progress_path or f"recipes_progress_{brand_code}.json",
+                on_progress=on_progress,
+            )
+        _log_recipe_metrics(metrics, copy_batch_size)
+        return output
+    with metrics.timer("recipes"):
+        output = build_recipe_rows(
+            *row_args,
+            num_recipes,
+            copy_requests=copy_requests,
+            on_progress=on_progress,
+            **row_kwargs,
+        )
+        if copy_requests:
+            fill_batch_copy(output, copy_requests)
+    _log_recipe_metrics(metrics, copy_batch_size)
+
+    if output_path:
+        write_table(output_path, output)
+        return output
+
+    write_recipes(sheets_service, sheet_id, output)
+    return output
+def estimate_recipes(
+    sheet_id,
+    service_account_info,
+    folder_id,
+    brand_code,
+    brand_sheet_id,
+    num_recipes=10,
+    *,
+    sample_size=DEFAULT_SAMPLE_SIZE,
+    **kwargs,
+):
+    """Estimate a :func:`generate_recipes` run without writing any recipes.
+
+    ``sample_size`` recipes are generated through the real pipeline into a
+    temporary local table and their timings, requests and tokens are
+    scaled to ``num_recipes``. Other keyword arguments are passed to
+    :func:`generate_recipes` (except ``output_path``, ``resume`` and
+    ``use_batch``).
+
+    Returns
+    -------
+    estimator.Estimate
+        Estimated wall time, API calls, tokens and cost.
+    """
+    metrics = RunMetrics()
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rows = generate_recipes(
+            sheet_id,
+            service_account_info,
+            folder_id,
+            brand_code,
+            brand_sheet_id,
+            min(sample_size, num_recipes),
+            output_path=os.path.join(tmp_dir, "sample.csv"),
+            metrics=metrics,
+            **kwargs,
+        )
+    return recipe_estimate(num_recipes, rows, metrics, time.monotonic() - start)
+def generate_recipes_batch(
+    service_account_info,
+    brand_sheet_id,
+    jobs,
+    *,
+    sheet_id=None,
+    folder_id=None,
+    max_workers=4,
+    layouts_path=None,
+    copy_formats_path=None,
+    brands_path=None,
+    asset_index=None,
+    refresh_index=False,
+):
+    """Generate recipes for several brands, loading shared tables once.
+
+    Parameters
+    ----------
+    service_account_info : dict
+        Service account JSON credentials.
+    brand_sheet_id : str | None
+        Sheet holding the ``brands`` tab (or use ``brands_path``).
+    jobs : list[dict]
+        One dict per brand with ``brand_code`` and optionally
+        ``num_recipes``, ``angles``, ``audiences``, ``offers``,
+        ``selected_layouts``, ``selected_copy_formats``, ``sheet_id``,
+        ``folder_id``, ``assets_path``, ``output_path``, ``tab`` and
+        ``copy_batch_size``.
+        ``sheet_id`` and ``folder_id`` default to the batch-level values.
+    max_workers : int, optional
+        Brands processed concurrently.
+
+    Returns
+    -------
+    dict
+        Brand code mapped to its output rows, or to the exception raised
+        while generating that brand.
+
+    Notes
+    -----
+    Layouts, copy formats and brands are read once for the whole batch and
+    each distinct tagged-asset source is read once. Every brand's rows are
+    written with a single update, to the ``recipes`` tab, or to
+    ``recipes_<brand code>`` when several jobs share a sheet.
+    """
+    if not brand_sheet_id and not brands_path:
+        raise ValueError("brand_sheet_id or brands_path is required")
+    jobs = [dict(job) for job in jobs]
+    for job in jobs:
+        job.setdefault("sheet_id", sheet_id)
+        job.setdefault("folder_id", folder_id)
+        if not job.get("brand_code") or not job["folder_id"]:
+            raise ValueError("each job needs a brand_code and folder_id")
+        if not job["sheet_id"] and not (job.get("assets_path") and job.get("output_path")):
+            raise ValueError(f"job {job['brand_code']} needs a sheet_id")
+    sheet_counts = Counter(job["sheet_id"] for job in jobs if not job.get("output_path"))
+    for job in jobs:
+        if "tab" not in job:
+            shared = sheet_counts[job["sheet_id"]] > 1
+            job["tab"] = f"recipes_{job['brand_code']}" if shared else "recipes"
+
+    sheets_service, _ = get_google_service(service_account_info)
+    tables = load_reference_tables(
+        sheets_service,
+        brand_sheet_id,
+        layouts_path=layouts_path,
+        copy_formats_path=copy_formats_path,
+        brands_path=brands_path,
+    )
+    if isinstance(asset_index, str):
+        asset_index = AssetIndex(asset_index)
+
+    asset_cache = {}
+    asset_locks = {}
+    asset_lock = threading.Lock()
+
+    def assets_for(service, job):
+        key = job.get("assets_path") or job["sheet_id"]
+        # One lock per source: different sources load in parallel, while
+        # jobs sharing a source wait for its single load.
+        with asset_lock:
+            key_lock = asset_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in asset_cache:
+                asset_cache[key] = load_tagged_assets(
+                    service, job["sheet_id"], job.get("assets_path"), asset_index, refresh_index
+                )
+            return asset_cache[key]
+
+    def run_job(job):
+        # Google API clients are not thread-safe, so each job gets its own.
+        job_sheets, job_drive = get_google_service(service_account_info)
+        layouts_df = tables["layouts"]
+        copy_df = tables["copy_formats"]
+        if job.get("selected_layouts"):
+            layouts_df = layouts_df[layouts_df['Name'].isin(job["selected_layouts"])]
+        if job.get("selected_copy_formats"):
+            copy_df = copy_df[copy_df['Name'].isin(job["selected_copy_formats"])]
+        asset_source, tagged_assets = assets_for(job_sheets, job)
+        output = build_recipe_rows(
+            job_drive,
+            job["folder_id"],
+            job["brand_code"],
+            get_brand_profile(tables["brands"], job["brand_code"]),
+            layouts_df,
+            copy_df,
+            tagged_assets,
+            job.get("num_recipes", 10),
+            angles=job.get("angles"),
+            audiences=job.get("audiences"),
+            offers=job.get("offers"),
+            asset_index=asset_index,
+            asset_source=asset_source,
+            copy_batch_size=job.get("copy_batch_size"),
+        )
+        if job.get("output_path"):
+            write_table(job["output_path"], output)
+        else:
+            write_recipes(job_sheets, job["sheet_id"], output, job["tab"])
+        return output
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_job, job): job["brand_code"] for job in jobs}
+        for future in as_completed(futures):
+            brand_code = futures[future]
+            try:
+                results[brand_code] = future.result()
+            except Exception as e:
+                logger.error("Recipe generation failed for %s: %s", brand_code, e)
+                results[brand_code] = e
+    return results
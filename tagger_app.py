@@ -2,9 +2,14 @@
 import streamlit as st
 import toml
 import json
+import time
+from functools import partial
 from streamlit_tags import st_tags
-from main_tagger import run_tagger
-from recipe_generator import generate_recipes, read_sheet, LAYOUT_COPY_SHEET_ID
+from main_tagger import estimate_run, list_images, run_tagger
+from model_router import ModelRouter
+from prefetch import Prefetcher
+from estimator import DEFAULT_SAMPLE_SIZE
+from recipe_generator import estimate_recipes, generate_recipes, get_brand_profile, read_sheet, LAYOUT_COPY_SHEET_ID
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 
@@ -47,6 +52,27 @@ def get_file_name(drive_service, file_id):
     except Exception:
         return file_id
 
+def make_recipe_table_updater(placeholder, min_interval=0.1):
+    """Return an ``on_progress`` callback that redraws recipe rows in ``placeholder``.
+
+    Redraws are throttled to one per ``min_interval`` seconds so streaming
+    tokens do not flood the browser; the final call always renders.
+    """
+
+    last_render = [0.0]
+
+    def update(output, force=False):
+        now = time.monotonic()
+        if not force and now - last_render[0] < min_interval:
+            return
+        last_render[0] = now
+        placeholder.dataframe(
+            [dict(zip(output[0], row)) for row in output[1:]],
+            use_container_width=True,
+        )
+
+    return update
+
 @st.cache_data(show_spinner=False)
 def load_layout_copy_options(service_account_info):
     """Fetch layout and copy format options and cache the result."""
@@ -57,6 +83,43 @@ def load_layout_copy_options(service_account_info):
 
 BRAND_SHEET_ID = "1j74m77q9LIUBv1DJdSGA4cAx4pADXznSD-_RBVosG7g"  # Set to your Google Sheet ID; remove this note if the ID is final
 
+def get_prefetcher():
+    """Return this session's :class:`prefetch.Prefetcher`."""
+    if "prefetcher" not in st.session_state:
+        st.session_state.prefetcher = Prefetcher()
+    return st.session_state.prefetcher
+
+def fetch_tagged_assets(service_account_info, sheet_id):
+    """Read the tagged-asset sheet as records (runs in a prefetch thread)."""
+    sheets_service = get_google_service(service_account_info)[0]
+    return read_sheet(sheets_service, sheet_id, 'Sheet1').to_dict(orient='records')
+
+def fetch_brand(service_account_info, brand_code):
+    """Return the brand's profile row, raising if it is not in the brand list."""
+    sheets_service = get_google_service(service_account_info)[0]
+    brand = get_brand_profile(read_sheet(sheets_service, BRAND_SHEET_ID, 'brands'), brand_code)
+    if not brand:
+        raise ValueError(f"Brand code {brand_code} not found in the brand list")
+    return brand
+
+def prefetch(kind, key, fetch, describe, wait=1.0):
+    """Start fetching ``kind`` for ``key`` in the background and show its status.
+
+    Waits up to ``wait`` seconds so quick fetches are reported on this rerun.
+    """
+    if not key:
+        return
+    prefetcher = get_prefetcher()
+    prefetcher.start(kind, key, fetch)
+    prefetcher.take(kind, key, timeout=wait)
+    state, value = prefetcher.status(kind, key)
+    if state == "running":
+        st.caption("⏳ Checking...")
+    elif state == "done":
+        st.caption(f"✅ {describe(value)}")
+    elif state == "failed":
+        st.warning(f"⚠ Could not load: {value}")
+
 st.set_page_config(page_title="StudioTAK Tagger + Recipe Builder", layout="centered")
 
 # Password gate
@@ -74,19 +137,74 @@ with tab1:
     folder_id = st.text_input(
         "Google Drive Folder ID (image folder)",
         key="tag_folder_id",
-    )
+    ).strip()
+    prefetch("folder", folder_id, partial(list_images, folder_id), lambda files: f"{len(files)} images in folder")
 
     st.subheader("Expected Content")
     expected_content = st_tags(label="Add tags", key="expected_content")
+    match_labels = {
+        "Local similarity (no tokens)": "local",
+        "Local, then ChatGPT if no match": "local+llm",
+        "ChatGPT": "llm",
+    }
+    match_choice = st.selectbox("Match expected content with", list(match_labels), key="match_mode")
+
+    feature_labels = {"Labels": "label", "Web entities (slower)": "web"}
+    selected_features = st.multiselect(
+        "Vision features",
+        options=list(feature_labels),
+        default=list(feature_labels),
+        key="vision_features",
+    )
+    max_results = st.number_input(
+        "Max Vision results per feature (0 = API default)",
+        min_value=0,
+        max_value=100,
+        value=0,
+        key="vision_max_results",
+    )
+
+    route_models = st.checkbox(
+        "Route by confidence (small model first, larger model only when unsure)",
+        key="route_models",
+    )
+
+    if st.button("Estimate Time and Cost", key="estimate_tagging"):
+        try:
+            with st.spinner(f"Tagging {DEFAULT_SAMPLE_SIZE} sample images..."):
+                estimate = estimate_run(
+                    folder_id,
+                    expected_content,
+                    features=[feature_labels[f] for f in selected_features] or None,
+                    max_results=max_results or None,
+                    match_mode=match_labels[match_choice],
+                    router=ModelRouter() if route_models else None,
+                    files=get_prefetcher().take("folder", folder_id),
+                )
+            st.code(estimate.format_summary())
+        except Exception as e:
+            st.error(f"❌ Error: {e}")
 
     if st.button("Run Tagging"):
         try:
             st.info("Tagging images...")
             final_sheet = sheet_id
             final_folder = folder_id
-            run_tagger(final_sheet, final_folder, expected_content)
+            metrics = run_tagger(
+                final_sheet,
+                final_folder,
+                expected_content,
+                features=[feature_labels[f] for f in selected_features] or None,
+                max_results=max_results or None,
+                match_mode=match_labels[match_choice],
+                router=ModelRouter() if route_models else None,
+                files=get_prefetcher().take("folder", final_folder),
+            )
+            # The tagged-asset sheet has changed; fetch it again next time.
+            get_prefetcher().clear()
 
             st.success("✅ Tagging complete. Check your Google Sheet.")
+            st.code(metrics.format_summary())
         except Exception as e:
             st.error(f"❌ Error: {e}")
 
@@ -97,12 +215,25 @@ with tab2:
         sheet_id = st.text_input(
             "Google Sheet ID (for tagged assets)",
             key="recipe_sheet_id",
+        ).strip()
+        prefetch(
+            "assets",
+            sheet_id,
+            partial(fetch_tagged_assets, SERVICE_ACCOUNT_INFO, sheet_id),
+            lambda assets: f"{len(assets)} tagged assets",
         )
         folder_id = st.text_input(
             "Google Drive Folder ID (for image links)",
             key="recipe_folder_id",
+        ).strip()
+        prefetch("folder", folder_id, partial(list_images, folder_id), lambda files: f"{len(files)} images in folder")
+        brand_code = st.text_input("Brand Code (matches brand list)", key="brand_code").strip()
+        prefetch(
+            "brand",
+            brand_code,
+            partial(fetch_brand, SERVICE_ACCOUNT_INFO, brand_code),
+            lambda brand: brand.get("Brand Name") or brand_code,
         )
-        brand_code = st.text_input("Brand Code (matches brand list)", key="brand_code")
 
         try:
             layout_options, copy_options = load_layout_copy_options(SERVICE_ACCOUNT_INFO)
@@ -119,12 +250,51 @@ with tab2:
         offers_input = st.text_area("Offers (comma-separated)")
 
         num_recipes = st.number_input("How many recipes to generate?", min_value=1, max_value=100, value=10)
+        copy_batch_size = st.number_input(
+            "Recipes per copy request (1 = one request per recipe, streamed)",
+            min_value=1,
+            max_value=20,
+            value=1,
+        )
+        resume = st.checkbox(
+            "Append to existing recipes (resumes an interrupted run)",
+            help="Adds recipes below the recipes tab in chunks and continues ad id numbering.",
+        )
+
+        recipe_options = dict(
+            angles=[a.strip() for a in angles_input.split(',') if a.strip()],
+            audiences=[a.strip() for a in audiences_input.split(',') if a.strip()],
+            offers=[o.strip() for o in offers_input.split(',') if o.strip()],
+            selected_layouts=selected_layouts,
+            selected_copy_formats=selected_copy_formats,
+            copy_batch_size=copy_batch_size if copy_batch_size > 1 else None,
+        )
+
+        if st.button("Estimate Time and Cost", key="estimate_recipes"):
+            try:
+                with st.spinner(f"Generating {DEFAULT_SAMPLE_SIZE} sample recipes..."):
+                    estimate = estimate_recipes(
+                        sheet_id,
+                        SERVICE_ACCOUNT_INFO,
+                        folder_id,
+                        brand_code,
+                        BRAND_SHEET_ID,
+                        num_recipes,
+                        tagged_assets=get_prefetcher().take("assets", sheet_id),
+                        brand=get_prefetcher().take("brand", brand_code),
+                        files=get_prefetcher().take("folder", folder_id),
+                        **recipe_options,
+                    )
+                st.code(estimate.format_summary())
+            except Exception as e:
+                st.error(f"❌ Error: {e}")
 
         if st.button("Generate Recipes"):
             try:
                 st.info("Generating recipes...")
                 final_sheet = sheet_id
                 final_folder = folder_id
+                update_table = make_recipe_table_updater(st.empty())
                 recipes = generate_recipes(
                     final_sheet,
                     SERVICE_ACCOUNT_INFO,
@@ -132,12 +302,14 @@ with tab2:
                     brand_code,
                     BRAND_SHEET_ID,
                     num_recipes,
-                    angles=[a.strip() for a in angles_input.split(',') if a.strip()],
-                    audiences=[a.strip() for a in audiences_input.split(',') if a.strip()],
-                    offers=[o.strip() for o in offers_input.split(',') if o.strip()],
-                    selected_layouts=selected_layouts,
-                    selected_copy_formats=selected_copy_formats,
+                    on_progress=update_table,
+                    resume=resume,
+                    tagged_assets=get_prefetcher().take("assets", final_sheet),
+                    brand=get_prefetcher().take("brand", brand_code),
+                    files=get_prefetcher().take("folder", final_folder),
+                    **recipe_options,
                 )
+                update_table(recipes, force=True)
                 st.success("✅ Recipes generated. Check your Google Sheet.")
             except Exception as e:
                 st.error(f"❌ Error: {e}")
@@ -227,6 +399,7 @@ with tab_brand:
                 valueInputOption="RAW",
                 body={"values": new_row},
             ).execute()
+            get_prefetcher().clear()
             st.success("✅ Brand profile added.")
         except Exception as e:
             st.error(f"❌ Failed to add brand: {e}")
@@ -0,0 +1,36 @@
+from asset_index import AssetIndex
+
+
+def make_index():
+    index = AssetIndex(':memory:')
+    index.load('sheet', [
+        {'Image Name': 'a', 'Matched Audience': 'Gamers', 'Matched Angle': 'Fun', 'Descriptors': 'neon, indoor'},
+        {'Image Name': 'b', 'Matched Audience': 'Parents', 'Matched Angle': 'Fun', 'Descriptors': 'outdoor'},
+        {'Image Name': 'c', 'Audience': 'gamers', 'Angle': 'Value', 'Descriptors': ''},
+        {'Image Name': 'd', 'Matched Audience': 'unknown', 'Matched Angle': 'Fun'},
+    ])
+    return index
+
+
+def test_query_prefers_full_match_then_relaxes():
+    index = make_index()
+    assert index.has_source('sheet')
+    assert not index.has_source('other')
+
+    best = index.query('sheet', 1, audiences=['gamers'], angles=['fun'])
+    assert [a['Image Name'] for a in best] == ['a']
+
+    relaxed = index.query('sheet', 2, audiences=['Gamers'], angles=['Fun'])
+    assert sorted(a['Image Name'] for a in relaxed) == ['a', 'c']
+
+    by_descriptor = index.query('sheet', 1, descriptors=['Outdoor'])
+    assert [a['Image Name'] for a in by_descriptor] == ['b']
+
+
+def test_query_excludes_unknown_and_reload_replaces():
+    index = make_index()
+    everything = index.query('sheet', 10)
+    assert sorted(a['Image Name'] for a in everything) == ['a', 'b', 'c']
+
+    index.load('sheet', [{'Image Name': 'z', 'Matched Audience': 'Teens'}])
+    assert [a['Image Name'] for a in index.query('sheet', 10)] == ['z']
@@ -0,0 +1,105 @@
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+openai = pytest.importorskip('openai')
+
+import batch_api
+
+
+class StandInBatchServer(BaseHTTPRequestHandler):
+    """Minimal local stand-in for the OpenAI files and batches endpoints."""
+
+    files = {}
+    polls = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload, raw=False):
+        body = payload if raw else json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream' if raw else 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/v1/files':
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            for part in message.iter_parts():
+                if part.get_param('name', header='content-disposition') == 'file':
+                    StandInBatchServer.files['file-in'] = part.get_payload(decode=True)
+            self._send({'id': 'file-in', 'object': 'file', 'bytes': 0, 'created_at': 0,
+                        'filename': 'in.jsonl', 'purpose': 'batch', 'status': 'processed'})
+        elif self.path == '/v1/batches':
+            request = json.loads(body)
+            assert request['endpoint'] == '/v1/chat/completions'
+            self._send(self._batch('validating'))
+
+    def do_GET(self):
+        if self.path == '/v1/batches/batch-1':
+            StandInBatchServer.polls += 1
+            status = 'completed' if StandInBatchServer.polls > 1 else 'in_progress'
+            self._send(self._batch(status))
+        elif self.path == '/v1/files/file-out/content':
+            lines = []
+            for line in StandInBatchServer.files['file-in'].decode().splitlines():
+                item = json.loads(line)
+                if item['custom_id'] == 'bad':
+                    lines.append({'custom_id': 'bad', 'response': {'status_code': 400, 'body': {}}})
+                    continue
+                content = f"reply to {item['body']['messages'][-1]['content']}"
+                lines.append({
+                    'custom_id': item['custom_id'],
+                    'response': {'status_code': 200, 'body': {
+                        'choices': [{'message': {'role': 'assistant', 'content': content}}],
+                    }},
+                })
+            self._send('\n'.join(json.dumps(l) for l in lines).encode(), raw=True)
+
+    def _batch(self, status):
+        batch = {'id': 'batch-1', 'object': 'batch', 'endpoint': '/v1/chat/completions',
+                 'input_file_id': 'file-in', 'completion_window': '24h',
+                 'status': status, 'created_at': 0}
+        if status == 'completed':
+            batch['output_file_id'] = 'file-out'
+        return batch
+
+
+@pytest.fixture
+def stand_in_client():
+    server = HTTPServer(('127.0.0.1', 0), StandInBatchServer)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StandInBatchServer.files = {}
+    StandInBatchServer.polls = 0
+    client = openai.OpenAI(api_key='test', base_url=f'http://127.0.0.1:{server.server_port}/v1')
+    yield client
+    server.shutdown()
+
+
+def test_run_batch_against_stand_in_server(stand_in_client, tmp_path):
+    def body(text):
+        return {'model': 'gpt-3.5-turbo', 'messages': [{'role': 'user', 'content': text}]}
+
+    path = tmp_path / 'batch.jsonl'
+    results = batch_api.run_batch(
+        [('img-0', body('first')), ('bad', body('x')), ('img-1', body('second'))],
+        client=stand_in_client,
+        path=str(path),
+        poll_interval=0,
+    )
+
+    assert [json.loads(l)['custom_id'] for l in path.read_text().splitlines()] == ['img-0', 'bad', 'img-1']
+    assert results['img-0'] == 'reply to first'
+    assert results['img-1'] == 'reply to second'
+    assert isinstance(results['bad'], batch_api.BatchError)
+    assert StandInBatchServer.polls == 2
@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import cassette
+from cassette import CassetteMiss, Cassette, ReplayedError, recorded, recorded_stream
+
+
+@pytest.fixture(autouse=True)
+def no_active_cassette():
+    yield
+    cassette.stop_cassette()
+
+
+def fail():
+    raise RuntimeError('quota exceeded')
+
+
+def test_record_then_replay_without_calling_api(tmp_path):
+    path = str(tmp_path / 'run.jsonl')
+    cassette.use_cassette(path, 'record')
+    assert recorded('drive.files.list', ['q'], lambda: {'files': [{'id': 'a'}]}) == {'files': [{'id': 'a'}]}
+    assert recorded('drive.files.get_media', ['a'], lambda: b'\x89PNG') == b'\x89PNG'
+    with pytest.raises(RuntimeError):
+        recorded('openai.chat.completions', {'model': 'm'}, fail)
+    assert ''.join(recorded_stream('openai.stream', {'p': 1}, lambda: iter(['Buy ', 'now']))) == 'Buy now'
+    cassette.stop_cassette()
+
+    cassette.use_cassette(path, 'replay')
+    not_called = lambda: pytest.fail('API called during replay')
+    assert recorded('drive.files.get_media', ['a'], not_called) == b'\x89PNG'
+    assert recorded('drive.files.list', ['q'], not_called) == {'files': [{'id': 'a'}]}
+    with pytest.raises(ReplayedError, match='quota exceeded'):
+        recorded('openai.chat.completions', {'model': 'm'}, not_called)
+    assert list(recorded_stream('openai.stream', {'p': 1}, not_called)) == ['Buy ', 'now']
+
+
+def test_replay_falls_back_by_operation_unless_strict(tmp_path):
+    path = str(tmp_path / 'run.jsonl')
+    recorder = Cassette(path, 'record')
+    recorder.call('openai.chat.completions', 'old-prompt', lambda: 'copy one')
+    recorder.call('openai.chat.completions', 'other', lambda: 'copy two')
+    recorder.close()
+
+    replay = Cassette(path, 'replay')
+    assert replay.call('openai.chat.completions', 'other', None) == 'copy two'
+    assert replay.call('openai.chat.completions', 'new-prompt', None) == 'copy one'
+    # Exact matches repeat once every recording has been used.
+    assert replay.call('openai.chat.completions', 'other', None) == 'copy two'
+
+    with pytest.raises(CassetteMiss):
+        Cassette(path, 'replay', strict=True).call('openai.chat.completions', 'new-prompt', None)
+
+
+def test_replay_latency_sleeps_for_recorded_duration(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.jsonl')
+    recorder = Cassette(path, 'record')
+    recorder.call('vision.annotate_image', 'k', lambda: [['Shoe'], []])
+    recorder.close()
+
+    slept = []
+    monkeypatch.setattr(cassette.time, 'sleep', slept.append)
+    assert Cassette(path, 'replay').call('vision.annotate_image', 'k', None) == [['Shoe'], []]
+    assert slept == []
+    Cassette(path, 'replay', replay_latency=True).call('vision.annotate_image', 'k', None)
+    assert len(slept) == 1
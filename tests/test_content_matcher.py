@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from content_matcher import match_content, score_content
+
+
+def test_match_picks_closest_expected_tag():
+    labels = ['Footwear', 'Running shoe', 'Sneakers']
+    web = ['Nike', 'Shoe']
+    assert match_content(labels, web, ['hats', 'shoes', 'bags']) == 'shoes'
+
+
+def test_match_below_threshold_is_unknown():
+    assert match_content(['Cat', 'Whiskers'], ['Kitten'], ['shoes', 'bags']) == 'unknown'
+
+
+@pytest.mark.parametrize('labels, expected', [
+    (['Hand', 'Finger'], 'handbag'),
+    (['Person', 'Smile'], 'personal care'),
+    (['Carpet'], 'car'),
+])
+def test_shared_substrings_do_not_match(labels, expected):
+    assert match_content(labels, [], [expected]) == 'unknown'
+
+
+def test_plural_and_compound_forms_still_match():
+    assert match_content(['Baby stroller'], [], ['strollers']) == 'strollers'
+    assert match_content(['Handbag', 'Leather'], [], ['handbags']) == 'handbags'
+
+
+def test_empty_inputs():
+    assert match_content([], [], ['shoes']) == 'unknown'
+    assert match_content(['Shoe'], [], []) == 'unknown'
+    assert len(score_content(['Shoe'], [], [])) == 0
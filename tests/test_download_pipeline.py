@@ -0,0 +1,70 @@
+import threading
+import time
+
+from download_pipeline import BufferWriter, ByteBudget, SharedReservation
+
+
+def test_budget_blocks_until_bytes_released():
+    budget = ByteBudget(100)
+    budget.acquire(60)
+    acquired = threading.Event()
+
+    def second():
+        with budget.reserve(60):
+            acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+    assert budget.waits == 1
+
+    budget.release(60)
+    thread.join(1)
+    assert acquired.is_set()
+    assert budget.in_flight == 0
+    assert budget.peak == 60
+
+
+def test_oversized_request_runs_alone():
+    budget = ByteBudget(10)
+    with budget.reserve(50):
+        assert budget.in_flight == 10
+    assert budget.in_flight == 0
+
+
+def test_writer_fills_preallocated_buffer_and_grows():
+    buf = bytearray(4)
+    writer = BufferWriter(buf)
+    writer.write(b'abc')
+    with writer.view() as view:
+        assert bytes(view) == b'abc'
+    writer.write(b'def')
+    content = writer.detach()
+    # The caller gets the preallocated buffer itself, trimmed, not a copy.
+    assert content is buf
+    assert content == b'abcdef'
+
+
+def test_shared_reservation_outlives_abandoned_call():
+    budget = ByteBudget(100)
+    started, finish = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        finish.wait(1)
+        return b'late'
+
+    with SharedReservation(budget, 60) as reservation:
+        thread = threading.Thread(target=reservation.run, args=(slow,))
+        thread.start()
+        started.wait(1)
+    # The caller gave up, but the call still holds its bytes.
+    assert budget.in_flight == 60
+    finish.set()
+    thread.join(1)
+    assert budget.in_flight == 0
+
+    # A call that starts after the caller gave up is skipped.
+    assert reservation.run(lambda: b'never') is None
+    assert budget.in_flight == 0
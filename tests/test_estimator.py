@@ -0,0 +1,64 @@
+import pytest
+
+from estimator import PRICES, VISION_PRICES, recipe_estimate, sample_evenly, tagging_estimate
+from metrics import RunMetrics
+
+
+def test_sample_evenly_spreads_across_items():
+    assert sample_evenly(range(10), 3) == [0, 3, 6]
+    assert sample_evenly([1, 2], 5) == [1, 2]
+
+
+def test_tagging_estimate_scales_download_by_bytes_and_rest_by_image():
+    files = [{'id': str(i), 'size': '1000'} for i in range(9)] + [{'id': 'big', 'size': '91000'}]
+    sample = files[:2]
+    metrics = RunMetrics()
+    for _ in sample:
+        metrics.record('image', 3.0)
+        metrics.record('download', 1.0)
+    metrics.incr('chat_calls[gpt-3.5-turbo]', 2)
+    metrics.incr('chat_prompt_tokens[gpt-3.5-turbo]', 400)
+    metrics.incr('chat_completion_tokens[gpt-3.5-turbo]', 100)
+
+    estimate = tagging_estimate(files, sample, metrics, ('label',), max_workers=2)
+
+    # 2s of non-download time per image, plus 1ms per byte downloaded.
+    assert estimate.seconds == pytest.approx((2.0 * 10 + 100) / 2)
+    assert estimate.total_bytes == 100000
+    assert estimate.calls['vision.annotate_image'] == 10
+    assert estimate.calls['openai.chat.completions[gpt-3.5-turbo]'] == 10
+    assert estimate.tokens == {'gpt-3.5-turbo': (2000, 500)}
+    prompt_price, completion_price = PRICES['gpt-3.5-turbo']
+    assert estimate.cost == pytest.approx(
+        (2000 * prompt_price + 500 * completion_price) / 1e6 + 10 * VISION_PRICES['label'] / 1000
+    )
+    assert 'Estimate for 10 images (from 2 sampled)' in estimate.format_summary()
+
+
+def test_recipe_estimate_counts_setup_once():
+    rows = [
+        ['Ad id', 'Asset 1 Link', 'Asset 2 Link', 'Copy'],
+        ['BR-P001', 'https://drive.google.com/uc?id=a', '', 'copy'],
+        ['BR-P002', 'https://drive.google.com/uc?id=b', 'NOT FOUND', 'copy'],
+    ]
+    metrics = RunMetrics()
+    metrics.record('recipes', 4.0)
+    metrics.incr('copy_requests', 2)
+    metrics.incr('asset_link_queries', 3)
+    metrics.incr('api_prompt_tokens', 600)
+    metrics.incr('api_completion_tokens', 200)
+
+    estimate = recipe_estimate(100, rows, metrics, wall_seconds=5.0)
+
+    assert estimate.seconds == pytest.approx(1.0 + 4.0 * 50)
+    assert estimate.calls == {'drive.files.list': 150, 'openai.recipe_copy': 100}
+    assert estimate.tokens == {'gpt-4-turbo': (30000, 10000)}
+
+
+def test_recipe_estimate_without_link_queries_counts_no_drive_calls():
+    rows = [['Ad id', 'Asset 1 Link'], ['BR-P001', 'https://drive.google.com/uc?id=a']]
+    metrics = RunMetrics()
+    metrics.record('recipes', 1.0)
+
+    # Links resolved from a prefetched folder listing made no Drive calls.
+    assert recipe_estimate(10, rows, metrics, wall_seconds=1.0).calls['drive.files.list'] == 0
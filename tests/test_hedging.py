@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from hedging import CallPolicy, DeadlineExceeded
+from metrics import RunMetrics
+
+
+def test_deadline_exceeded_raises_and_counts():
+    policy = CallPolicy({'vision': 0.05})
+    metrics = RunMetrics()
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        policy.call('vision', lambda: release.wait(5), metrics)
+    release.set()
+    assert metrics.counters == {'deadline_exceeded[vision]': 1}
+    # Stages without a deadline run inline.
+    assert policy.call('classify', lambda: threading.current_thread().name) == 'MainThread'
+
+
+def test_hedge_after_p95_and_first_result_wins():
+    policy = CallPolicy({}, hedge=True, min_samples=3)
+    for _ in range(3):
+        policy.observe('classify', 0.01)
+    metrics = RunMetrics()
+    calls = []
+    lock = threading.Lock()
+
+    def flaky():
+        with lock:
+            calls.append(len(calls))
+            attempt = calls[-1]
+        # The original request hangs; the hedge answers quickly.
+        time.sleep(1.0 if attempt == 0 else 0.0)
+        return f'attempt-{attempt}'
+
+    start = time.monotonic()
+    assert policy.call('classify', flaky, metrics) == 'attempt-1'
+    assert time.monotonic() - start < 0.5
+    assert metrics.counters == {'hedges[classify]': 1, 'hedge_wins[classify]': 1}
+
+
+def test_no_hedge_for_fast_calls_or_unhedged_stages():
+    policy = CallPolicy({'download': 1.0}, hedge=True, min_samples=1)
+    policy.observe('download', 0.001)
+    policy.observe('classify', 0.5)
+    metrics = RunMetrics()
+    assert policy.hedge_delay('download') is None
+    assert policy.call('classify', lambda: 'ok', metrics) == 'ok'
+    assert policy.call('download', lambda: 'bytes', metrics) == 'bytes'
+    assert metrics.counters == {}
+
+
+def test_deadline_starts_when_call_leaves_the_queue():
+    policy = CallPolicy({'vision': 0.1}, max_workers=1)
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        policy.call('vision', lambda: release.wait(0.3))
+    # The abandoned call still holds the only thread; queueing behind it
+    # does not use up the next call's deadline.
+    assert policy.call('vision', lambda: 'ok') == 'ok'
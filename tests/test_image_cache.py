@@ -0,0 +1,57 @@
+import os
+import time
+
+from image_cache import ImageCache
+
+
+def test_put_get_memory_mapped(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    assert cache.get('file', 'abc') is None
+    cache.put('file', 'abc', b'hello')
+    with cache.get('file', 'abc') as mapped:
+        assert mapped[:] == b'hello'
+    assert cache.get('file', 'other') is None
+    assert cache.size() == 5
+    # Size is recovered when the cache is reopened
+    assert ImageCache(str(tmp_path)).size() == 5
+
+
+def test_least_recently_used_entries_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=12)
+    cache.put('a', 'aa', b'12345')
+    cache.put('b', 'bb', b'12345')
+    past = time.time() - 100
+    os.utime(cache.path('a', 'aa'), (past, past))
+    os.utime(cache.path('b', 'bb'), (past - 10, past - 10))
+    # Reading 'b' makes it the most recently used entry
+    cache.get('b', 'bb').close()
+
+    cache.put('c', 'cc', b'12345')
+    assert cache.get('a', 'aa') is None
+    assert cache.get('b', 'bb') is not None
+    assert cache.get('c', 'cc') is not None
+    assert cache.size() == 10
+
+
+def test_eviction_shrinks_to_low_water_and_tracks_overwrites(tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path), max_bytes=100, low_water=0.5)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: scans.append(1) or entries())
+
+    for i in range(10):
+        cache.put(str(i), f'm{i}', b'x' * 20)
+    # Each eviction frees half the cap, so 10 puts scan the directory only twice.
+    assert len(scans) == 2
+    assert cache.size() <= 100
+
+    cache.put('9', 'm9', b'x' * 5)
+    assert cache.size() == sum(size for _, _, size in entries())
+
+
+def test_annotations_cached_per_feature_variant(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    cache.put_annotation('file', 'abc', 'label', {'labels': ['cat'], 'web_labels': []})
+    assert cache.get_annotation('file', 'abc', 'label') == {'labels': ['cat'], 'web_labels': []}
+    assert cache.get_annotation('file', 'abc', 'label+web') is None
+    assert cache.get_annotation('file', 'new-md5', 'label') is None
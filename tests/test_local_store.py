@@ -0,0 +1,39 @@
+import pytest
+
+from local_store import append_table, open_sink, read_table, write_table
+
+
+@pytest.mark.parametrize('ext', ['csv', 'jsonl', 'parquet'])
+def test_sink_round_trip(tmp_path, ext):
+    if ext == 'parquet':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / f'out.{ext}')
+    sink = open_sink(path, ['Image Name', 'Audience'])
+    sink.write_rows([['a.png', 'Gamers']])
+    sink.write_rows([['b.png', '']])
+    sink.close()
+
+    df = read_table(path)
+    assert list(df.columns) == ['Image Name', 'Audience']
+    assert df.to_dict(orient='records') == [
+        {'Image Name': 'a.png', 'Audience': 'Gamers'},
+        {'Image Name': 'b.png', 'Audience': ''},
+    ]
+
+
+def test_unknown_extension_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_table(str(tmp_path / 'out.xlsx'), [['A'], ['1']])
+
+
+@pytest.mark.parametrize('ext', ['csv', 'jsonl', 'parquet'])
+def test_append_table_creates_then_appends(tmp_path, ext):
+    if ext == 'parquet':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / f'out.{ext}')
+    append_table(path, [['Ad id', 'Copy'], ['AA-P001', 'one']])
+    append_table(path, [['Ad id', 'Copy'], ['AA-P002', 'two']])
+
+    df = read_table(path)
+    assert list(df.columns) == ['Ad id', 'Copy']
+    assert list(df['Ad id']) == ['AA-P001', 'AA-P002']
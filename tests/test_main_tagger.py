@@ -84,7 +84,7 @@ def test_run_tagger_outputs_basic_columns(monkeypatch):
 
     monkeypatch.setattr(main_tagger, 'write_to_sheet', fake_write)
     monkeypatch.setattr(main_tagger, 'list_images', fake_list_images)
-    monkeypatch.setattr(main_tagger, 'analyze_image', lambda fid: (['label'], ['web']))
+    monkeypatch.setattr(main_tagger, 'analyze_image', lambda fid, *args: (['label'], ['web']))
     monkeypatch.setattr(
         main_tagger,
         'chat_classify',
@@ -147,3 +147,360 @@ def test_run_tagger_empty_folder_id_errors_before_api(monkeypatch):
         raise AssertionError('ValueError not raised')
 
     assert 'called' not in called
+
+
+def test_queue_workers_merge_in_folder_order(monkeypatch, tmp_path):
+    from work_queue import WorkQueue
+
+    files = [
+        {'id': str(i), 'name': f'img{i}', 'webViewLink': f'link{i}'}
+        for i in range(3)
+    ]
+    captured = {}
+
+    monkeypatch.setattr(main_tagger, 'list_images', lambda fid: files)
+    monkeypatch.setattr(
+        main_tagger,
+        'tag_file',
+        lambda file, expected, *a: [file['name'], ','.join(expected)],
+    )
+    monkeypatch.setattr(
+        main_tagger, 'write_to_sheet', lambda sid, rows: captured.update(sheet_id=sid, rows=rows)
+    )
+
+    queue = WorkQueue(str(tmp_path / 'q.db'))
+    run_id = main_tagger.enqueue_run(queue, 'SHEET', 'FOLDER', ['x'])
+    # Simulate a second worker that already finished the first file
+    queue.complete(run_id, queue.lease(run_id, 'other'), ['img0', 'x'])
+
+    assert main_tagger.run_worker(queue, run_id, 'w1') == 2
+    assert main_tagger.merge_run(queue, run_id) is True
+    assert captured['sheet_id'] == 'SHEET'
+    assert captured['rows'][0] == main_tagger.HEADER_ROW
+    assert [r[0] for r in captured['rows'][1:]] == ['img0', 'img1', 'img2']
+    assert main_tagger.merge_run(queue, run_id) is False
+
+
+def test_run_tagger_local_output_without_sheet(monkeypatch, tmp_path):
+    from local_store import read_table
+
+    def fail_write(*a, **k):
+        raise AssertionError('sheet should not be written')
+
+    monkeypatch.setattr(main_tagger, 'write_to_sheet', fail_write)
+    monkeypatch.setattr(
+        main_tagger,
+        'list_images',
+        lambda fid: [{'id': '1', 'name': 'img', 'webViewLink': 'link'}],
+    )
+    monkeypatch.setattr(main_tagger, 'tag_file', lambda file, expected, *a: [file['name']] + [''] * 8)
+
+    path = str(tmp_path / 'tags.csv')
+    main_tagger.run_tagger(None, 'FOLDER', output_path=path)
+
+    df = read_table(path)
+    assert list(df.columns) == main_tagger.HEADER_ROW
+    assert df['Image Name'].tolist() == ['img']
+
+
+def test_run_tagger_uses_prefetched_files(monkeypatch):
+    def fail_list(fid):
+        raise AssertionError('folder should not be listed again')
+
+    captured = {}
+    monkeypatch.setattr(main_tagger, 'list_images', fail_list)
+    monkeypatch.setattr(main_tagger, 'tag_file', lambda file, expected, *a: [file['name']] + [''] * 8)
+    monkeypatch.setattr(main_tagger, 'write_to_sheet', lambda sid, rows: captured.update(rows=rows))
+
+    files = [{'id': '1', 'name': 'img', 'webViewLink': 'link'}]
+    metrics = main_tagger.run_tagger('SHEET', 'FOLDER', files=files)
+
+    assert [r[0] for r in captured['rows'][1:]] == ['img']
+    assert 'list_images' not in metrics.timings
+
+
+def test_estimate_run_tags_sample_and_writes_nothing(monkeypatch):
+    files = [{'id': str(i), 'name': f'img{i}', 'webViewLink': 'l', 'size': '10'} for i in range(20)]
+    tagged = []
+
+    def fake_tag_file(file, expected, features, max_results, metrics, *a):
+        tagged.append(file['name'])
+        metrics.incr('chat_calls[gpt-3.5-turbo]')
+        return [file['name']]
+
+    def fail_write(*a, **k):
+        raise AssertionError('sheet should not be written')
+
+    monkeypatch.setattr(main_tagger, 'list_images', lambda fid: files)
+    monkeypatch.setattr(main_tagger, 'tag_file', fake_tag_file)
+    monkeypatch.setattr(main_tagger, 'write_to_sheet', fail_write)
+
+    estimate = main_tagger.estimate_run('FOLDER', sample_size=4, max_workers=4)
+
+    assert tagged == ['img0', 'img5', 'img10', 'img15']
+    assert estimate.total == 20
+    assert estimate.calls['openai.chat.completions[gpt-3.5-turbo]'] == 20
+
+
+def test_tag_files_batch_merges_replies_by_custom_id(monkeypatch):
+    files = [
+        {'id': 'a', 'name': 'img-a', 'webViewLink': 'la'},
+        {'id': 'b', 'name': 'img-b', 'webViewLink': 'lb'},
+    ]
+    monkeypatch.setattr(main_tagger, 'analyze_image', lambda fid, *args: ([fid], []))
+
+    def fake_run_batch(requests, path=None):
+        assert [custom_id for custom_id, _ in requests] == ['img-0', 'img-1']
+        return {
+            'img-1': '{"audience": "teens", "product": "p", "angle": "a", "descriptors": ["d"]}',
+            'img-0': RuntimeError('failed'),
+        }
+
+    monkeypatch.setattr(main_tagger, 'run_batch', fake_run_batch)
+    rows = main_tagger.tag_files_batch(files, [])
+
+    assert rows[0][0] == 'img-a'
+    assert rows[0][6] == 'unknown'
+    assert rows[1][0] == 'img-b'
+    assert rows[1][4:] == ['d', 'unknown', 'teens', 'p', 'a']
+
+
+def test_load_image_bytes_cache_hit_skips_drive(monkeypatch, tmp_path):
+    downloads = []
+
+    def fake_download(fid, size=None):
+        downloads.append(fid)
+        return b'image-bytes'
+
+    monkeypatch.setattr(main_tagger, 'download_image', fake_download)
+    monkeypatch.setattr(main_tagger, 'image_cache', None)
+    main_tagger.configure_image_cache(str(tmp_path))
+
+    assert main_tagger.load_image_bytes('f1', 'abc') == b'image-bytes'
+    assert main_tagger.load_image_bytes('f1', 'abc') == b'image-bytes'
+    assert downloads == ['f1']
+    # A new checksum means the file changed, so it is downloaded again
+    main_tagger.load_image_bytes('f1', 'def')
+    assert downloads == ['f1', 'f1']
+
+
+def test_run_tagger_concurrent_keeps_folder_order(monkeypatch):
+    import time
+
+    files = [{'id': str(i), 'name': f'img{i}', 'webViewLink': 'l'} for i in range(6)]
+    captured = {}
+
+    def slow_tag(file, expected, *args):
+        # Earlier files finish last to exercise reordering
+        time.sleep(0.01 * (6 - int(file['id'])))
+        return [file['name']]
+
+    monkeypatch.setattr(main_tagger, 'list_images', lambda fid: files)
+    monkeypatch.setattr(main_tagger, 'tag_file', slow_tag)
+    monkeypatch.setattr(main_tagger, 'write_to_sheet', lambda sid, rows: captured.update(rows=rows))
+
+    main_tagger.run_tagger('SHEET', 'FOLDER', max_workers=3)
+
+    assert [r[0] for r in captured['rows'][1:]] == [f'img{i}' for i in range(6)]
+
+
+def test_run_tagger_labels_only_drops_web_column(monkeypatch):
+    captured = {}
+
+    monkeypatch.setattr(main_tagger, 'write_to_sheet', lambda sid, rows: captured.update(rows=rows))
+    monkeypatch.setattr(
+        main_tagger,
+        'list_images',
+        lambda fid: [{'id': '1', 'name': 'img', 'webViewLink': 'link'}],
+    )
+
+    def fake_analyze(fid, md5, size, features, max_results, metrics):
+        captured['vision'] = (features, max_results)
+        return ['label'], []
+
+    monkeypatch.setattr(main_tagger, 'analyze_image', fake_analyze)
+    monkeypatch.setattr(main_tagger, 'chat_classify', lambda *a, **k: {'audience': 'aud'})
+
+    metrics = main_tagger.run_tagger('SHEET', 'FOLDER', features=['label'], max_results=5)
+
+    assert captured['vision'] == (('label',), 5)
+    assert 'Google Web Entities' not in captured['rows'][0]
+    assert captured['rows'][1][:3] == ['img', 'link', 'label']
+    assert len(captured['rows'][1]) == len(captured['rows'][0])
+    assert metrics.stage_stats('classify')['count'] == 1
+
+
+def test_tag_files_batch_local_match_keeps_tags_out_of_prompt(monkeypatch):
+    files = [{'id': 'a', 'name': 'img-a', 'webViewLink': 'la'}]
+    monkeypatch.setattr(main_tagger, 'analyze_image', lambda fid, *args: (['Running shoe'], []))
+
+    def fake_run_batch(requests, path=None):
+        prompt = requests[0][1]['messages'][1]['content']
+        assert 'expected content' not in prompt
+        assert 'match_content' not in prompt
+        return {'img-0': '{"audience": "a", "product": "p", "angle": "g", "descriptors": []}'}
+
+    monkeypatch.setattr(main_tagger, 'run_batch', fake_run_batch)
+    rows = main_tagger.tag_files_batch(files, ['hats', 'shoes'])
+
+    assert rows[0][5] == 'shoes'
+
+
+def test_tag_files_batch_routes_and_records_model(monkeypatch):
+    files = [
+        {'id': 'a', 'name': 'img-a', 'webViewLink': 'la'},
+        {'id': 'b', 'name': 'img-b', 'webViewLink': 'lb'},
+    ]
+    monkeypatch.setattr(main_tagger, 'analyze_image', lambda fid, *args: ([fid], []))
+    batches = []
+
+    def fake_run_batch(requests, path=None):
+        batches.append([(custom_id, body['model']) for custom_id, body in requests])
+        confidence = 0.2 if len(batches) == 1 else 0.9
+        return {
+            custom_id: f'{{"audience": "a", "product": "p", "angle": "g", "descriptors": [], "confidence": {confidence}}}'
+            for custom_id, _ in requests
+        }
+
+    class Router(main_tagger.ModelRouter):
+        def match_rules(self, labels, web_labels, expected_content=None):
+            if labels == ['a']:
+                return {'audience': 'ra', 'product': 'rp', 'angle': 'rg', 'descriptors': []}
+            return None
+
+    monkeypatch.setattr(main_tagger, 'run_batch', fake_run_batch)
+    rows = main_tagger.tag_files_batch(files, [], router=Router())
+
+    assert batches == [[('img-1', 'gpt-3.5-turbo')], [('img-1', 'gpt-4-turbo')]]
+    assert main_tagger.header_for(routing=True)[-1] == 'Model'
+    assert rows[0][-4:] == ['ra', 'rp', 'rg', 'rules']
+    assert rows[1][-1] == 'gpt-4-turbo'
+
+
+def test_analyze_image_reserves_download_and_vision_copies(monkeypatch):
+    from download_pipeline import ByteBudget
+
+    budget = ByteBudget(10_000)
+    monkeypatch.setattr(main_tagger, 'download_budget', budget)
+    monkeypatch.setattr(main_tagger, 'image_cache', None)
+    monkeypatch.setattr(main_tagger, 'load_image_bytes', lambda fid, md5, size: bytearray(int(size)))
+    monkeypatch.setattr(main_tagger, 'annotate_content', lambda content, *a: (['cat'], []))
+
+    assert main_tagger.analyze_image('f', None, '1000') == (['cat'], [])
+    assert budget.peak == 2000
+    assert budget.in_flight == 0
+
+
+def test_run_tagger_keeps_going_after_vision_deadline(monkeypatch):
+    import threading
+    import hedging
+    from download_pipeline import ByteBudget
+
+    captured = {}
+    release = threading.Event()
+
+    def fake_annotate(content, *a):
+        if content == b'slow':
+            release.wait(1)
+        return (['cat'], [])
+
+    budget = ByteBudget(10_000)
+    monkeypatch.setattr(main_tagger, 'download_budget', budget)
+    monkeypatch.setattr(main_tagger, 'image_cache', None)
+    monkeypatch.setattr(main_tagger, 'load_image_bytes', lambda fid, md5, size: fid.encode())
+    monkeypatch.setattr(main_tagger, 'annotate_content', fake_annotate)
+    monkeypatch.setattr(main_tagger, 'chat_classify', lambda *a, **k: {'audience': 'aud'})
+    monkeypatch.setattr(main_tagger, 'write_to_sheet', lambda sid, rows: captured.update(rows=rows))
+    monkeypatch.setattr(hedging, 'policy', hedging.CallPolicy({'vision': 0.05}))
+    files = [
+        {'id': 'slow', 'name': 'img-slow', 'webViewLink': 'l1', 'size': '100'},
+        {'id': 'fast', 'name': 'img-fast', 'webViewLink': 'l2', 'size': '100'},
+    ]
+
+    metrics = main_tagger.run_tagger('SHEET', 'FOLDER', files=files)
+
+    assert captured['rows'][1] == ['img-slow', 'l1', '', '', '', 'unknown', 'unknown', 'unknown', 'unknown']
+    assert captured['rows'][2][:3] == ['img-fast', 'l2', 'cat']
+    assert metrics.counters['image_errors'] == 1
+    assert metrics.counters['deadline_exceeded[vision]'] == 1
+    # The abandoned Vision call keeps its image reserved until it returns.
+    assert budget.in_flight == 200
+    release.set()
+    for _ in range(100):
+        if not budget.in_flight:
+            break
+        threading.Event().wait(0.01)
+    assert budget.in_flight == 0
+
+
+def test_tag_files_batch_leaves_failed_images_out_of_batch(monkeypatch):
+    files = [
+        {'id': 'a', 'name': 'img-a', 'webViewLink': 'la'},
+        {'id': 'b', 'name': 'img-b', 'webViewLink': 'lb'},
+    ]
+
+    from hedging import DeadlineExceeded
+
+    def fake_analyze(fid, *args):
+        if fid == 'a':
+            raise DeadlineExceeded('vision call exceeded its 60s deadline')
+        return ([fid], [])
+
+    monkeypatch.setattr(main_tagger, 'analyze_image', fake_analyze)
+    sent = []
+
+    def fake_run_batch(requests, path=None):
+        sent.extend(custom_id for custom_id, _ in requests)
+        return {custom_id: '{}' for custom_id in sent}
+
+    monkeypatch.setattr(main_tagger, 'run_batch', fake_run_batch)
+    rows = main_tagger.tag_files_batch(files, [])
+
+    assert sent == ['img-1']
+
+    assert rows[0][:2] == ['img-a', 'la']
+    assert rows[0][4:] == ['', 'unknown', 'unknown', 'unknown', 'unknown']
+    assert rows[1][2] == 'b'
+
+
+def test_list_images_follows_every_page(monkeypatch):
+    pages = {
+        None: {'files': [{'id': str(i)} for i in range(1000)], 'nextPageToken': 'p2'},
+        'p2': {'files': [{'id': 'last'}]},
+    }
+    requests = []
+
+    class FakeFiles:
+        def list(self, **kwargs):
+            requests.append(kwargs)
+            return types.SimpleNamespace(execute=lambda: pages[kwargs['pageToken']])
+
+    fake_drive = types.SimpleNamespace(files=FakeFiles)
+    monkeypatch.setattr(main_tagger, 'get_drive_service', lambda: fake_drive)
+
+    files = main_tagger.list_images('FOLDER')
+
+    assert len(files) == 1001
+    assert files[-1] == {'id': 'last'}
+    assert [r['pageToken'] for r in requests] == [None, 'p2']
+    assert all(r['pageSize'] == main_tagger.LIST_PAGE_SIZE for r in requests)
+
+
+def test_estimate_run_counts_every_listing_page(monkeypatch):
+    pages = {
+        None: {'files': [{'id': str(i), 'name': f'img{i}'} for i in range(1000)], 'nextPageToken': 'p2'},
+        'p2': {'files': [{'id': str(i), 'name': f'img{i}'} for i in range(1000, 5000)]},
+    }
+
+    class FakeFiles:
+        def list(self, **kwargs):
+            return types.SimpleNamespace(execute=lambda: pages[kwargs['pageToken']])
+
+    fake_drive = types.SimpleNamespace(files=FakeFiles)
+    monkeypatch.setattr(main_tagger, 'get_drive_service', lambda: fake_drive)
+    monkeypatch.setattr(main_tagger, 'tag_file', lambda file, *a: [file['name']])
+
+    estimate = main_tagger.estimate_run('FOLDER', sample_size=2)
+
+    assert estimate.total == 5000
+    assert estimate.calls['drive.files.list'] == 5
@@ -0,0 +1,26 @@
+from metrics import RunMetrics, percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([], 95) == 0.0
+
+
+def test_stage_stats_and_summary():
+    metrics = RunMetrics()
+    metrics.record('vision[label]', 0.1)
+    metrics.record('vision[label]', 0.3)
+    metrics.incr('images', 2)
+    with metrics.timer('classify'):
+        pass
+
+    stats = metrics.stage_stats('vision[label]')
+    assert stats['count'] == 2
+    assert abs(stats['mean'] - 0.2) < 1e-9
+    assert stats['p95'] == 0.3
+    summary = metrics.summary()
+    assert summary['counters'] == {'images': 2}
+    assert set(summary['stages']) == {'vision[label]', 'classify'}
+    assert 'vision[label]: n=2' in metrics.format_summary()
@@ -0,0 +1,57 @@
+from metrics import RunMetrics
+
+import model_router
+from model_router import ModelRouter, needs_escalation
+
+
+def write_rules(tmp_path):
+    path = tmp_path / 'rules.csv'
+    path.write_text(
+        'Keywords,Audience,Product,Angle\n'
+        '"running, shoe",athlete,running shoes,performance\n'
+        'shoe,shopper,shoes,style\n'
+        'stroller,parents,stroller,convenience\n'
+        'baby,grandma,baby gear,family\n'
+    )
+    return str(path)
+
+
+def test_rules_prefer_most_specific_and_skip_ties(tmp_path):
+    router = ModelRouter(write_rules(tmp_path))
+    result = router.match_rules(['Running shoe', 'Footwear'], [])
+    assert (result['audience'], result['product'], result['angle']) == (
+        'athlete', 'running shoes', 'performance'
+    )
+    # Two equally specific rules disagree, so the rules tier is not confident.
+    assert router.match_rules(['Stroller', 'Baby'], []) is None
+    assert router.match_rules(['Cat'], []) is None
+
+
+def test_escalates_only_low_confidence(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_chat_classify(labels, web_labels, expected, match_mode, metrics, model, include_confidence):
+        calls.append(model)
+        confidence = 0.4 if labels == ['Lifestyle'] else 0.9
+        return {'audience': 'a', 'product': 'p', 'angle': 'g', 'descriptors': [], 'confidence': confidence}
+
+    monkeypatch.setattr(model_router, 'chat_classify', fake_chat_classify)
+    router = ModelRouter(write_rules(tmp_path))
+    metrics = RunMetrics()
+
+    assert router.classify(['Running shoe'], [], metrics=metrics)['model'] == 'rules'
+    assert router.classify(['Kettle'], [], metrics=metrics)['model'] == 'gpt-3.5-turbo'
+    assert router.classify(['Lifestyle'], [], metrics=metrics)['model'] == 'gpt-4-turbo'
+    assert calls == ['gpt-3.5-turbo', 'gpt-3.5-turbo', 'gpt-4-turbo']
+    assert metrics.counters == {
+        'route[rules]': 1,
+        'route[gpt-3.5-turbo]': 1,
+        'route[gpt-4-turbo]': 1,
+        'route_escalations': 1,
+    }
+
+
+def test_needs_escalation_on_unknown_fields():
+    assert needs_escalation({'audience': 'unknown', 'product': 'p', 'angle': 'g', 'confidence': 1})
+    assert needs_escalation({'audience': 'a', 'product': 'p', 'angle': 'g', 'confidence': 'high'})
+    assert not needs_escalation({'audience': 'a', 'product': 'p', 'angle': 'g', 'confidence': 0.8})
@@ -0,0 +1,40 @@
+import threading
+
+from prefetch import Prefetcher
+
+
+def test_start_runs_each_key_once_and_take_returns_result():
+    calls = []
+    prefetcher = Prefetcher()
+
+    def fetch():
+        calls.append(1)
+        return ['a.png', 'b.png']
+
+    first = prefetcher.start('folder', 'F1', fetch)
+    assert prefetcher.start('folder', 'F1', fetch) is first
+    assert prefetcher.take('folder', 'F1', timeout=5) == ['a.png', 'b.png']
+    assert prefetcher.status('folder', 'F1') == ('done', ['a.png', 'b.png'])
+    assert calls == [1]
+
+
+def test_take_returns_none_for_missing_failed_and_slow_fetches():
+    prefetcher = Prefetcher()
+    release = threading.Event()
+
+    def fail():
+        raise ValueError('bad folder')
+
+    prefetcher.start('folder', 'bad', fail)
+    prefetcher.start('assets', 'slow', lambda: release.wait(5))
+
+    assert prefetcher.take('brand', 'missing') is None
+    assert prefetcher.take('folder', 'bad', timeout=5) is None
+    state, error = prefetcher.status('folder', 'bad')
+    assert state == 'failed' and str(error) == 'bad folder'
+    assert prefetcher.take('assets', 'slow', timeout=0.01) is None
+    assert prefetcher.status('assets', 'slow')[0] == 'running'
+    release.set()
+
+    prefetcher.clear()
+    assert prefetcher.status('folder', 'bad') == ('missing', None)
@@ -0,0 +1,39 @@
+from metrics import RunMetrics
+from prompt_budget import compact_labels, count_tokens, fit_to_budget, strip_decorations
+
+
+def test_compact_labels_dedupes_normalizes_and_caps():
+    seen = set()
+    labels = compact_labels(['Shoe', '  shoe ', '', 'Sneakers', 'Sportswear'], 2, seen)
+    web = compact_labels(['SHOE', None, 'Nike  Air   Max 90 Essential Men\'s Running Trainers Limited'], seen=seen)
+    assert labels == ['Shoe', 'Sneakers']
+    assert web == ['Nike Air Max 90 Essential Men\'s Running']
+
+
+def test_fit_to_budget_drops_lowest_ranked_first():
+    render = lambda labels, web: ' '.join(labels + web)
+    labels = ['alpha', 'beta', 'gamma']
+    web = ['delta', 'epsilon', 'zeta', 'eta']
+    budget = count_tokens('alpha beta gamma delta epsilon')
+    kept_labels, kept_web, tokens = fit_to_budget(labels, web, render, budget)
+    assert kept_labels == ['alpha', 'beta', 'gamma']
+    assert kept_web == ['delta', 'epsilon']
+    assert tokens <= budget
+
+
+def test_strip_decorations_drops_emoji_and_empty_fields():
+    prompt = '🏢 Brand: Acme\n🎁 Offer: \n✍️ You MUST  use this structure — do not deviate:\n⚠️'
+    assert strip_decorations(prompt) == 'Brand: Acme\nYou MUST use this structure — do not deviate:'
+
+
+def test_classify_request_reports_tokens_saved():
+    from chat_classifier import build_classify_request
+
+    metrics = RunMetrics()
+    labels = ['Shoe', 'shoe', '', 'Footwear'] * 10
+    request = build_classify_request(labels, ['Shoe', 'Nike'], include_match=False, metrics=metrics)
+    prompt = request['messages'][1]['content']
+    assert 'Generic Labels:\nShoe, Footwear\n' in prompt
+    assert 'Web Entities:\nNike\n' in prompt
+    assert metrics.counters['prompt_tokens'] == count_tokens(prompt)
+    assert metrics.counters['prompt_tokens_saved'] > 0
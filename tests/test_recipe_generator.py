@@ -242,3 +242,383 @@ def test_read_sheet_handles_mismatched_rows(monkeypatch):
 
     assert df.columns == ["A", "B", "C"]
     assert df.data == [["1", "2", ""], ["3", "4", "5"]]
+
+
+def test_generate_recipes_batch_loads_shared_tables_once(monkeypatch):
+    reads = []
+
+    def fake_load_table(service, path, sid, sheet_name):
+        reads.append((sid, sheet_name))
+        return sheet_name
+
+    built = []
+
+    def fake_build_recipe_rows(drive, folder_id, brand_code, brand, layouts_df, copy_df,
+                               tagged_assets, num_recipes=10, **kwargs):
+        built.append((brand_code, folder_id, num_recipes, kwargs['audiences']))
+        return [['Ad id'], [f'{brand_code}-P001']]
+
+    writes = []
+
+    monkeypatch.setattr(recipe_generator, 'load_table', fake_load_table)
+    monkeypatch.setattr(recipe_generator, 'build_recipe_rows', fake_build_recipe_rows)
+    monkeypatch.setattr(recipe_generator, 'get_brand_profile', lambda df, code: {'Brand Code': code})
+    monkeypatch.setattr(
+        recipe_generator, 'get_google_service', lambda info: (object(), object())
+    )
+    monkeypatch.setattr(
+        recipe_generator,
+        'write_recipes',
+        lambda service, sid, output, tab='recipes': writes.append((sid, tab, output)),
+    )
+
+    monkeypatch.setattr(
+        recipe_generator,
+        'load_tagged_assets',
+        lambda service, sid, path=None, index=None, refresh=False: (sid, []),
+    )
+
+    results = recipe_generator.generate_recipes_batch(
+        {},
+        'BRANDS',
+        [
+            {'brand_code': 'AA', 'num_recipes': 2, 'audiences': ['Gamers']},
+            {'brand_code': 'BB'},
+            {'brand_code': 'CC', 'sheet_id': 'OTHER'},
+        ],
+        sheet_id='SHARED',
+        folder_id='FOLDER',
+    )
+
+    assert sorted(reads, key=lambda r: r[1]) == [
+        ('BRANDS', 'brands'),
+        (recipe_generator.LAYOUT_COPY_SHEET_ID, 'copy_formats'),
+        (recipe_generator.LAYOUT_COPY_SHEET_ID, 'layouts'),
+    ]
+    assert sorted(built) == [
+        ('AA', 'FOLDER', 2, ['Gamers']),
+        ('BB', 'FOLDER', 10, None),
+        ('CC', 'FOLDER', 10, None),
+    ]
+    assert sorted((sid, tab) for sid, tab, _ in writes) == [
+        ('OTHER', 'recipes'),
+        ('SHARED', 'recipes_AA'),
+        ('SHARED', 'recipes_BB'),
+    ]
+    assert results['AA'] == [['Ad id'], ['AA-P001']]
+
+
+def test_build_recipe_rows_streams_copy_progressively(monkeypatch):
+    chunks = ['  "Great', ' copy', '!"  ']
+
+    class FakeCompletions:
+        def create(self, *args, **kwargs):
+            assert kwargs['stream'] is True
+            return iter(
+                types.SimpleNamespace(
+                    choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=c))]
+                )
+                for c in chunks
+            )
+
+    class FakeOpenAI:
+        def __init__(self, api_key=None):
+            self.chat = types.SimpleNamespace(completions=FakeCompletions())
+
+    asset = {'Image Name': 'img', 'Matched Audience': 'Gamers', 'Matched Product': 'P'}
+    layout = {'Name': 'L1', 'Use Case': 'Test', 'Asset Count': '1'}
+    copy_format = {'Name': 'C1', 'Use Case': 'Test', 'Prompt Style': 'fun'}
+
+    monkeypatch.setattr(recipe_generator.openai, 'OpenAI', FakeOpenAI, raising=False)
+    monkeypatch.setattr(
+        recipe_generator, 'choose_recipe_components', lambda l, c: (layout, copy_format)
+    )
+    monkeypatch.setattr(recipe_generator, 'choose_assets', lambda tagged, count: ([asset], False))
+    monkeypatch.setattr(recipe_generator, 'get_asset_link', lambda *a: 'link')
+
+    seen = []
+    output = recipe_generator.build_recipe_rows(
+        object(), 'FOLDER', 'BR', {}, None, None, [asset], 1,
+        on_progress=lambda rows: seen.append(rows[-1][9]),
+    )
+
+    assert seen[:4] == ['', '  "Great', '  "Great copy', '  "Great copy!"  ']
+    assert seen[-1] == 'Great copy!'
+    assert output[1][9] == 'Great copy!'
+
+
+def test_build_recipe_rows_links_assets_from_folder_listing(monkeypatch):
+    assets = [{'Image Name': 'a.png'}, {'Image Name': 'missing.png'}]
+    layout = {'Name': 'L2', 'Use Case': 'Test', 'Asset Count': '2'}
+    copy_format = {'Name': 'C1', 'Use Case': 'Test', 'Prompt Style': 'fun'}
+    files = [
+        {'id': 'id-a', 'name': 'a.png'},
+        {'id': 'id-a2', 'name': 'a.png'},
+        {'id': 'id-b', 'name': 'b.png'},
+    ]
+
+    queried = []
+
+    def fake_get_asset_link(service, file_name, folder_id):
+        queried.append(file_name)
+        return 'NOT FOUND'
+
+    monkeypatch.setattr(
+        recipe_generator, 'choose_recipe_components', lambda l, c: (layout, copy_format)
+    )
+    monkeypatch.setattr(recipe_generator, 'choose_assets', lambda tagged, count: (assets, False))
+    monkeypatch.setattr(recipe_generator, 'get_asset_link', fake_get_asset_link)
+    monkeypatch.setattr(recipe_generator, 'generate_recipe_copy', lambda *a, **k: 'copy')
+
+    output = recipe_generator.build_recipe_rows(
+        object(), 'FOLDER', 'BR', {}, None, None, assets, 1, files=files
+    )
+
+    assert output[1][7:9] == ['https://drive.google.com/uc?id=id-a', 'NOT FOUND']
+    # Only the name missing from the listing falls back to a Drive query.
+    assert queried == ['missing.png']
+
+
+def test_build_recipe_rows_reads_run_tagger_headers(monkeypatch):
+    # run_tagger output uses Audience / Product / Angle, not the Matched ... headers.
+    tagged = [
+        {'Image Name': 'a.png', 'Audience': 'unknown', 'Product': 'Mug', 'Angle': 'Cozy'},
+        {'Image Name': 'b.png', 'Audience': 'Gamers', 'Product': 'Chair', 'Angle': 'Comfort'},
+    ]
+    layout = {'Name': 'L1', 'Use Case': 'Test', 'Asset Count': '1'}
+    copy_format = {'Name': 'C1', 'Use Case': 'Test', 'Prompt Style': 'fun'}
+    prompts = []
+
+    monkeypatch.setattr(
+        recipe_generator, 'choose_recipe_components', lambda l, c: (layout, copy_format)
+    )
+    monkeypatch.setattr(
+        recipe_generator,
+        'generate_recipe_copy',
+        lambda *a, **k: prompts.append(recipe_generator.build_recipe_copy_request(*a, **k)) or 'copy',
+    )
+
+    output = recipe_generator.build_recipe_rows(
+        object(), 'FOLDER', 'BR', {}, None, None, tagged, 3,
+        files=[{'id': 'id-b', 'name': 'b.png'}],
+    )
+
+    assert [row[3:6] for row in output[1:]] == [['Gamers', 'Chair', 'Comfort']] * 3
+    assert 'Product: Chair' in prompts[0]['messages'][1]['content']
+
+
+def test_copy_prompt_shares_prefix_across_recipes():
+    layout = {'Name': 'L1', 'Use Case': 'Test'}
+    copy_format = {'Name': 'C1', 'Use Case': 'Test', 'Prompt Style': 'Hook / Body / CTA'}
+    brand = {'Brand Name': 'Acme', 'Copy Tone': 'playful'}
+    first = recipe_generator.build_recipe_copy_request(
+        {'Matched Product': 'Widget'}, layout, copy_format, brand, audience='Gamers', offer='10% off'
+    )
+    second = recipe_generator.build_recipe_copy_request(
+        {'Matched Product': 'Gadget'}, {'Name': 'L2'}, copy_format, brand, audience='Moms', angle='Calm'
+    )
+
+    assert first['messages'][0] == second['messages'][0]
+    assert first['prompt_cache_key'] == second['prompt_cache_key']
+    assert 'Hook / Body / CTA' in first['messages'][0]['content']
+    assert 'Gamers' not in first['messages'][0]['content']
+    assert 'Audience: Gamers' in first['messages'][1]['content']
+    assert 'Offer' not in second['messages'][1]['content']
+
+
+def test_copy_prompt_keeps_bare_label_prompt_style():
+    layout = {'Name': 'L1', 'Use Case': 'Test'}
+    copy_format = {'Name': 'C1', 'Use Case': 'Test', 'Prompt Style': 'Headline:\nBody:\nCTA:'}
+    brand = {'Brand Name': 'Acme'}
+    asset = {'Matched Product': 'Widget'}
+    single = recipe_generator.build_recipe_copy_request(asset, layout, copy_format, brand, offer='')
+    multi = recipe_generator.build_multi_copy_request(
+        [('1', asset, layout, {}), ('2', asset, layout, {})], copy_format, brand
+    )
+
+    for request in (single, multi):
+        assert 'Headline:\nBody:\nCTA:\n' in request['messages'][0]['content']
+    assert 'Offer' not in single['messages'][1]['content']
+
+
+def test_generate_recipe_copy_records_cached_tokens(monkeypatch):
+    class FakeCompletions:
+        def create(self, *args, **kwargs):
+            usage = types.SimpleNamespace(
+                prompt_tokens=1200,
+                prompt_tokens_details=types.SimpleNamespace(cached_tokens=1024),
+            )
+            message = types.SimpleNamespace(content='Copy')
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+    class FakeOpenAI:
+        def __init__(self, api_key=None):
+            self.chat = types.SimpleNamespace(completions=FakeCompletions())
+
+    monkeypatch.setattr(recipe_generator.openai, 'OpenAI', FakeOpenAI)
+    metrics = recipe_generator.RunMetrics()
+    result = recipe_generator.generate_recipe_copy(
+        {}, {'Name': 'L1'}, {'Name': 'C1'}, {}, metrics=metrics
+    )
+
+    assert result == 'Copy'
+    assert metrics.counters['api_prompt_tokens'] == 1200
+    assert metrics.counters['cached_prompt_tokens'] == 1024
+
+
+def test_fill_multi_copy_groups_by_format_and_falls_back(monkeypatch):
+    copy_formats = {
+        'A': {'Name': 'A', 'Prompt Style': 'Headline: ...\nBody: ...'},
+        'B': {'Name': 'B', 'Prompt Style': 'free text'},
+    }
+    brand = {'Brand Code': 'BR'}
+    deferred = []
+    output = [list(recipe_generator.RECIPE_HEADER)]
+    for i, fmt in enumerate(['A', 'B', 'A', 'A']):
+        output.append([f'BR-P00{i + 1}'] + [''] * 10)
+        deferred.append((i + 1, f'BR-P00{i + 1}', ({}, {}, copy_formats[fmt], brand), {}))
+
+    multi_calls = []
+
+    def fake_multi(items, copy_format, brand, metrics=None):
+        multi_calls.append((copy_format['Name'], [item[0] for item in items]))
+        reply = {'copies': [
+            {'id': 'BR-P001', 'copy': 'Headline: Hi\nBody: There'},
+            {'id': 'BR-P003', 'copy': 'missing the structure'},
+        ]}
+        return recipe_generator.parse_multi_copy(
+            recipe_generator.json.dumps(reply), {item[0] for item in items}, copy_format
+        )
+
+    singles = []
+
+    def fake_single(asset, layout, copy_format, brand, **kwargs):
+        singles.append(copy_format['Name'])
+        return 'single copy'
+
+    monkeypatch.setattr(recipe_generator, 'generate_multi_copy', fake_multi)
+    monkeypatch.setattr(recipe_generator, 'generate_recipe_copy', fake_single)
+    metrics = recipe_generator.RunMetrics()
+    recipe_generator.fill_multi_copy(output, deferred, 3, metrics=metrics)
+
+    copy_col = recipe_generator.RECIPE_HEADER.index('Copy')
+    assert multi_calls == [('A', ['BR-P001', 'BR-P003', 'BR-P004'])]
+    assert [row[copy_col] for row in output[1:]] == [
+        'Headline: Hi\nBody: There', 'single copy', 'single copy', 'single copy'
+    ]
+    assert sorted(singles) == ['A', 'A', 'B']
+    assert metrics.counters == {'multi_copy_requests': 1, 'copy_fallbacks': 2}
+
+
+def test_generate_recipes_resume_appends_chunks_and_continues(monkeypatch, tmp_path):
+    sheet_ids = ['BR-P001', 'BR-P002', 'XX-P009']
+    appended = []
+    fail_at = {'start': 5}
+
+    def fake_build_recipe_rows(drive, folder_id, brand_code, brand, layouts_df, copy_df,
+                               tagged_assets, num_recipes=10, *, start=1, **kwargs):
+        if start == fail_at['start']:
+            raise RuntimeError('copy failed')
+        return [['Ad id']] + [[f'{brand_code}-P{n:03d}'] for n in range(start, start + num_recipes)]
+
+    def fake_append(service, sid, rows, tab='recipes'):
+        appended.append([row[0] for row in rows])
+        sheet_ids.extend(row[0] for row in rows)
+
+    monkeypatch.setattr(recipe_generator, 'load_table', lambda service, path, sid, name: name)
+    monkeypatch.setattr(recipe_generator, 'build_recipe_rows', fake_build_recipe_rows)
+    monkeypatch.setattr(recipe_generator, 'get_brand_profile', lambda df, code: {'Brand Code': code})
+    monkeypatch.setattr(recipe_generator, 'get_google_service', lambda info: (object(), object()))
+    monkeypatch.setattr(
+        recipe_generator, 'load_tagged_assets', lambda service, sid, *a: (sid, [])
+    )
+    monkeypatch.setattr(
+        recipe_generator, 'read_recipe_ids', lambda service, sid, tab, path: (True, list(sheet_ids))
+    )
+    monkeypatch.setattr(recipe_generator, 'append_recipes', fake_append)
+    progress_path = str(tmp_path / 'progress.json')
+
+    def run():
+        return recipe_generator.generate_recipes(
+            'SHEET', {}, 'FOLDER', 'BR', 'BRANDS', 5,
+            resume=True, chunk_size=2, progress_path=progress_path,
+        )
+
+    try:
+        run()
+    except RuntimeError:
+        pass
+    assert appended == [['BR-P003', 'BR-P004']]
+    assert recipe_generator.load_progress(progress_path)['target'] == 7
+
+    fail_at['start'] = None
+    output = run()
+    assert [row[0] for row in output[1:]] == ['BR-P005', 'BR-P006', 'BR-P007']
+    assert appended[1:] == [['BR-P005', 'BR-P006'], ['BR-P007']]
+    assert recipe_generator.load_progress(progress_path) is None
+
+
+def test_generate_recipes_batch_loads_distinct_asset_sources_in_parallel(monkeypatch):
+    import threading
+
+    # Both distinct sources must be loading at the same time to pass the barrier.
+    barrier = threading.Barrier(2, timeout=5)
+    loads = []
+
+    def fake_load_tagged_assets(service, sid, path=None, index=None, refresh=False):
+        loads.append(sid)
+        barrier.wait()
+        return sid, []
+
+    monkeypatch.setattr(recipe_generator, 'load_table', lambda service, path, sid, name: name)
+    monkeypatch.setattr(recipe_generator, 'load_tagged_assets', fake_load_tagged_assets)
+    monkeypatch.setattr(
+        recipe_generator, 'build_recipe_rows',
+        lambda drive, folder, code, *a, **k: [['Ad id'], [f'{code}-P001']],
+    )
+    monkeypatch.setattr(recipe_generator, 'get_brand_profile', lambda df, code: {})
+    monkeypatch.setattr(recipe_generator, 'get_google_service', lambda info: (object(), object()))
+    monkeypatch.setattr(recipe_generator, 'write_recipes', lambda *a, **k: None)
+
+    results = recipe_generator.generate_recipes_batch(
+        {},
+        'BRANDS',
+        [
+            {'brand_code': 'AA', 'sheet_id': 'S1'},
+            {'brand_code': 'BB', 'sheet_id': 'S2'},
+            {'brand_code': 'CC', 'sheet_id': 'S1'},
+        ],
+        folder_id='FOLDER',
+        max_workers=3,
+    )
+
+    assert all(isinstance(rows, list) for rows in results.values())
+    assert sorted(loads) == ['S1', 'S2']
+
+
+def test_get_asset_link_error_replays_from_cassette(tmp_path):
+    import cassette
+
+    class FailingDrive:
+        def files(self):
+            return self
+
+        def list(self, **kwargs):
+            return self
+
+        def execute(self):
+            raise recipe_generator.HttpError('forbidden')
+
+    class UnusedDrive:
+        def files(self):
+            raise AssertionError('Drive called during replay')
+
+    path = str(tmp_path / 'run.jsonl')
+    try:
+        cassette.use_cassette(path, 'record')
+        assert recipe_generator.get_asset_link(FailingDrive(), 'a.png', 'F') == 'ERROR LINKING FILE'
+        cassette.stop_cassette()
+        cassette.use_cassette(path, 'replay')
+        assert recipe_generator.get_asset_link(UnusedDrive(), 'a.png', 'F') == 'ERROR LINKING FILE'
+    finally:
+        cassette.stop_cassette()
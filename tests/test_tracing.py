@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+
+import tracing
+from tracing import SamplingProfiler, span, start_tracing, stop_tracing
+
+
+def test_spans_only_recorded_while_tracing(tmp_path):
+    with span('list_images'):
+        pass
+    tracer = start_tracing()
+
+    def work():
+        with span('vision', features='label'):
+            pass
+
+    thread = threading.Thread(target=work, name='worker-1')
+    thread.start()
+    thread.join()
+    with span('write_sheet', rows=3):
+        pass
+    path = tmp_path / 'trace.json'
+    assert stop_tracing(str(path)) is tracer
+    assert tracing.tracer is None
+
+    trace = json.loads(path.read_text())
+    spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert [e['name'] for e in spans] == ['vision', 'write_sheet']
+    assert spans[0]['args'] == {'features': 'label'}
+    assert spans[0]['tid'] != spans[1]['tid']
+    names = {e['args']['name'] for e in trace['traceEvents'] if e['ph'] == 'M'}
+    assert 'worker-1' in names
+
+
+def busy_wait(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def test_profiler_writes_folded_stacks(tmp_path):
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_wait, args=(stop,), name='busy')
+    thread.start()
+    profiler = SamplingProfiler(interval=0.001).start()
+    time.sleep(0.05)
+    profiler.stop()
+    stop.set()
+    thread.join()
+
+    path = tmp_path / 'profile.folded'
+    profiler.write_folded(str(path))
+    lines = path.read_text().splitlines()
+    busy = [line for line in lines if line.startswith('busy;')]
+    assert busy and 'busy_wait (test_tracing.py' in busy[0]
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
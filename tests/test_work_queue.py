@@ -0,0 +1,52 @@
+from work_queue import WorkQueue, open_queue
+
+
+def test_lease_complete_and_ordered_results(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'q.db'))
+    assert queue.create_run('run', [{'id': 'a'}, {'id': 'b'}], {'x': 1}) == 2
+    # Re-enqueueing the same run does not duplicate tasks
+    assert queue.create_run('run', [{'id': 'a'}, {'id': 'b'}]) == 0
+    assert queue.run_params('run') == {'x': 1}
+
+    first = queue.lease('run', 'w1')
+    second = queue.lease('run', 'w2')
+    assert first['payload'] == {'id': 'a'}
+    assert second['payload'] == {'id': 'b'}
+    assert queue.lease('run', 'w3') is None
+
+    queue.complete('run', second, ['b'])
+    queue.complete('run', first, ['a'])
+    assert queue.is_finished('run')
+    assert queue.results('run') == [['a'], ['b']]
+    assert queue.mark_merged('run') is True
+    assert queue.mark_merged('run') is False
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'q.db'), lease_seconds=-1)
+    queue.create_run('run', [{'id': 'a'}])
+    crashed = queue.lease('run', 'crashed')
+    retry = queue.lease('run', 'other')
+    assert retry['payload'] == crashed['payload']
+    assert retry['attempts'] == 2
+
+
+def test_expired_lease_fails_after_max_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'q.db'), lease_seconds=-1, max_attempts=3)
+    queue.create_run('run', [{'id': 'a'}])
+    for _ in range(3):
+        assert queue.lease('run', 'crashing') is not None
+    assert queue.lease('run', 'next') is None
+    assert queue.is_finished('run')
+    assert queue.failures('run') == [({'id': 'a'}, 'lease expired on every attempt')]
+
+
+def test_failures_retry_then_give_up(tmp_path):
+    queue = open_queue(f"sqlite:///{tmp_path / 'q.db'}", max_attempts=2)
+    queue.create_run('run', [{'name': 'a'}])
+    queue.fail('run', queue.lease('run', 'w'), 'boom')
+    assert queue.counts('run')['pending'] == 1
+    queue.fail('run', queue.lease('run', 'w'), 'boom again')
+    assert queue.is_finished('run')
+    assert queue.failures('run') == [({'name': 'a'}, 'boom again')]
+    assert queue.results('run') == []
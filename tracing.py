@@ -0,0 +1,155 @@
+"""Lightweight tracing spans and a sampling profiler.
+
+:func:`span` marks a block of work (a Drive listing, a Vision call, a sheet
+write, ...). Spans are only kept while tracing is on (see
+:func:`start_tracing`), so they cost next to nothing otherwise. The
+collected spans export as Chrome trace JSON, which Perfetto
+(https://ui.perfetto.dev) and ``chrome://tracing`` show as one timeline
+row per thread, making the critical path of concurrent runs visible.
+
+:class:`SamplingProfiler` periodically samples every thread's Python stack
+and writes the counts as folded stacks, the input format of
+``flamegraph.pl`` and speedscope.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+class Tracer:
+    """Thread-safe collection of completed spans."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        thread = threading.current_thread()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append((name, start - self.origin, end - start, thread.ident, thread.name, args))
+
+    def chrome_trace(self):
+        """Return the spans as a Chrome trace event dict."""
+
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        threads = {}
+        for name, start, duration, tid, thread_name, args in spans:
+            threads[tid] = thread_name
+            events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': duration * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': {k: str(v) for k, v in args.items()},
+            })
+        for tid, thread_name in threads.items():
+            events.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': pid,
+                'tid': tid,
+                'args': {'name': thread_name},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(self.chrome_trace(), fh)
+
+
+# The tracer receiving spans; None while tracing is off.
+tracer = None
+
+
+def start_tracing():
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def stop_tracing(path=None):
+    """Stop tracing, writing the Chrome trace to ``path`` if given."""
+
+    global tracer
+    finished, tracer = tracer, None
+    if finished is not None and path:
+        finished.write_chrome_trace(path)
+    return finished
+
+
+def span(name, **args):
+    """Context manager recording ``name`` on the active tracer, if any."""
+
+    active = tracer
+    if active is None:
+        return nullcontext()
+    return active.span(name, **args)
+
+
+class SamplingProfiler:
+    """Sample all threads' stacks every ``interval`` seconds.
+
+    Samples are wall-clock: threads blocked on network I/O show up in the
+    frames they are waiting in, which is usually what matters for this
+    pipeline.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(tid, str(tid)))
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self):
+        """Return the samples as folded-stack lines (``frame;frame count``)."""
+
+        return [f"{stack} {count}" for stack, count in self.samples.most_common()]
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(self.folded()) + '\n')
@@ -0,0 +1,260 @@
+"""Durable task queue for splitting tagging runs across processes and machines.
+
+A coordinator enqueues one task per Drive file under a ``run_id``. Workers
+lease tasks, process them and record a result row. Leases expire so tasks
+held by a crashed worker are picked up again, and results are read back in
+the original file order for the final merge into the sheet.
+
+SQLite is the default backend. Other backends can be registered in
+``QUEUE_BACKENDS`` under a URL scheme and must provide the same methods as
+:class:`WorkQueue`.
+"""
+
+import json
+import sqlite3
+import time
+import uuid
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    merged_at REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (run_id, status, lease_expires);
+"""
+
+
+class WorkQueue:
+    """SQLite-backed task table.
+
+    Parameters
+    ----------
+    path : str
+        Database file. Every process taking part in a run must open the same
+        file (for multiple machines, a shared filesystem).
+    lease_seconds : float, optional
+        How long a leased task stays reserved before another worker may take
+        it over. Defaults to 300 seconds.
+    max_attempts : int, optional
+        Failed tasks are retried until they have been attempted this many
+        times. Defaults to 3.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so two workers can
+        # never select the same task before either has marked it leased.
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def create_run(self, run_id, payloads, params=None):
+        """Register a run and enqueue one task per payload.
+
+        Re-running with the same ``run_id`` is a no-op for tasks that already
+        exist, so a restarted coordinator does not duplicate work.
+
+        Returns
+        -------
+        int
+            Number of newly enqueued tasks.
+        """
+
+        self._transaction()
+        try:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, params, created_at) VALUES (?, ?, ?)",
+                (run_id, json.dumps(params or {}), time.time()),
+            )
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (run_id, position, payload) VALUES (?, ?, ?)",
+                [(run_id, i, json.dumps(p)) for i, p in enumerate(payloads)],
+            )
+            added = self._conn.total_changes - before
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def run_params(self, run_id):
+        row = self._conn.execute("SELECT params FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown run {run_id!r}")
+        return json.loads(row[0])
+
+    def lease(self, run_id, worker_id=None):
+        """Reserve the next available task.
+
+        Expired leases are taken over, unless the task has already been
+        attempted ``max_attempts`` times; it is then marked failed.
+
+        Returns
+        -------
+        dict | None
+            ``{"position", "payload", "attempts", "worker_id"}`` or ``None``
+            when nothing is currently leasable.
+        """
+
+        worker_id = worker_id or uuid.uuid4().hex
+        now = time.time()
+        self._transaction()
+        try:
+            # A task whose lease keeps expiring is crashing its workers; stop
+            # handing it out once it has used up its attempts.
+            self._conn.execute(
+                """
+                UPDATE tasks SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE run_id = ? AND status = ? AND lease_expires < ? AND attempts >= ?
+                """,
+                (FAILED, "lease expired on every attempt", run_id, LEASED, now, self.max_attempts),
+            )
+            row = self._conn.execute(
+                """
+                SELECT position, payload, attempts FROM tasks
+                WHERE run_id = ?
+                  AND (status = ? OR (status = ? AND lease_expires < ?))
+                ORDER BY position LIMIT 1
+                """,
+                (run_id, PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            position, payload, attempts = row
+            self._conn.execute(
+                """
+                UPDATE tasks SET status = ?, lease_owner = ?, lease_expires = ?, attempts = ?
+                WHERE run_id = ? AND position = ?
+                """,
+                (LEASED, worker_id, now + self.lease_seconds, attempts + 1, run_id, position),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return {
+            "position": position,
+            "payload": json.loads(payload),
+            "attempts": attempts + 1,
+            "worker_id": worker_id,
+        }
+
+    def complete(self, run_id, task, result):
+        """Store ``result`` for a leased task.
+
+        Results from a worker whose lease was taken over are still accepted;
+        tagging is idempotent so whichever finishes first wins.
+        """
+
+        self._conn.execute(
+            """
+            UPDATE tasks SET status = ?, result = ?, error = NULL, lease_expires = NULL
+            WHERE run_id = ? AND position = ? AND status != ?
+            """,
+            (DONE, json.dumps(result), run_id, task["position"], DONE),
+        )
+
+    def fail(self, run_id, task, error):
+        """Release a task after an error, giving up after ``max_attempts``."""
+
+        status = FAILED if task["attempts"] >= self.max_attempts else PENDING
+        self._conn.execute(
+            """
+            UPDATE tasks SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL
+            WHERE run_id = ? AND position = ? AND lease_owner = ? AND status = ?
+            """,
+            (status, str(error), run_id, task["position"], task["worker_id"], LEASED),
+        )
+
+    def counts(self, run_id):
+        """Return the number of tasks in each status."""
+
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for status, n in self._conn.execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY status", (run_id,)
+        ):
+            counts[status] = n
+        return counts
+
+    def is_finished(self, run_id):
+        counts = self.counts(run_id)
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def results(self, run_id):
+        """Return completed results in enqueue order."""
+
+        return [
+            json.loads(r[0])
+            for r in self._conn.execute(
+                "SELECT result FROM tasks WHERE run_id = ? AND status = ? ORDER BY position",
+                (run_id, DONE),
+            )
+        ]
+
+    def failures(self, run_id):
+        """Return ``(payload, error)`` pairs for tasks that exhausted their attempts."""
+
+        return [
+            (json.loads(p), e)
+            for p, e in self._conn.execute(
+                "SELECT payload, error FROM tasks WHERE run_id = ? AND status = ? ORDER BY position",
+                (run_id, FAILED),
+            )
+        ]
+
+    def mark_merged(self, run_id):
+        """Flag the run as merged. Returns ``False`` if it already was."""
+
+        cur = self._conn.execute(
+            "UPDATE runs SET merged_at = ? WHERE run_id = ? AND merged_at IS NULL",
+            (time.time(), run_id),
+        )
+        return cur.rowcount == 1
+
+
+QUEUE_BACKENDS = {"sqlite": WorkQueue}
+
+
+def open_queue(url, **kwargs):
+    """Open a work queue from a ``scheme://location`` URL or a plain path.
+
+    Plain paths and ``sqlite:///path`` open a :class:`WorkQueue`.
+    """
+
+    scheme, sep, location = url.partition("://")
+    if not sep:
+        scheme, location = "sqlite", url
+    elif scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute/path.db
+        location = location[1:] if location.startswith("/") else location
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"Unsupported queue backend: {scheme}")
+    return QUEUE_BACKENDS[scheme](location, **kwargs)